@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Compare validated and unvalidated answers and their JSON serialisation.
+
+Builds a findkey answer with many values and a MultiAnswer with a GeoJSON
+feature per value, as answering a broad MRL produces, once with validation
+and once with construct(). Then serialises a ProcessingResult holding the
+answer by copying it with .dict() first, as before, with dump_result, and
+chunk by chunk with iter_json.
+
+Run from the repository root: python -m benchmarks.answer_serialization
+"""
+import argparse
+import json
+import time
+
+from nlmaps_tools.answer_overpass import ListAnswer, MultiAnswer
+from nlmaps_tools.process.models import ProcessingResult, SingleProcessorResult
+from nlmaps_tools.process.serialization import dump_result, iter_json, json_default
+
+
+def make_data(values):
+    names = [f"node {i}: Bäckerei {i}" for i in range(values)]
+    targets = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": i,
+                "geometry": {"type": "Point", "coordinates": [8.69, 49.41]},
+                "properties": {"name": f"Bäckerei {i}", "shop": "bakery"},
+            }
+            for i in range(values)
+        ],
+    }
+    return names, targets
+
+
+def build_validated(names, targets):
+    return MultiAnswer(answers=[ListAnswer(list=names)], targets=targets, centers=None)
+
+
+def build_constructed(names, targets):
+    return MultiAnswer.construct(
+        answers=[ListAnswer.construct(list=names)], targets=targets, centers=None
+    )
+
+
+def wrap(answer):
+    return ProcessingResult.construct(
+        results={
+            "Answer": SingleProcessorResult.construct(
+                result=answer, processor_name="answer", wallclock_seconds=0.0
+            )
+        },
+        wallclock_seconds=0.0,
+    )
+
+
+def dump_via_dict(result):
+    return json.dumps(result.dict(), default=json_default, ensure_ascii=False)
+
+
+def stream(result):
+    for _ in iter_json(result):
+        pass
+
+
+def seconds_per_call(func, *args, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(values, repeat):
+    names, targets = make_data(values)
+    result = wrap(build_constructed(names, targets))
+    print(f"{values} values")
+    print(f"{'step':30}  {'ms':>9}")
+    for label, func, args in [
+        ("build validated", build_validated, (names, targets)),
+        ("build with construct()", build_constructed, (names, targets)),
+        ("serialise via .dict()", dump_via_dict, (result,)),
+        ("serialise with dump_result", dump_result, (result,)),
+        ("serialise with iter_json", stream, (result,)),
+    ]:
+        print(f"{label:30}  {seconds_per_call(func, *args, repeat=repeat) * 1000:9.2f}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--values", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=10)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
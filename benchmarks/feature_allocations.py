@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Measure allocations of the feature transformations before the network call.
+
+Runs canonicalisation, area ID insertion and chain planning over the parsed
+test queries under tracemalloc, once as the pipeline does it now and once with
+the deepcopy the name lookup step used to make of every feature tree.
+
+Run from the repository root: python -m benchmarks.feature_allocations
+"""
+import argparse
+from copy import deepcopy
+import time
+import tracemalloc
+
+from nlmaps_tools.features_to_overpass import (
+    OSMArea,
+    add_area_id,
+    canonicalize_features,
+    plan_nwr_chains,
+)
+from tests.queries import QUERIES
+
+AREA = OSMArea(dct={"osm_type": "relation", "osm_id": 285864}, id=3600285864)
+
+
+def transform(features, copy):
+    features = canonicalize_features(features)
+    features = add_area_id(features, AREA)
+    if copy:
+        features = deepcopy(features)
+    return plan_nwr_chains(features)
+
+
+def measure(all_features, copy, repeat):
+    # Warm up caches such as the tag counts used for planning.
+    for features in all_features:
+        transform(features, copy)
+
+    tracemalloc.start()
+    kept = [transform(features, copy) for features in all_features]
+    retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for features in all_features:
+            transform(features, copy)
+    seconds = time.perf_counter() - start
+    return retained_bytes, peak_bytes, seconds / (repeat * len(all_features))
+
+
+def main(repeat):
+    all_features = [
+        query["features"]
+        for query in QUERIES
+        if query["features"]["query_type"] != "dist"
+    ]
+    for name, copy in [("current", False), ("with deepcopy", True)]:
+        retained_bytes, peak_bytes, seconds = measure(all_features, copy, repeat)
+        print(
+            f"{name:>14}: {retained_bytes / len(all_features):6.0f} bytes retained"
+            f" and {peak_bytes / len(all_features):6.0f} bytes peak per query,"
+            f" {seconds * 1e6:5.1f} µs per query"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Measure the cold-start latency of the process CLI and of common imports.
+
+Every command runs in a fresh interpreter several times and the median
+wallclock time is reported. With --max-seconds the script exits with a
+non-zero status if any median exceeds the limit, so it can guard against
+regressions in CI.
+
+Run from the repository root: python -m benchmarks.import_time
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+LIN = "query@3 area@1 keyval@2 name@0 Heidelberg@s nwr@1 keyval@2 drink:absinthe@0 yes@s qtype@1 latlong@0"
+
+COMMANDS = {
+    "python -c pass": [sys.executable, "-c", "pass"],
+    "import nlmaps_tools.parse_mrl": [
+        sys.executable,
+        "-c",
+        "import nlmaps_tools.parse_mrl",
+    ],
+    "import nlmaps_tools.process.processors": [
+        sys.executable,
+        "-c",
+        "import nlmaps_tools.process.processors",
+    ],
+    "python -m nlmaps_tools.process (Will2021Lin -> Will2021MRL)": [
+        sys.executable,
+        "-m",
+        "nlmaps_tools.process",
+        "--given",
+        f"Will2021Lin={LIN}",
+        "--wanted",
+        "Will2021MRL",
+    ],
+}
+
+
+def median_seconds(command, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def main(repeat, max_seconds):
+    exceeded = []
+    for name, command in COMMANDS.items():
+        seconds = median_seconds(command, repeat)
+        print(f"{seconds * 1000:8.1f} ms  {name}")
+        if max_seconds is not None and seconds > max_seconds:
+            exceeded.append(name)
+    if exceeded:
+        print(f"Exceeded {max_seconds} s: {exceeded}", file=sys.stderr)
+        sys.exit(1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Fail if the median of any command exceeds this many seconds",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Measure processor chain planning time on synthetic processor graphs.
+
+The graphs have layers of targets, where every target of a layer is produced
+by several processors taking one to three targets of the previous layer, and
+the request wants the last layer from the first one. Planning is timed
+without the chain cache. The exhaustive planner is only run on graphs small
+enough for it to finish.
+
+Run from the repository root: python -m benchmarks.planner
+"""
+import argparse
+import random
+import time
+
+from nlmaps_tools.process import ProcessingRequest, ProcessingTool
+from nlmaps_tools.process.processors import BuiltinProcessor
+
+
+class SyntheticProcessor(BuiltinProcessor):
+    def __call__(self, given):
+        return self.name
+
+
+def make_processors(layers, width, alternatives, rng):
+    processors = set()
+    for layer in range(1, layers):
+        previous = [f"T{layer - 1}.{i}" for i in range(width)]
+        for i in range(width):
+            target = f"T{layer}.{i}"
+            for alternative in range(alternatives):
+                sources = rng.sample(previous, rng.randint(1, min(3, width)))
+                processor = SyntheticProcessor(
+                    sources, target, name=f"{target}#{alternative}"
+                )
+                processor.cost = rng.uniform(0.001, 1.0)
+                processors.add(processor)
+    return processors
+
+
+def seconds_per_plan(tool, request, seconds):
+    plans = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        tool._plan_processor_chain(request)
+        plans += 1
+    return (time.perf_counter() - start) / plans
+
+
+def main(seconds, seed):
+    rng = random.Random(seed)
+    print("processors  best-first ms  exhaustive ms")
+    for layers, width, alternatives, exhaustive in [
+        (3, 2, 2, True),
+        (4, 3, 2, True),
+        (5, 4, 3, False),
+        (10, 10, 2, False),
+        (10, 20, 3, False),
+        (20, 20, 2, False),
+        (20, 40, 2, False),
+    ]:
+        processors = make_processors(layers, width, alternatives, rng)
+        request = ProcessingRequest(
+            given={f"T0.{i}": "" for i in range(width)},
+            wanted={f"T{layers - 1}.{i}" for i in range(width)},
+            processors=set(),
+        )
+        best_first_tool = ProcessingTool(processors)
+        best_first = seconds_per_plan(best_first_tool, request, seconds)
+        if exhaustive:
+            exhaustive_tool = ProcessingTool(processors, planner="exhaustive")
+            exhaustive_ms = (
+                f"{seconds_per_plan(exhaustive_tool, request, seconds) * 1000:13.3f}"
+            )
+        else:
+            exhaustive_ms = f"{'-':>13}"
+        print(f"{len(processors):10d}  {best_first * 1000:13.3f}  {exhaustive_ms}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
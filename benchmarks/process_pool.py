@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Measure how parse-only requests scale with worker processes.
+
+Sends bursts of requests turning linearised MRLs into features from many
+threads at once, as a web tier does, to ProcessingTools with an increasing
+number of worker processes for the CPU-bound processors. 0 processes runs
+them in threads, where the GIL lets only one parse run at a time. The memo is
+disabled and all MRLs are distinct, so that every request is parsed. Scaling
+is limited by the number of cores, which is printed too.
+
+Run from the repository root: python -m benchmarks.process_pool
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from nlmaps_tools.mrl import NLmaps
+from nlmaps_tools.process import ProcessingRequest, ProcessingTool
+from nlmaps_tools.process.processors import PROCESSORS
+from tests.queries import QUERIES
+
+
+def make_requests(lins):
+    return [
+        ProcessingRequest(
+            given={"Will2021Lin": lin}, wanted={"Will2021Features"}, processors=set()
+        )
+        for lin in lins
+    ]
+
+
+def requests_per_second(processing_tool, lins, clients):
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        # Start the workers and build their grammars.
+        list(
+            executor.map(processing_tool.process_request, make_requests(lins[:clients]))
+        )
+        requests = make_requests(lins)
+        start = time.perf_counter()
+        list(executor.map(processing_tool.process_request, requests))
+        return len(requests) / (time.perf_counter() - start)
+
+
+def main(requests, clients, max_processes):
+    nlmaps = NLmaps()
+    lins = [nlmaps.preprocess_mrl(query["mrl"]) for query in QUERIES]
+    # Make repeated MRLs differ from the original ones.
+    lins = [
+        lin if i < len(lins) else lin.replace("@s", f"€{i}@s", 1)
+        for i, lin in enumerate((lins * (requests // len(lins) + 1))[:requests])
+    ]
+
+    cores = os.cpu_count()
+    max_processes = max_processes or cores
+    print(f"{cores} cores, {requests} requests from {clients} threads")
+    print("processes  requests/s  speedup")
+    baseline = None
+    for processes in range(0, max_processes + 1):
+        processing_tool = ProcessingTool(
+            PROCESSORS, memo_size=0, cpu_processes=processes
+        )
+        try:
+            rate = requests_per_second(processing_tool, lins, clients)
+        finally:
+            processing_tool.close()
+        baseline = baseline or rate
+        print(f"{processes:9d}  {rate:10.0f}  {rate / baseline:6.2f}x")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument(
+        "--max-processes",
+        type=int,
+        default=None,
+        help="Default: the number of cores",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Measure requests per second of process_requests against process_request.
+
+Turns the linearised MRLs of the test queries into features, the way an
+evaluation run does, once with one process_request call per request and
+once with a single process_requests call. The MRLs are repeated as they are
+in evaluation sets, where many questions share an MRL.
+
+Run from the repository root: python -m benchmarks.process_requests
+"""
+import argparse
+import time
+
+from nlmaps_tools.mrl import NLmaps
+from nlmaps_tools.process import ProcessingRequest, ProcessingTool
+from nlmaps_tools.process.processors import PROCESSORS
+from tests.queries import QUERIES
+
+
+def make_requests(lins, n):
+    return [
+        ProcessingRequest(
+            given={"Will2021Lin": lins[i % len(lins)]},
+            wanted={"Will2021Features"},
+            processors=set(),
+        )
+        for i in range(n)
+    ]
+
+
+def main(requests, repeats):
+    nlmaps = NLmaps()
+    lins = [nlmaps.preprocess_mrl(query["mrl"]) for query in QUERIES]
+    distinct = max(requests // repeats, 1)
+    lins = (lins * (distinct // len(lins) + 1))[:distinct]
+    # Make repeated MRLs differ from the original ones, so that the number
+    # of distinct MRLs is as requested.
+    lins = [
+        lin if i < len(QUERIES) else lin.replace("@s", f"€{i}@s", 1)
+        for i, lin in enumerate(lins)
+    ]
+
+    tool = ProcessingTool(PROCESSORS)
+    # Build the grammar and learn the costs before measuring.
+    tool.process_requests(make_requests(lins, len(lins)))
+
+    loop_requests = make_requests(lins, requests)
+    start = time.perf_counter()
+    for request in loop_requests:
+        tool.process_request(request)
+    loop_seconds = time.perf_counter() - start
+
+    batch_requests = make_requests(lins, requests)
+    start = time.perf_counter()
+    results = tool.process_requests(batch_requests)
+    batch_seconds = time.perf_counter() - start
+    errors = sum(result.error is not None for result in results)
+
+    print(
+        f"{requests} requests, {len(lins)} distinct MRLs, {errors} errors:"
+        f" {requests / loop_seconds:.0f} requests/s with process_request,"
+        f" {requests / batch_seconds:.0f} requests/s with process_requests"
+        f" ({loop_seconds / batch_seconds:.2f}x)"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument(
+        "--repeats", type=int, default=4, help="Average occurrences of every MRL"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
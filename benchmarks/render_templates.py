@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Measure Overpass and MRL template renders per second.
+
+Compares environments loading the template sources the way the package used
+to (PackageLoader with auto reloading) with environments loading precompiled
+templates, and checks that both render identical output.
+
+Run from the repository root: python -m benchmarks.render_templates
+"""
+import argparse
+import tempfile
+import time
+
+import jinja2
+
+from nlmaps_tools.answer_mrl import make_overpass_environment
+from nlmaps_tools.features_to_overpass import canonicalize_features
+from nlmaps_tools.generate_mrl import make_mrl_environment
+from nlmaps_tools.templates import compile_environment, make_environment
+from tests.queries import QUERIES
+
+
+def make_reloading_environment(env, template_dir):
+    reloading_env = jinja2.Environment(
+        loader=jinja2.PackageLoader("nlmaps_tools", template_dir),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        autoescape=False,
+    )
+    reloading_env.filters.update(env.filters)
+    reloading_env.globals.update(env.globals)
+    return reloading_env
+
+
+def make_compiled_environment(env, template_dir, compiled_dir):
+    compile_environment(env, template_dir, compiled_dir)
+    compiled_env = make_environment(template_dir, compiled_dir=compiled_dir)
+    compiled_env.filters.update(env.filters)
+    compiled_env.globals.update(env.globals)
+    return compiled_env
+
+
+def renders_per_second(env, jobs, seconds):
+    renders = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for template_name, kwargs in jobs:
+            env.get_template(template_name).render(**kwargs)
+        renders += len(jobs)
+    return renders / (time.perf_counter() - start)
+
+
+def get_jobs():
+    mrl_jobs = []
+    overpass_jobs = []
+    for query in QUERIES:
+        features = query["features"]
+        template_name = features["query_type"] + ".jinja2"
+        mrl_jobs.append((template_name, {"features": features, "escape": True}))
+        if features["query_type"] != "dist" and "'and'" not in repr(features):
+            overpass_jobs.append(
+                (template_name, {"features": canonicalize_features(features)})
+            )
+    return mrl_jobs, overpass_jobs
+
+
+def main(seconds):
+    mrl_jobs, overpass_jobs = get_jobs()
+    with tempfile.TemporaryDirectory() as compiled_dir:
+        for name, env, template_dir, jobs in [
+            (
+                "Overpass",
+                make_overpass_environment(False),
+                "overpass_templates",
+                overpass_jobs,
+            ),
+            ("MRL", make_mrl_environment(False), "mrl_templates", mrl_jobs),
+        ]:
+            reloading_env = make_reloading_environment(env, template_dir)
+            compiled_env = make_compiled_environment(env, template_dir, compiled_dir)
+            for template_name, kwargs in jobs:
+                expected = reloading_env.get_template(template_name).render(**kwargs)
+                actual = compiled_env.get_template(template_name).render(**kwargs)
+                assert actual == expected, f"Output differs for {template_name}"
+
+            before = renders_per_second(reloading_env, jobs, seconds)
+            after = renders_per_second(compiled_env, jobs, seconds)
+            print(
+                f"{name}: {before:.0f} renders/s from source,"
+                f" {after:.0f} renders/s precompiled ({after / before:.2f}x)"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Load test the processing HTTP service against stub Nominatim and Overpass.
+
+Starts local stub servers that answer every Nominatim search with an area and
+every Overpass query with a fixed set of elements after --service-seconds,
+disables the OSMPythonTools cache and starts the service of
+nlmaps_tools.process.serve on them. Then --clients threads, each on a
+persistent connection, post requests turning the linearised MRLs of the test
+queries into answers as fast as they get results. Queries the stubs cannot
+answer are left out. Prints the throughput, the latency percentiles of
+successful requests and the number of responses by status, 503 being shed
+requests.
+
+Run from the repository root: python -m benchmarks.serve_load
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http.client
+import itertools
+import json
+import logging
+import threading
+import time
+
+from OSMPythonTools.cachingStrategy import CachingStrategy
+from OSMPythonTools.cachingStrategy.base import CachingStrategyBase
+
+from nlmaps_tools.answer_batch import percentile
+from nlmaps_tools.answer_mrl import get_nominatim, get_overpass
+from nlmaps_tools.http_transport import HttpTransport
+from nlmaps_tools.mrl import NLmaps
+from nlmaps_tools.osm_clients import PooledNominatim
+from nlmaps_tools.overpass_round_robin import OverpassRoundRobin
+from nlmaps_tools.process import ProcessingTool
+from nlmaps_tools.process.processors import PROCESSORS
+from nlmaps_tools.process.serve import serve_in_thread
+from tests.queries import QUERIES
+
+AREA = {
+    "osm_type": "relation",
+    "osm_id": 285864,
+    "boundingbox": ["49.35", "49.46", "8.57", "8.79"],
+    "lat": "49.4093582",
+    "lon": "8.694724",
+    "display_name": "Heidelberg, Baden-Württemberg, Deutschland",
+}
+ELEMENTS = [
+    {
+        "type": "node",
+        "id": i,
+        "lat": 49.4 + i / 1000,
+        "lon": 8.7,
+        "tags": {"name": f"Place {i}", "amenity": "cafe"},
+    }
+    for i in range(50)
+]
+
+
+class NoCaching(CachingStrategyBase):
+    def get(self, key):
+        return None
+
+    def set(self, key, data):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_stub_handler(service_seconds):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # The headers and the body are sent separately, which Nagle's
+        # algorithm would delay.
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            if self.path.endswith("/status"):
+                self.respond("Connected as: 1\nRate limit: 0\n", "text/plain")
+            else:
+                # Nominatim search
+                time.sleep(service_seconds)
+                self.respond(json.dumps([AREA]), "application/json")
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(service_seconds)
+            self.respond(json.dumps({"elements": ELEMENTS}), "application/json")
+
+        def respond(self, body, content_type):
+            body = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub(service_seconds):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_stub_handler(service_seconds))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+
+def run_client(address, bodies, next_index, results):
+    connection = http.client.HTTPConnection(*address, timeout=60)
+    while True:
+        try:
+            body = bodies[next(next_index)]
+        except IndexError:
+            break
+        start = time.perf_counter()
+        connection.request("POST", "/process", body=body)
+        response = connection.getresponse()
+        response.read()
+        results.append((response.status, time.perf_counter() - start))
+    connection.close()
+
+
+def main(requests, clients, queue_size, concurrency, service_seconds):
+    # Keep the download warnings and tracebacks of unanswerable queries quiet.
+    logging.disable(logging.CRITICAL)
+    nominatim_stub, nominatim_url = start_stub(service_seconds)
+    overpass_stub, overpass_url = start_stub(service_seconds)
+    CachingStrategy.use(NoCaching)
+    get_nominatim.replace(
+        PooledNominatim(
+            endpoint=nominatim_url,
+            userAgent="benchmark",
+            transport=HttpTransport(pool_size=concurrency),
+        )
+    )
+    get_overpass.replace(
+        OverpassRoundRobin(
+            endpoints=[overpass_url + "api/"],
+            pool_size=concurrency,
+            userAgent="benchmark",
+        )
+    )
+
+    nlmaps = NLmaps()
+    bodies = [
+        json.dumps(
+            {
+                "given": {"Will2021Lin": nlmaps.preprocess_mrl(query["mrl"])},
+                "wanted": ["Will2021MultiAnswer"],
+            }
+        )
+        for query in QUERIES
+    ]
+
+    processing_tool = ProcessingTool(PROCESSORS)
+    server = serve_in_thread(
+        processing_tool, queue_size=queue_size, concurrency=concurrency
+    )
+    # Warm up the grammar and the learned costs, and find the answerable
+    # queries.
+    warm_up = []
+    run_client(server.address, bodies, itertools.count(), warm_up)
+    bodies = [body for body, (status, _) in zip(bodies, warm_up) if status == 200]
+    bodies = list(itertools.islice(itertools.cycle(bodies), requests))
+
+    results = []
+    next_index = itertools.count()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for _ in range(clients):
+            executor.submit(run_client, server.address, bodies, next_index, results)
+    seconds = time.perf_counter() - start
+
+    server.shutdown()
+    processing_tool.close()
+    nominatim_stub.shutdown()
+    overpass_stub.shutdown()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies = sorted(latency for status, latency in results if status == 200)
+    latency_ms = ", ".join(
+        f"p{q} {percentile(latencies, q) * 1000:.0f} ms" for q in (50, 95, 99)
+    )
+    print(
+        f"{len(results)} requests from {clients} clients in {seconds:.2f} s:"
+        f" {len(results) / seconds:.0f} requests/s, {latency_ms},"
+        f" responses by status {dict(sorted(statuses.items()))}"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--service-seconds",
+        type=float,
+        default=0.02,
+        help="Time the stub services take per request",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
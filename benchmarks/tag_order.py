@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Compare intermediate set sizes of nwr chains in MRL order and planned order.
+
+The Overpass stand-in is a synthetic area of elements in which every tag is
+carried by a random subset of elements whose size is proportional to the
+tag’s estimated count. A chain is evaluated like the nwr macro evaluates it:
+the first part materialises its full set, every subsequent part filters the
+previous result.
+
+Run from the repository root: python -m benchmarks.tag_order
+"""
+import argparse
+import random
+
+from nlmaps_tools.features_to_overpass import canonicalize_features
+from nlmaps_tools.parse_mrl import MrlGrammar
+from nlmaps_tools.tag_selectivity import (
+    estimate_nwr_feature_count,
+    load_tag_counts,
+    order_nwr_features_by_selectivity,
+)
+
+MRLS = [
+    "query(area(keyval('name','Heidelberg')),nwr(keyval('building','*'),keyval('name','Foo')),qtype(latlong))",
+    "query(area(keyval('name','Heidelberg')),nwr(keyval('amenity','restaurant'),keyval('cuisine',or('greek','italian'))),qtype(findkey('name')))",
+    "query(area(keyval('name','Heidelberg')),nwr(keyval('amenity','place_of_worship'),keyval('denomination','catholic')),qtype(latlong))",
+    "query(area(keyval('name','Edinburgh')),nwr(keyval('tourism','hotel'),keyval('stars','4')),qtype(findkey('name')))",
+    "query(area(keyval('name','berlin')),nwr(keyval('diet:vegan',or('only','yes')),keyval('shop','*'),keyval('wheelchair','yes')),qtype(latlong))",
+    "query(around(center(area(keyval('name','Heidelberg')),nwr(keyval('name','INF 325'))),search(nwr(keyval('shop','supermarket'),or(keyval('organic','only'),keyval('organic','yes')))),maxdist(5000)),qtype(latlong))",
+]
+
+
+class OverpassStandIn:
+    def __init__(self, n_elements, seed=0):
+        tag_counts, _, _ = load_tag_counts()
+        self.n_elements = n_elements
+        self.scale = n_elements / max(tag_counts.values())
+        self.random = random.Random(seed)
+        self.sets = {}
+
+    def _tag_set(self, key, value):
+        if (key, value) not in self.sets:
+            count = estimate_nwr_feature_count((key, value))
+            size = min(self.n_elements, max(1, round(count * self.scale)))
+            self.sets[(key, value)] = set(
+                self.random.sample(range(self.n_elements), size)
+            )
+        return self.sets[(key, value)]
+
+    def _part_set(self, feat):
+        if feat[0] in ["or", "and"] and isinstance(feat[1], (list, tuple)):
+            return set().union(*(self._part_set(f) for f in feat[1:]))
+        return self._tag_set(feat[0], str(feat[1]))
+
+    def intermediate_sizes(self, nwr_features):
+        sizes = []
+        current = None
+        for feat in nwr_features:
+            part = self._part_set(feat)
+            current = part if current is None else current & part
+            sizes.append(len(current))
+        return sizes
+
+
+def main(n_elements, seed):
+    grammar = MrlGrammar()
+    overpass = OverpassStandIn(n_elements, seed=seed)
+    total_original = total_planned = 0
+    for mrl in MRLS:
+        features = canonicalize_features(grammar.parseMrl(mrl)["features"])
+        original = features["target_nwr"]
+        planned = order_nwr_features_by_selectivity(original)
+        original_sizes = overpass.intermediate_sizes(original)
+        planned_sizes = overpass.intermediate_sizes(planned)
+        assert original_sizes[-1] == planned_sizes[-1]
+        total_original += sum(original_sizes)
+        total_planned += sum(planned_sizes)
+        print(mrl)
+        print(f"  MRL order:     {original_sizes}")
+        print(f"  planned order: {planned_sizes}")
+    print(
+        f"Materialised elements: {total_original} in MRL order,"
+        f" {total_planned} in planned order"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-elements", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -0,0 +1,515 @@
+"""Answer many MRLs from a JSONL file.
+
+Every input line is either a JSON string with an MRL or an object with an
+"mrl" or a "features" entry. Lines that are neither are answered with an
+error. Identical questions are answered only once, and Nominatim lookups
+shared between questions, like the area, are only sent once. Questions are
+answered like by the processing tool: areas and names are looked up in the
+gazetteer and POI index first, if there are any, and the answers are
+MultiAnswers.
+
+Answers are appended to the output file as soon as they are available, one
+line per input line. The output file doubles as checkpoint: when the batch is
+started again, input lines already answered in the output file are skipped.
+
+Questions about the same area are answered with a single combined Overpass
+query, up to combine_max at a time, and so are the two places of a dist
+question. The timeout of a combined query grows with the number of queries
+in it, and when it fails anyway, its questions are queried one by one, so
+that one question cannot fail the others. The seconds of an answer are those
+of its combined query.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import logging
+import math
+import threading
+import time
+
+from nlmaps_tools.answer_mrl import (
+    NOMINATIM_ERROR,
+    OVERPASS_ERROR,
+    OVERPASS_GATEWAY_TIMEOUT,
+    OVERPASS_HTTP_ERROR,
+    OVERPASS_TOO_MANY_REQUESTS,
+    AnsweringError,
+    get_nominatim,
+    get_overpass,
+    load_features,
+    overpass_error_message,
+)
+from nlmaps_tools.answer_overpass import (
+    extract_answer_from_overpass_results,
+    query_overpass,
+    split_combined_overpass_result,
+)
+from nlmaps_tools.deadline import DeadlineExceeded
+from nlmaps_tools.features_to_overpass import (
+    combined_overpass_timeout,
+    lookup_features,
+    render_combined_overpass_query,
+)
+from nlmaps_tools.metrics import count_cache_lookup
+from nlmaps_tools.parse_mrl import MrlGrammar, canonical_hash
+
+# Errors caused by the services rather than by the question.
+TRANSIENT_ERRORS = (
+    OVERPASS_TOO_MANY_REQUESTS,
+    OVERPASS_GATEWAY_TIMEOUT,
+    OVERPASS_HTTP_ERROR,
+    OVERPASS_ERROR,
+    NOMINATIM_ERROR,
+)
+
+
+class LimitedService:
+    """Wrap a Nominatim or Overpass client to limit concurrent queries.
+
+    With memoize=True, results are kept in memory and identical queries that
+    are sent while the first one is still running wait for its result instead
+    of being sent again.
+    """
+
+    def __init__(self, service, max_concurrent, memoize=False):
+        self.service = service
+        self.semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.memoize = memoize
+        self.lock = threading.Lock()
+        self.results = {}
+        self.queries = 0
+        self.hits = 0
+
+    def _query(self, *args, **kwargs):
+        with self.semaphore:
+            return self.service.query(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        if not self.memoize:
+            with self.lock:
+                self.queries += 1
+            return self._query(*args, **kwargs)
+
+        key = json.dumps([args, kwargs], sort_keys=True, default=str)
+        with self.lock:
+            self.queries += 1
+            event = self.results.get(key)
+            if event is None:
+                event = self.results[key] = _PendingResult()
+                owner = True
+            else:
+                self.hits += 1
+                owner = False
+        count_cache_lookup("batch_memo", not owner)
+        if owner:
+            try:
+                event.set_result(self._query(*args, **kwargs))
+            except BaseException as exc:
+                # Do not memoize failures, the next query may succeed.
+                with self.lock:
+                    del self.results[key]
+                event.set_exception(exc)
+        return event.get()
+
+
+class _PendingResult:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+
+    def set_result(self, result):
+        self.result = result
+        self.event.set()
+
+    def set_exception(self, exception):
+        self.exception = exception
+        self.event.set()
+
+    def get(self):
+        self.event.wait()
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+def read_questions(input_file):
+    """Yield (line number, id, MRL or features, error) for every non-empty
+    input line. error is None unless the line is malformed."""
+    with open(input_file) as f:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, None, f"Invalid JSON: {e}"
+                continue
+            question_id = None
+            if isinstance(entry, dict) and "query_type" not in entry:
+                question_id = entry.get("id")
+                if "features" in entry:
+                    entry = entry["features"]
+                elif "mrl" in entry:
+                    entry = entry["mrl"]
+                else:
+                    yield line_no, question_id, None, "Neither mrl nor features given"
+                    continue
+            yield line_no, question_id, entry, None
+
+
+def read_checkpoint(output_file, retry_errors=False):
+    """Return the line numbers already answered in output_file.
+
+    With retry_errors=True, answers with a transient error are removed from
+    the output file so that they are answered again.
+    """
+    try:
+        with open(output_file) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return set()
+
+    if retry_errors:
+        kept = [
+            record for record in records if not is_transient_error(record["answer"])
+        ]
+        if len(kept) < len(records):
+            with open(output_file, "w") as f:
+                for record in kept:
+                    f.write(json.dumps(record) + "\n")
+        records = kept
+    return {record["line"] for record in records}
+
+
+def is_transient_error(ans):
+    return ans.get("type") == "error" and ans.get("error") in TRANSIENT_ERRORS
+
+
+def question_key(mrl, features):
+    return canonical_hash(features if features is not None else mrl)
+
+
+def percentile(sorted_values, q):
+    """The q-th percentile of sorted_values using the nearest-rank method."""
+    if not sorted_values:
+        return float("nan")
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+_local = threading.local()
+
+
+def get_grammar():
+    """The MrlGrammar of the current thread. Building one takes longer than
+    parsing an MRL, and parses must not overlap, so every thread builds one
+    and reuses it."""
+    grammar = getattr(_local, "grammar", None)
+    if grammar is None:
+        grammar = _local.grammar = MrlGrammar()
+    return grammar
+
+
+def error_answer(error):
+    return {"type": "error", "error": error}
+
+
+def exception_answer(exc):
+    if exc.args:
+        return error_answer(str(exc.args[0]))
+    return error_answer("Unknown MRL interpretation error")
+
+
+def query_overpass_or_fail(overpass_ql, timeout=None):
+    try:
+        return query_overpass(overpass_ql, timeout=timeout)
+    except DeadlineExceeded:
+        raise
+    except Exception as exc:
+        logging.warning("Overpass query failed", exc_info=True)
+        raise AnsweringError(overpass_error_message(exc)) from exc
+
+
+def combine_key(features):
+    """Questions with the same key, other than None, can be answered with
+    one combined Overpass query: simple queries in the same area. The two
+    places of a dist question are combined anyway."""
+    if not features:
+        return None
+    if features["query_type"] in ["around_query", "in_query"]:
+        return features.get("area")
+    if features["query_type"] == "dist" and len(features["sub"]) == 1:
+        return features["sub"][0].get("area")
+    return None
+
+
+def group_questions(features_by_key, combine_max):
+    """Split the keys of features_by_key into groups answered together."""
+    groups = []
+    open_groups = {}
+    for key, features in features_by_key.items():
+        combine = combine_key(features)
+        if combine is None:
+            groups.append([key])
+            continue
+        group = open_groups.get(combine)
+        if group is None or len(group) >= combine_max:
+            group = open_groups[combine] = []
+            groups.append(group)
+        group.append(key)
+    return groups
+
+
+def query_combined(prepared):
+    """Query Overpass for the prepared (index, features, areas) questions
+    with a single combined query.
+
+    :return: The Overpass results per question.
+    """
+    number_of_queries = sum(len(areas) for _, _, areas in prepared)
+    overpass_ql = render_combined_overpass_query(
+        [features for _, features, _ in prepared]
+    )
+    results = split_combined_overpass_result(
+        query_overpass_or_fail(
+            overpass_ql, timeout=combined_overpass_timeout(number_of_queries)
+        ),
+        number_of_queries,
+    )
+    results_list = []
+    for _, _, areas in prepared:
+        results_list.append(results[: len(areas)])
+        results = results[len(areas) :]
+    return results_list
+
+
+def query_prepared(prepared):
+    """Like query_combined, but if the combined query fails, every question
+    is queried on its own.
+
+    :return: The Overpass results or the exception per question.
+    """
+    try:
+        return query_combined(prepared)
+    except Exception as exc:
+        if len(prepared) == 1:
+            return [exc]
+        logging.warning(
+            f"Combined Overpass query for {len(prepared)} questions failed,"
+            " querying them one by one."
+        )
+        return [query_prepared([item])[0] for item in prepared]
+
+
+def answer_group(features_list):
+    """Answer the questions in features_list with a single Overpass query.
+
+    Errors are answered per question: a failed lookup or Overpass query only
+    fails its question.
+
+    :return: The answers, in the same order, and the seconds it took.
+    """
+    start = time.perf_counter()
+    answers = [None] * len(features_list)
+    prepared = []
+    for i, features in enumerate(features_list):
+        if not features:
+            answers[i] = error_answer("No features given")
+            continue
+        try:
+            features, areas = lookup_features(features)
+        except Exception as exc:
+            answers[i] = exception_answer(exc)
+        else:
+            prepared.append((i, features, areas))
+
+    results_list = query_prepared(prepared) if prepared else []
+    for (i, features, areas), results in zip(prepared, results_list):
+        if isinstance(results, Exception):
+            answers[i] = exception_answer(results)
+            continue
+        try:
+            answers[i] = extract_answer_from_overpass_results(
+                features, areas, results
+            ).dict()
+        except Exception as exc:
+            answers[i] = exception_answer(exc)
+    return answers, time.perf_counter() - start
+
+
+def answer_batch(
+    input_file,
+    output_file,
+    workers=4,
+    nominatim_concurrency=1,
+    overpass_concurrency=2,
+    keep_geojson=False,
+    retry_errors=False,
+    combine_max=20,
+):
+    """Answer all questions in input_file and append the answers to output_file.
+
+    :param combine_max: Maximum number of questions answered with one
+        combined Overpass query.
+
+    :return: A dict with statistics about the run.
+    """
+    done = read_checkpoint(output_file, retry_errors=retry_errors)
+
+    # Group the remaining input lines by question.
+    questions = {}
+    malformed = []
+    skipped = 0
+    for line_no, question_id, mrl, error in read_questions(input_file):
+        if line_no in done:
+            skipped += 1
+            continue
+        if error is not None:
+            malformed.append((line_no, question_id, error))
+            continue
+        features = load_features(mrl, grammar=get_grammar())
+        key = question_key(mrl, features)
+        if key not in questions:
+            questions[key] = (features, [])
+        questions[key][1].append((line_no, question_id))
+
+    nominatim = LimitedService(get_nominatim(), nominatim_concurrency, memoize=True)
+    overpass = LimitedService(get_overpass(), overpass_concurrency)
+    previous_nominatim = get_nominatim.replace(nominatim)
+    previous_overpass = get_overpass.replace(overpass)
+
+    latencies = []
+    errors = 0
+    answered_lines = 0
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor, open(
+            output_file, "a"
+        ) as f:
+            for line_no, question_id, error in malformed:
+                record = {
+                    "line": line_no,
+                    "answer": error_answer(error),
+                    "seconds": 0.0,
+                }
+                if question_id is not None:
+                    record["id"] = question_id
+                f.write(json.dumps(record) + "\n")
+                errors += 1
+                answered_lines += 1
+            f.flush()
+            groups = group_questions(
+                {key: features for key, (features, _) in questions.items()},
+                combine_max,
+            )
+            futures = {
+                executor.submit(
+                    answer_group, [questions[key][0] for key in group]
+                ): group
+                for group in groups
+            }
+            for future in as_completed(futures):
+                answers, seconds = future.result()
+                for key, ans in zip(futures[future], answers):
+                    latencies.append(seconds)
+                    if ans.get("type") == "error":
+                        errors += 1
+                    if not keep_geojson:
+                        ans = drop_geojson(ans)
+                    for line_no, question_id in questions[key][1]:
+                        record = {"line": line_no, "answer": ans, "seconds": seconds}
+                        if question_id is not None:
+                            record["id"] = question_id
+                        f.write(json.dumps(record) + "\n")
+                        answered_lines += 1
+                # Flush per group, so that a resumed run loses no answers.
+                f.flush()
+    finally:
+        get_nominatim.replace(previous_nominatim)
+        get_overpass.replace(previous_overpass)
+
+    wallclock_seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "answered_lines": answered_lines,
+        "skipped_lines": skipped,
+        "unique_questions": len(questions),
+        "errors": errors,
+        "nominatim_queries": nominatim.queries - nominatim.hits,
+        "nominatim_cache_hits": nominatim.hits,
+        "overpass_queries": overpass.queries,
+        "wallclock_seconds": wallclock_seconds,
+        "questions_per_second": (
+            len(questions) / wallclock_seconds if wallclock_seconds else 0.0
+        ),
+        "latency_seconds": {
+            f"p{q}": percentile(latencies, q) for q in (50, 90, 95, 99, 100)
+        },
+    }
+
+
+def drop_geojson(ans):
+    return {
+        key: value
+        for key, value in ans.items()
+        if key not in ("geojson", "centers", "targets")
+    }
+
+
+def main(input_file, output_file, **kwargs):
+    logging.basicConfig(level=logging.WARNING)
+    stats = answer_batch(input_file, output_file, **kwargs)
+    print(json.dumps(stats, indent=2))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Answer MRLs from a JSONL file")
+    parser.add_argument("input_file", help="JSONL file with MRLs or MRL features")
+    parser.add_argument(
+        "output_file", help="JSONL file to append the answers to. Also the checkpoint."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Questions answered at the same time"
+    )
+    parser.add_argument(
+        "--nominatim-concurrency",
+        type=int,
+        default=1,
+        help="Maximum number of concurrent Nominatim queries. Default: 1",
+    )
+    parser.add_argument(
+        "--overpass-concurrency",
+        type=int,
+        default=2,
+        help="Maximum number of concurrent Overpass queries. Default: 2",
+    )
+    parser.add_argument(
+        "--combine-max",
+        type=int,
+        default=20,
+        help=(
+            "Maximum number of questions about the same area answered with one"
+            " combined Overpass query. Default: 20"
+        ),
+    )
+    parser.add_argument(
+        "--keep-geojson",
+        action="store_true",
+        default=False,
+        help="Keep the GeoJSON of the results in the answers",
+    )
+    parser.add_argument(
+        "--retry-errors",
+        action="store_true",
+        default=False,
+        help="Answer again questions that failed because of a service error",
+    )
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -1,23 +1,20 @@
 import argparse
 from collections import defaultdict
+import functools
 import itertools
 import json
 import logging
 import math
 import sys
+import threading
 import traceback
-from urllib.error import HTTPError
 
-from geopy.distance import geodesic
-import jinja2
-from OSMPythonTools.nominatim import Nominatim
-
-from nlmaps_tools.parse_mrl import MrlGrammar, Symbol
-from nlmaps_tools.overpass_round_robin import OverpassRoundRobin
+from nlmaps_tools.deadline import DeadlineExceeded, deadline_scope, resolve_deadline
+from nlmaps_tools.metrics import ERRORS, REQUESTS, count_cache_lookup, error_code, timed
+from nlmaps_tools.parse_mrl import FrozenFeatures, MrlGrammar, Symbol
+from nlmaps_tools.tracing import span, traced
 
 USER_AGENT = "NLMaps Web (https://nlmaps.gorgor.de/)"
-NOMINATIM = Nominatim(userAgent=USER_AGENT, waitBetweenQueries=1)
-OVERPASS = OverpassRoundRobin(userAgent=USER_AGENT, waitBetweenQueries=1)
 
 DISTS = {
     "WALKING_DIST": "1000",
@@ -26,15 +23,70 @@ DISTS = {
     "DIST_DAYTRIP": "80000",
 }
 
-ENV = jinja2.Environment(
-    loader=jinja2.PackageLoader("nlmaps_tools", "overpass_templates"),
-    trim_blocks=True,
-    lstrip_blocks=True,
-    autoescape=False,
-)
 
-ENV.filters["esc"] = lambda s: s.translate({ord("'"): "\\'", ord("\\"): "\\\\"})
-ENV.filters["dist_lookup"] = lambda dist: DISTS.get(str(dist), str(dist))
+def lazy_singleton(factory):
+    """Call factory on first use only and return its result from then on.
+
+    get_instance.replace(instance) swaps in another instance, e.g. a wrapper
+    around the original one, and returns the previous instance or None.
+    """
+    lock = threading.Lock()
+    instances = []
+
+    @functools.wraps(factory)
+    def get_instance():
+        if not instances:
+            with lock:
+                if not instances:
+                    instances.append(factory())
+        return instances[0]
+
+    def replace(instance):
+        with lock:
+            previous = instances[0] if instances else None
+            instances[:] = [instance] if instance is not None else []
+        return previous
+
+    get_instance.replace = replace
+    return get_instance
+
+
+@lazy_singleton
+def get_nominatim():
+    from nlmaps_tools.osm_clients import PooledNominatim
+
+    return PooledNominatim(userAgent=USER_AGENT, waitBetweenQueries=1)
+
+
+@lazy_singleton
+def get_overpass():
+    from nlmaps_tools.overpass_round_robin import OverpassRoundRobin
+
+    return OverpassRoundRobin(userAgent=USER_AGENT, waitBetweenQueries=1)
+
+
+def make_overpass_environment(precompiled=True):
+    from nlmaps_tools.templates import make_environment
+
+    env = make_environment("overpass_templates", precompiled=precompiled)
+    env.filters["esc"] = lambda s: s.translate({ord("'"): "\\'", ord("\\"): "\\\\"})
+    env.filters["dist_lookup"] = lambda dist: DISTS.get(str(dist), str(dist))
+    return env
+
+
+get_overpass_environment = lazy_singleton(make_overpass_environment)
+
+
+def __getattr__(name):
+    # The clients and the environment used to be created at import time and
+    # are still available under their old names.
+    if name == "NOMINATIM":
+        return get_nominatim()
+    if name == "OVERPASS":
+        return get_overpass()
+    if name == "ENV":
+        return get_overpass_environment()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class AnsweringError(Exception):
@@ -65,6 +117,21 @@ def get_tags_in_nwr_features(nwr_features, exclude=tuple()):
     return tags
 
 
+def _as_tuple(parts, nwr_features):
+    # Reuse nwr_features if none of its parts changed.
+    if (
+        isinstance(nwr_features, tuple)
+        and len(parts) == len(nwr_features)
+        and all(new is old for new, old in zip(parts, nwr_features))
+    ):
+        return nwr_features
+    return tuple(parts)
+
+
+def _as_tag(feat):
+    return feat if isinstance(feat, tuple) else (feat[0], feat[1])
+
+
 # This does not properly deal with nested ors, but that is not really supported
 # currently anyway.
 def canonicalize_nwr_features(nwr_features):
@@ -77,7 +144,7 @@ def canonicalize_nwr_features(nwr_features):
                     without_nested_ors.extend(part[1:])
                 else:
                     without_nested_ors.append(part)
-            parts.append((feat[0], *without_nested_ors))
+            parts.append(_as_tuple((feat[0], *without_nested_ors), feat))
         elif (
             len(feat) == 2 and isinstance(feat[1], (list, tuple)) and feat[1][0] == "or"
         ):
@@ -86,18 +153,18 @@ def canonicalize_nwr_features(nwr_features):
                 or_part.append((feat[0], val))
             parts.append(tuple(or_part))
         elif len(feat) == 2 and all(isinstance(f, str) for f in feat):
-            parts.append((feat[0], feat[1]))
+            parts.append(_as_tag(feat))
         else:
             raise ValueError("Unexpected feature part: {}".format(feat))
 
-    return tuple(parts)
+    return _as_tuple(parts, nwr_features)
 
 
 def add_name_tags(nwr_features, name_keys=("int_name", "alt_name", "name:en")):
     parts = []
     for feat in nwr_features:
         if feat[0] in ["or", "and"] and isinstance(feat[1], (list, tuple)):
-            parts.append((feat[0], *add_name_tags(feat[1:])))
+            parts.append(_as_tuple((feat[0], *add_name_tags(feat[1:])), feat))
         elif (
             len(feat) == 2 and isinstance(feat[1], (list, tuple)) and feat[1][0] == "or"
         ):
@@ -117,28 +184,49 @@ def add_name_tags(nwr_features, name_keys=("int_name", "alt_name", "name:en")):
                         or_part.append((name_key, feat[1]))
                 parts.append(tuple(or_part))
             else:
-                parts.append((feat[0], feat[1]))
+                parts.append(_as_tag(feat))
         else:
             raise ValueError("Unexpected feature part: {}".format(feat))
 
-    return tuple(parts)
+    return _as_tuple(parts, nwr_features)
+
+
+def replace_features(query_features, changes):
+    """Return a copy of query_features with the entries in changes replaced.
+
+    The copy is shallow, so all other entries are shared with query_features.
+    FrozenFeatures stay frozen.
+    """
+    if not changes:
+        return query_features
+    if isinstance(query_features, FrozenFeatures):
+        return query_features.replace(changes)
+    return {**query_features, **changes}
 
 
 def transform_features(query_features, transform_nwr_features):
+    """Apply transform_nwr_features to all nwr features in query_features.
+
+    query_features is not modified. The result shares all unchanged parts with
+    it, and if nothing changes, query_features itself is returned.
+    """
+    changes = {}
     if "sub" in query_features:
-        for i in range(len(query_features["sub"])):
-            query_features["sub"][i] = transform_features(
-                query_features["sub"][i], transform_nwr_features
-            )
+        sub = [
+            transform_features(sub_features, transform_nwr_features)
+            for sub_features in query_features["sub"]
+        ]
+        if any(new is not old for new, old in zip(sub, query_features["sub"])):
+            changes["sub"] = sub
     else:
-        query_features["target_nwr"] = transform_nwr_features(
-            query_features["target_nwr"]
-        )
+        keys = ["target_nwr"]
         if "center_nwr" in query_features:
-            query_features["center_nwr"] = transform_nwr_features(
-                query_features["center_nwr"]
-            )
-    return query_features
+            keys.append("center_nwr")
+        for key in keys:
+            nwr_features = transform_nwr_features(query_features[key])
+            if nwr_features is not query_features[key]:
+                changes[key] = nwr_features
+    return replace_features(query_features, changes)
 
 
 def has_name(tags):
@@ -234,36 +322,62 @@ def apply_qtype(qtype, elements):
 
 
 def overpass_query(features, template_name):
-    template = ENV.get_template(template_name)
+    template = get_overpass_environment().get_template(template_name)
     ql = template.render(features=features)
     logging.info("Querying Overpass: {}".format(ql))
     try:
-        result = OVERPASS.query(ql)
-    except HTTPError as exc:
-        traceback.print_exc()
-        if exc.code == 429:
-            error = "Too Many Requests to Overpass API."
-        elif exc.code == 504:
-            error = "Gateway Timeout at Overpass API."
-        else:
-            error = "HTTP Error with Overpass API."
-        ans = {"type": "error", "error": error}
+        result = get_overpass().query(ql)
+    except DeadlineExceeded as exc:
+        ans = {"type": "error", "error": str(exc)}
         return ans
-    except:
+    except Exception as exc:
         traceback.print_exc()
-        ans = {"type": "error", "error": "Error when retrieving result."}
+        ans = {"type": "error", "error": overpass_error_message(exc)}
         return ans
     return result
 
 
-def nominatim_query(query, params=None):
+OVERPASS_TOO_MANY_REQUESTS = "Too Many Requests to Overpass API."
+OVERPASS_GATEWAY_TIMEOUT = "Gateway Timeout at Overpass API."
+OVERPASS_HTTP_ERROR = "HTTP Error with Overpass API."
+OVERPASS_ERROR = "Error when retrieving result."
+NOMINATIM_ERROR = "Error when contacting Nominatim."
+
+
+def overpass_error_message(exc):
+    """The error to answer with when an Overpass query raised exc."""
+    # urllib's HTTPError and the HttpStatusError of the pooled transport
+    # both carry the status code.
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        if code == 429:
+            return OVERPASS_TOO_MANY_REQUESTS
+        elif code == 504:
+            return OVERPASS_GATEWAY_TIMEOUT
+        return OVERPASS_HTTP_ERROR
+    return OVERPASS_ERROR
+
+
+@timed("nominatim")
+def nominatim_query(query, params=None, deadline=None):
     params = params or {}
+    deadline = resolve_deadline(deadline)
+    if deadline is not None:
+        deadline.check("querying Nominatim")
     logging.info("Querying Nominatim: q={}, params={}".format(query, params))
+    REQUESTS.labels("nominatim").inc()
     try:
-        result = NOMINATIM.query(query, params=params)
+        with span("nominatim_query", query=query, params=params), deadline_scope(
+            deadline
+        ):
+            result = get_nominatim().query(query, params=params)
+    except DeadlineExceeded:
+        ERRORS.labels("nominatim", "DeadlineExceeded").inc()
+        raise
     except Exception as e:
         traceback.print_exc()
-        raise AnsweringError("Error when contacting Nominatim.") from e
+        ERRORS.labels("nominatim", error_code(e)).inc()
+        raise AnsweringError(NOMINATIM_ERROR) from e
     return result
 
 
@@ -294,9 +408,25 @@ def add_area_id(features):
     return None
 
 
-def nwr_nominatim_lookup(nwr_features, bbox=None):
+def poi_index_lookup(name, bbox):
+    from nlmaps_tools.poi_index import get_poi_index
+
+    poi_index = get_poi_index()
+    if poi_index is None:
+        return None
+    new_tag = poi_index.lookup(name, bbox)
+    count_cache_lookup("poi_index", new_tag is not None)
+    if new_tag:
+        logging.info("POI index lookup for {!r} yielded {}.".format(name, new_tag))
+    return new_tag
+
+
+def nwr_nominatim_lookup(nwr_features, bbox=None, deadline=None):
     """
     bbox is a 4-tuple of minlon, minlat, maxlon, maxlat.
+
+    With a bbox, the local POI index is searched first, if there is one. The
+    Nominatim result is None then.
     """
     new_nwr_features = None
     n_result = None
@@ -308,6 +438,9 @@ def nwr_nominatim_lookup(nwr_features, bbox=None):
         name = tags[0][1]
 
         if bbox:
+            new_tag = poi_index_lookup(name, bbox)
+            if new_tag:
+                return [new_tag], None
             params = {
                 "viewbox": "{b[0]},{b[1]},{b[2]},{b[3]}".format(b=bbox),
                 "bounded": "1",
@@ -315,7 +448,7 @@ def nwr_nominatim_lookup(nwr_features, bbox=None):
         else:
             params = None
 
-        n_result = nominatim_query(name, params=params)
+        n_result = nominatim_query(name, params=params, deadline=deadline)
         results = n_result.toJSON()
         if results:
             new_tag = (results[0]["osm_type"], results[0]["osm_id"])
@@ -390,6 +523,8 @@ def cardinal_direction_applies(center_coords, target_coords, cardinal_direction=
 
 
 def limit_to_centers(centers, targets, max_dist, max_targets, cardinal_direction):
+    from geopy.distance import geodesic
+
     # max_dist has to be in km
     ids_of_allowed_targets = set()
     target_coords_by_id = {target.id(): latlong(target) for target in targets}
@@ -465,6 +600,8 @@ def answer_simple_query(features):
     else:
         dist = False
 
+    # add_area_id and substitute_name_tags set entries, so work on a copy.
+    features = dict(features)
     n_result = add_area_id(features)
 
     template_name = features["query_type"] + ".jinja2"
@@ -514,6 +651,8 @@ def answer_simple_query(features):
 
 
 def answer_dist_between_query(features):
+    from geopy.distance import geodesic
+
     _, _, centers = answer_simple_query(features["sub"][0])
     _, _, targets = answer_simple_query(features["sub"][1])
 
@@ -546,7 +685,13 @@ def answer_dist_between_query(features):
     return ans, centers, targets
 
 
-def answer(features):
+@traced("answer")
+def answer(features, deadline=None):
+    with deadline_scope(deadline):
+        return _answer(features)
+
+
+def _answer(features):
     if features:
         features = transform_features(features, add_name_tags)
         features = transform_features(features, canonicalize_nwr_features)
@@ -574,16 +719,18 @@ def answer(features):
     return {"type": "error", "error": error}
 
 
-def load_features(mrl, escaped=False):
-    if isinstance(mrl, str):
-        mrl = mrl.strip()
-        if mrl.startswith("dist(") or mrl.startswith("query("):
-            grammar = MrlGrammar()
-            try:
-                parseResult = grammar.parseMrl(mrl, is_escaped=escaped)
-            except:
-                return None
-            features = parseResult["features"]
+def load_features(mrl, escaped=False, grammar=None):
+    """
+    :param grammar: MrlGrammar to parse mrl with. Building one takes longer
+        than parsing, so pass one when loading many MRLs. Default: a new one.
+    """
+    if isinstance(mrl, str) and mrl.strip().startswith(("dist(", "query(")):
+        grammar = grammar or MrlGrammar()
+        try:
+            parseResult = grammar.parseMrl(mrl.strip(), is_escaped=escaped)
+        except:
+            return None
+        features = parseResult["features"]
 
     elif isinstance(mrl, dict) and "query_type" in mrl:
         features = mrl
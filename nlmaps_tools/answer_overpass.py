@@ -7,7 +7,7 @@ from pydantic import BaseModel
 from OSMPythonTools.overpass import OverpassResult
 
 from nlmaps_tools.answer_mrl import (
-    OVERPASS,
+    get_overpass,
     chop_to_cardinal_direction,
     handle_around_topx,
     element_name,
@@ -16,12 +16,24 @@ from nlmaps_tools.answer_mrl import (
 )
 from nlmaps_tools.features_to_overpass import (
     Will2021FeaturesAfterNwrNameLookup,
+    Will2021RawFeatures,
     OSMArea,
+    combined_overpass_timeout,
+    make_combined_overpass_query,
 )
+from nlmaps_tools.deadline import Deadline, deadline_scope
+from nlmaps_tools.metrics import timed
+from nlmaps_tools.tracing import traced
 from nlmaps_tools.parse_mrl import Symbol
 
 GeoJSON = dict[str, Any]
 
+# The answers are built from Overpass results by the code below, so they are
+# created with construct(), which skips validation. Validating a ListAnswer
+# with tens of thousands of findkey values or a MultiAnswer with large GeoJSON
+# takes longer than extracting them. DistAnswers are still validated, as it
+# turns element IDs used as names into strings.
+
 
 class SingleAnswer(BaseModel):
     type: str
@@ -63,19 +75,49 @@ class MultiAnswer(BaseModel):
     centers: Optional[GeoJSON]
 
 
-def query_overpass(overpass_ql) -> OverpassResult:
-    result = OVERPASS.query(overpass_ql)
+@traced("query_overpass")
+def query_overpass(
+    overpass_ql, deadline: Optional[Deadline] = None, timeout: Optional[int] = None
+) -> OverpassResult:
+    """:param timeout: The [timeout:] of the query in seconds, if not the
+    default. A deadline may shorten it."""
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    with deadline_scope(deadline):
+        result = get_overpass().query(overpass_ql, **kwargs)
     return result
 
 
+def split_combined_overpass_result(
+    result: OverpassResult, number_of_queries: int
+) -> list[OverpassResult]:
+    """Split the result of a query from render_combined_overpass_query into
+    one result per query."""
+    json = result.toJSON()
+    parts = [[]]
+    for element in json["elements"]:
+        if element.get("type") == "query_separator":
+            parts.append([])
+        else:
+            parts[-1].append(element)
+    # Every query is terminated by a separator, so the last part is empty.
+    if len(parts) != number_of_queries + 1 or parts[-1]:
+        raise ValueError(
+            f"Expected results for {number_of_queries} queries, but got {len(parts) - 1}."
+        )
+    return [
+        OverpassResult({**json, "elements": part}, result.queryString(), {})
+        for part in parts[:-1]
+    ]
+
+
 def apply_qtype(qtype, elements):
     if qtype == Symbol("latlong"):
-        return MapAnswer()
+        return MapAnswer.construct()
     elif qtype == ("least", ("topx", Symbol("1"))):
         text = "Yes" if len(elements) > 0 else "No"
-        return TextAnswer(text=text)
+        return TextAnswer.construct(text=text)
     elif qtype == Symbol("count"):
-        return TextAnswer(text=str(len(elements)))
+        return TextAnswer.construct(text=str(len(elements)))
     elif isinstance(qtype, tuple) and qtype[0] == "findkey":
         # TODO: Handle multiple keys
         key = qtype[1]
@@ -83,7 +125,7 @@ def apply_qtype(qtype, elements):
             "{} {}".format(elm.type(), elm.id()) if key == "name" else element_name(elm)
         )
         values = ["{}: {}".format(name(elm), str(elm.tag(key))) for elm in elements]
-        return ListAnswer(list=values)
+        return ListAnswer.construct(list=values)
     raise ValueError(f"Unknown qtype: {qtype}")
 
 
@@ -115,7 +157,7 @@ def extract_answer_from_simple_overpass_result(
         centers = []
         targets = elements
 
-    answer = MultiAnswerRawElements(answers=[], targets=targets)
+    answer = MultiAnswerRawElements.construct(answers=[], targets=targets)
     if centers:
         answer.centers = centers
     if simple_features["query_type"] == "around_query" and features["query_type"] == "dist":
@@ -154,7 +196,7 @@ def extract_answer_from_dist_between_overpass_result(
     dist = geodesic(latlong(center), latlong(target)).kilometers
 
     if center and target:
-        return MultiAnswerRawElements(
+        return MultiAnswerRawElements.construct(
             answers=[
                 DistAnswer(
                     dist=dist,
@@ -175,6 +217,8 @@ def extract_answer_from_dist_between_overpass_result(
     raise ValueError(error)
 
 
+@timed("extract")
+@traced("extract_answer_from_overpass_results")
 def extract_answer_from_overpass_results(
     features: Will2021FeaturesAfterNwrNameLookup,
     areas: list[Optional[OSMArea]],
@@ -193,8 +237,43 @@ def extract_answer_from_overpass_results(
         raise ValueError(
             f"The list of results must contain one or two results, but contains {len(results)}."
         )
-    return MultiAnswer(
+    return MultiAnswer.construct(
         answers=answer.answers,
         targets=geojson(answer.targets),
         centers=geojson(answer.centers) if answer.centers else None,
     )
+
+
+def extract_answers_from_combined_overpass_result(
+    features_list: list[Will2021FeaturesAfterNwrNameLookup],
+    areas_list: list[list[Optional[OSMArea]]],
+    result: OverpassResult,
+) -> list[MultiAnswer]:
+    assert len(features_list) == len(areas_list)
+    results = split_combined_overpass_result(
+        result, sum(len(areas) for areas in areas_list)
+    )
+    answers = []
+    for features, areas in zip(features_list, areas_list):
+        answers.append(
+            extract_answer_from_overpass_results(features, areas, results[: len(areas)])
+        )
+        results = results[len(areas) :]
+    return answers
+
+
+def answer_features_combined(
+    features_list: list[Will2021RawFeatures], deadline: Optional[Deadline] = None
+) -> list[MultiAnswer]:
+    """Answer several queries with a single Overpass request."""
+    features_list, areas_list, overpass_ql = make_combined_overpass_query(
+        features_list, deadline=deadline
+    )
+    result = query_overpass(
+        overpass_ql,
+        deadline=deadline,
+        timeout=combined_overpass_timeout(sum(len(areas) for areas in areas_list)),
+    )
+    return extract_answers_from_combined_overpass_result(
+        features_list, areas_list, result
+    )
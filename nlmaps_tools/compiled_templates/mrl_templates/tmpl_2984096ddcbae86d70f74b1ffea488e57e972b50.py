@@ -0,0 +1,37 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'base_query.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_features = resolve('features')
+    l_0_open_paren_after_functor = resolve('open_paren_after_functor')
+    l_0_escape = resolve('escape')
+    pass
+    yield 'query('
+    if environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'cardinal_direction'):
+        pass
+        yield str(environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'cardinal_direction'))
+        yield '('
+    yield from context.blocks['query_content'][0](context)
+    if environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'cardinal_direction'):
+        pass
+        yield ')'
+    yield ',qtype('
+    yield str(context.call((undefined(name='open_paren_after_functor') if l_0_open_paren_after_functor is missing else l_0_open_paren_after_functor), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'qtype'), (undefined(name='escape') if l_0_escape is missing else l_0_escape)))
+    yield '))'
+
+def block_query_content(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    _block_vars = {}
+    pass
+
+blocks = {'query_content': block_query_content}
+debug_info = '2=15&3=17&5=19&6=20&9=24&5=27'
\ No newline at end of file
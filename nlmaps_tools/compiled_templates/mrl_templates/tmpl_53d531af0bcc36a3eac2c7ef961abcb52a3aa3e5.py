@@ -0,0 +1,56 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'around_query.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    parent_template = None
+    pass
+    parent_template = environment.get_template('base_query.jinja2', 'around_query.jinja2')
+    for name, parent_block in parent_template.blocks.items():
+        context.blocks.setdefault(name, []).append(parent_block)
+    yield from parent_template.root_render_func(context)
+
+def block_query_content(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    _block_vars = {}
+    l_0_features = resolve('features')
+    l_0_quote = resolve('quote')
+    l_0_escape = resolve('escape')
+    l_0_render_nwr = resolve('render_nwr')
+    pass
+    yield 'around(center('
+    if ('area' in (undefined(name='features') if l_0_features is missing else l_0_features)):
+        pass
+        yield "area(keyval('name',"
+        yield str(context.call((undefined(name='quote') if l_0_quote is missing else l_0_quote), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'area'), (undefined(name='escape') if l_0_escape is missing else l_0_escape), _block_vars=_block_vars))
+        yield '))'
+        if ('center_nwr' in (undefined(name='features') if l_0_features is missing else l_0_features)):
+            pass
+            yield ','
+    if ('center_nwr' in (undefined(name='features') if l_0_features is missing else l_0_features)):
+        pass
+        yield 'nwr('
+        yield str(context.call((undefined(name='render_nwr') if l_0_render_nwr is missing else l_0_render_nwr), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'center_nwr'), (undefined(name='escape') if l_0_escape is missing else l_0_escape), _block_vars=_block_vars))
+        yield ')'
+    yield '),search(nwr('
+    yield str(context.call((undefined(name='render_nwr') if l_0_render_nwr is missing else l_0_render_nwr), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'target_nwr'), (undefined(name='escape') if l_0_escape is missing else l_0_escape), _block_vars=_block_vars))
+    yield ')),maxdist('
+    yield str(context.call((undefined(name='quote') if l_0_quote is missing else l_0_quote), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'maxdist'), (undefined(name='escape') if l_0_escape is missing else l_0_escape), _block_vars=_block_vars))
+    yield ')'
+    if ('around_topx' in (undefined(name='features') if l_0_features is missing else l_0_features)):
+        pass
+        yield ',topx('
+        yield str(context.call((undefined(name='quote') if l_0_quote is missing else l_0_quote), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'around_topx'), (undefined(name='escape') if l_0_escape is missing else l_0_escape), _block_vars=_block_vars))
+        yield ')'
+    yield ')'
+
+blocks = {'query_content': block_query_content}
+debug_info = '1=12&3=17&6=30&7=33&8=35&10=38&11=41&14=44&15=46&16=48&17=51'
\ No newline at end of file
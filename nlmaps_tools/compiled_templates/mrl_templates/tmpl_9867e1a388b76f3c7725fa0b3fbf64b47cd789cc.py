@@ -0,0 +1,39 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'in_query.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    parent_template = None
+    pass
+    parent_template = environment.get_template('base_query.jinja2', 'in_query.jinja2')
+    for name, parent_block in parent_template.blocks.items():
+        context.blocks.setdefault(name, []).append(parent_block)
+    yield from parent_template.root_render_func(context)
+
+def block_query_content(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    _block_vars = {}
+    l_0_features = resolve('features')
+    l_0_quote = resolve('quote')
+    l_0_escape = resolve('escape')
+    l_0_render_nwr = resolve('render_nwr')
+    pass
+    if ('area' in (undefined(name='features') if l_0_features is missing else l_0_features)):
+        pass
+        yield "area(keyval('name',"
+        yield str(context.call((undefined(name='quote') if l_0_quote is missing else l_0_quote), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'area'), (undefined(name='escape') if l_0_escape is missing else l_0_escape), _block_vars=_block_vars))
+        yield ')),'
+    yield 'nwr('
+    yield str(context.call((undefined(name='render_nwr') if l_0_render_nwr is missing else l_0_render_nwr), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'target_nwr'), (undefined(name='escape') if l_0_escape is missing else l_0_escape), _block_vars=_block_vars))
+    yield ')'
+
+blocks = {'query_content': block_query_content}
+debug_info = '1=12&3=17&4=29&5=32&7=35'
\ No newline at end of file
@@ -0,0 +1,53 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'dist.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_features = resolve('features')
+    l_0_quote = resolve('quote')
+    l_0_escape = resolve('escape')
+    l_0_dist_features = missing
+    pass
+    l_0_dist_features = (undefined(name='features') if l_0_features is missing else l_0_features)
+    context.vars['dist_features'] = l_0_dist_features
+    context.exported_vars.add('dist_features')
+    yield 'dist('
+    l_0_features = environment.getitem(environment.getitem((undefined(name='dist_features') if l_0_dist_features is missing else l_0_dist_features), 'sub'), 0)
+    context.vars['features'] = l_0_features
+    context.exported_vars.add('features')
+    template = environment.get_or_select_template((environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'query_type') + '.jinja2'), 'dist.jinja2')
+    gen = template.root_render_func(template.new_context(context.get_all(), True, {'dist_features': l_0_dist_features, 'features': l_0_features}))
+    try:
+        for event in gen:
+            yield event
+    finally: gen.close()
+    if environment.getitem(environment.getitem((undefined(name='dist_features') if l_0_dist_features is missing else l_0_dist_features), 'sub'), 1):
+        pass
+        yield ','
+        l_0_features = environment.getitem(environment.getitem((undefined(name='dist_features') if l_0_dist_features is missing else l_0_dist_features), 'sub'), 1)
+        context.vars['features'] = l_0_features
+        context.exported_vars.add('features')
+        template = environment.get_or_select_template((environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'query_type') + '.jinja2'), 'dist.jinja2')
+        gen = template.root_render_func(template.new_context(context.get_all(), True, {'dist_features': l_0_dist_features, 'features': l_0_features}))
+        try:
+            for event in gen:
+                yield event
+        finally: gen.close()
+    if ('for' in (undefined(name='dist_features') if l_0_dist_features is missing else l_0_dist_features)):
+        pass
+        yield ',for('
+        yield str(context.call((undefined(name='quote') if l_0_quote is missing else l_0_quote), environment.getitem((undefined(name='dist_features') if l_0_dist_features is missing else l_0_dist_features), 'for'), (undefined(name='escape') if l_0_escape is missing else l_0_escape)))
+        yield ')'
+    elif ('unit' in (undefined(name='dist_features') if l_0_dist_features is missing else l_0_dist_features)):
+        pass
+        yield ',unit('
+        yield str(context.call((undefined(name='quote') if l_0_quote is missing else l_0_quote), environment.getitem((undefined(name='dist_features') if l_0_dist_features is missing else l_0_dist_features), 'unit'), (undefined(name='escape') if l_0_escape is missing else l_0_escape)))
+        yield ')'
+    yield ')'
+
+blocks = {}
+debug_info = '1=15&3=19&4=22&5=28&7=31&8=34&10=40&11=43&12=45&13=48'
\ No newline at end of file
@@ -0,0 +1,38 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'around_query.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_features = resolve('features')
+    l_0_area_ready = resolve('area_ready')
+    l_0_M = missing
+    try:
+        t_1 = environment.filters['dist_lookup']
+    except KeyError:
+        @internalcode
+        def t_1(*unused):
+            raise TemplateRuntimeError("No filter named 'dist_lookup' found.")
+    pass
+    l_0_M = context.vars['M'] = environment.get_template('macros.jinja2', 'around_query.jinja2')._get_default_module(context)
+    context.exported_vars.discard('M')
+    if environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'area'):
+        pass
+        if (not (undefined(name='area_ready') if l_0_area_ready is missing else l_0_area_ready)):
+            pass
+            yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'area'), (undefined(name='features') if l_0_features is missing else l_0_features)))
+            yield '\n'
+        yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'nwr'), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'center_nwr'), result_set='.center'))
+        yield '\n'
+    else:
+        pass
+        yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'nwr'), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'center_nwr'), area=None, result_set='.center'))
+        yield '\n'
+    yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'nwr'), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'target_nwr'), area=('around.center:' + t_1(environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'maxdist')))))
+    yield '\n.center out geom;\nmake separator "name" = "separator" -> .sep;\n.sep out;\nout geom;'
+
+blocks = {}
+debug_info = '1=20&2=22&3=24&4=26&6=28&8=32&10=34'
\ No newline at end of file
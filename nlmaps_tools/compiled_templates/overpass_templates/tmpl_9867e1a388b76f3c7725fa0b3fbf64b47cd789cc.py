@@ -0,0 +1,31 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'in_query.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_features = resolve('features')
+    l_0_area_ready = resolve('area_ready')
+    l_0_M = missing
+    pass
+    l_0_M = context.vars['M'] = environment.get_template('macros.jinja2', 'in_query.jinja2')._get_default_module(context)
+    context.exported_vars.discard('M')
+    if environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'area'):
+        pass
+        if (not (undefined(name='area_ready') if l_0_area_ready is missing else l_0_area_ready)):
+            pass
+            yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'area'), (undefined(name='features') if l_0_features is missing else l_0_features)))
+            yield '\n'
+        yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'nwr'), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'target_nwr')))
+        yield '\n'
+    else:
+        pass
+        yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'nwr'), environment.getitem((undefined(name='features') if l_0_features is missing else l_0_features), 'target_nwr'), area=None))
+        yield '\n'
+    yield 'out geom;'
+
+blocks = {}
+debug_info = '1=14&2=16&3=18&4=20&6=22&8=26'
\ No newline at end of file
@@ -0,0 +1,209 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'macros.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_tag = l_0_by_id = l_0_nwr = l_0_area = missing
+    try:
+        t_1 = environment.filters['esc']
+    except KeyError:
+        @internalcode
+        def t_1(*unused):
+            raise TemplateRuntimeError("No filter named 'esc' found.")
+    try:
+        t_2 = environment.filters['length']
+    except KeyError:
+        @internalcode
+        def t_2(*unused):
+            raise TemplateRuntimeError("No filter named 'length' found.")
+    try:
+        t_3 = environment.filters['string']
+    except KeyError:
+        @internalcode
+        def t_3(*unused):
+            raise TemplateRuntimeError("No filter named 'string' found.")
+    pass
+    def macro(l_1_key, l_1_value, l_1_area, l_1_prev_set, l_1_next_set):
+        t_4 = []
+        if l_1_key is missing:
+            l_1_key = undefined("parameter 'key' was not provided", name='key')
+        if l_1_value is missing:
+            l_1_value = undefined("parameter 'value' was not provided", name='value')
+        if l_1_area is missing:
+            l_1_area = None
+        if l_1_prev_set is missing:
+            l_1_prev_set = None
+        if l_1_next_set is missing:
+            l_1_next_set = None
+        pass
+        t_4.extend((
+            'nwr',
+            str((l_1_prev_set if l_1_prev_set else '')),
+            '["',
+            str(t_1(l_1_key)),
+            '"',
+        ))
+        if (l_1_value == '*'):
+            pass
+            t_4.append(
+                ']',
+            )
+        else:
+            pass
+            t_4.extend((
+                '="',
+                str(t_1(l_1_value)),
+                '"]',
+            ))
+        if l_1_area:
+            pass
+            t_4.extend((
+                '(',
+                str(l_1_area),
+                ')',
+            ))
+        t_4.extend((
+            str(((' -> ' + l_1_next_set) if l_1_next_set else '')),
+            ';',
+        ))
+        return concat(t_4)
+    context.exported_vars.add('tag')
+    context.vars['tag'] = l_0_tag = Macro(environment, macro, 'tag', ('key', 'value', 'area', 'prev_set', 'next_set'), False, False, False, context.eval_ctx.autoescape)
+    yield '\n'
+    def macro(l_1_osm_type, l_1_osm_id, l_1_area, l_1_prev_set, l_1_next_set):
+        t_5 = []
+        if l_1_osm_type is missing:
+            l_1_osm_type = undefined("parameter 'osm_type' was not provided", name='osm_type')
+        if l_1_osm_id is missing:
+            l_1_osm_id = undefined("parameter 'osm_id' was not provided", name='osm_id')
+        if l_1_area is missing:
+            l_1_area = None
+        if l_1_prev_set is missing:
+            l_1_prev_set = None
+        if l_1_next_set is missing:
+            l_1_next_set = None
+        pass
+        t_5.extend((
+            str(l_1_osm_type),
+            '\n',
+            str((l_1_prev_set if l_1_prev_set else '')),
+            '(',
+            str(l_1_osm_id),
+            ')\n',
+        ))
+        if l_1_area:
+            pass
+            t_5.extend((
+                '(',
+                str(l_1_area),
+                ')',
+            ))
+        t_5.extend((
+            str(((' -> ' + l_1_next_set) if l_1_next_set else '')),
+            ';',
+        ))
+        return concat(t_5)
+    context.exported_vars.add('by_id')
+    context.vars['by_id'] = l_0_by_id = Macro(environment, macro, 'by_id', ('osm_type', 'osm_id', 'area', 'prev_set', 'next_set'), False, False, False, context.eval_ctx.autoescape)
+    yield '\n'
+    def macro(l_1_nwr_features, l_1_area, l_1_result_set):
+        t_6 = []
+        l_1_namespace = resolve('namespace')
+        l_1_ns = missing
+        if l_1_nwr_features is missing:
+            l_1_nwr_features = undefined("parameter 'nwr_features' was not provided", name='nwr_features')
+        if l_1_area is missing:
+            l_1_area = 'area.a'
+        if l_1_result_set is missing:
+            l_1_result_set = None
+        pass
+        l_1_ns = context.call((undefined(name='namespace') if l_1_namespace is missing else l_1_namespace), prev_set=None, next_set=None)
+        l_2_loop = missing
+        for l_2_feat, l_2_loop in LoopContext(l_1_nwr_features, undefined):
+            _loop_vars = {}
+            pass
+            if (environment.getattr(l_2_loop, 'index') == t_2(l_1_nwr_features)):
+                pass
+                if not isinstance(l_1_ns, Namespace):
+                    raise TemplateRuntimeError("cannot assign attribute on non-namespace object")
+                l_1_ns['next_set'] = l_1_result_set
+            else:
+                pass
+                if not isinstance(l_1_ns, Namespace):
+                    raise TemplateRuntimeError("cannot assign attribute on non-namespace object")
+                l_1_ns['next_set'] = ('.res' + t_3(environment.getattr(l_2_loop, 'index')))
+            if (environment.getitem(l_2_feat, 0) == 'or'):
+                pass
+                t_6.append(
+                    '(\n',
+                )
+                for l_3_f in l_2_feat[1:]:
+                    _loop_vars = {}
+                    pass
+                    t_6.extend((
+                        '  ',
+                        str(context.call((undefined(name='tag') if l_0_tag is missing else l_0_tag), environment.getitem(l_3_f, 0), environment.getitem(l_3_f, 1), area=l_1_area, prev_set=environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'prev_set'), _loop_vars=_loop_vars)),
+                        '\n',
+                    ))
+                l_3_f = missing
+                t_6.extend((
+                    ')',
+                    str(((' -> ' + environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'next_set')) if environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'next_set') else '')),
+                    ';\n',
+                ))
+            elif (environment.getitem(l_2_feat, 0) in ('node', 'way', 'relation')):
+                pass
+                t_6.extend((
+                    '    ',
+                    str(context.call((undefined(name='by_id') if l_0_by_id is missing else l_0_by_id), environment.getitem(l_2_feat, 0), environment.getitem(l_2_feat, 1), area=l_1_area, prev_set=environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'prev_set'), next_set=environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'next_set'), _loop_vars=_loop_vars)),
+                    '\n',
+                ))
+            else:
+                pass
+                t_6.extend((
+                    str(context.call((undefined(name='tag') if l_0_tag is missing else l_0_tag), environment.getitem(l_2_feat, 0), environment.getitem(l_2_feat, 1), area=l_1_area, prev_set=environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'prev_set'), next_set=environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'next_set'), _loop_vars=_loop_vars)),
+                    '\n',
+                ))
+            if not isinstance(l_1_ns, Namespace):
+                raise TemplateRuntimeError("cannot assign attribute on non-namespace object")
+            l_1_ns['prev_set'] = environment.getattr((undefined(name='ns') if l_1_ns is missing else l_1_ns), 'next_set')
+        l_2_loop = l_2_feat = missing
+        return concat(t_6)
+    context.exported_vars.add('nwr')
+    context.vars['nwr'] = l_0_nwr = Macro(environment, macro, 'nwr', ('nwr_features', 'area', 'result_set'), False, False, False, context.eval_ctx.autoescape)
+    yield '\n'
+    def macro(l_1_features, l_1_area_var):
+        t_7 = []
+        if l_1_features is missing:
+            l_1_features = undefined("parameter 'features' was not provided", name='features')
+        if l_1_area_var is missing:
+            l_1_area_var = '.a'
+        pass
+        if environment.getitem(l_1_features, 'area_id'):
+            pass
+            t_7.extend((
+                'area(',
+                str(environment.getitem(l_1_features, 'area_id')),
+                ') -> ',
+                str(l_1_area_var),
+                ';\n',
+            ))
+        else:
+            pass
+            t_7.extend((
+                'area["name"="',
+                str(t_1(environment.getitem(l_1_features, 'area'))),
+                '"] -> ',
+                str(l_1_area_var),
+                ';\n',
+            ))
+        return concat(t_7)
+    context.exported_vars.add('area')
+    context.vars['area'] = l_0_area = Macro(environment, macro, 'area', ('features', 'area_var'), False, False, False, context.eval_ctx.autoescape)
+
+blocks = {}
+debug_info = '1=30&3=45&4=47&5=50&8=59&10=62&11=66&13=70&17=77&18=91&19=93&20=95&21=98&22=102&24=106&28=113&29=124&30=126&31=129&32=133&34=138&36=139&38=144&39=149&42=155&44=158&45=162&47=168&49=173&53=179&54=186&55=190&57=199'
\ No newline at end of file
@@ -0,0 +1,43 @@
+from jinja2.runtime import LoopContext, Macro, Markup, Namespace, TemplateNotFound, TemplateReference, TemplateRuntimeError, Undefined, escape, identity, internalcode, markup_join, missing, str_join
+name = 'combined_query.jinja2'
+
+def root(context, missing=missing):
+    resolve = context.resolve_or_missing
+    undefined = environment.undefined
+    concat = environment.concat
+    cond_expr_undefined = Undefined
+    if 0: yield None
+    l_0_namespace = resolve('namespace')
+    l_0_queries = resolve('queries')
+    l_0_M = l_0_ns = missing
+    pass
+    l_0_M = context.vars['M'] = environment.get_template('macros.jinja2', 'combined_query.jinja2')._get_default_module(context)
+    context.exported_vars.discard('M')
+    l_0_ns = context.call((undefined(name='namespace') if l_0_namespace is missing else l_0_namespace), area=None)
+    context.vars['ns'] = l_0_ns
+    context.exported_vars.add('ns')
+    for l_1_features in (undefined(name='queries') if l_0_queries is missing else l_0_queries):
+        _loop_vars = {}
+        pass
+        if (environment.getitem(l_1_features, 'area') and ((environment.getitem(l_1_features, 'area_id'), environment.getitem(l_1_features, 'area')) != environment.getattr((undefined(name='ns') if l_0_ns is missing else l_0_ns), 'area'))):
+            pass
+            yield str(context.call(environment.getattr((undefined(name='M') if l_0_M is missing else l_0_M), 'area'), l_1_features, _loop_vars=_loop_vars))
+            yield '\n'
+            if not isinstance(l_0_ns, Namespace):
+                raise TemplateRuntimeError("cannot assign attribute on non-namespace object")
+            l_0_ns['area'] = (environment.getitem(l_1_features, 'area_id'), environment.getitem(l_1_features, 'area'))
+        l_2_area_ready = True
+        pass
+        template = environment.get_or_select_template((environment.getitem(l_1_features, 'query_type') + '.jinja2'), 'combined_query.jinja2')
+        gen = template.root_render_func(template.new_context(context.get_all(), True, {'area_ready': l_2_area_ready, 'features': l_1_features, 'M': l_0_M, 'ns': l_0_ns}))
+        try:
+            for event in gen:
+                yield event
+        finally: gen.close()
+        yield '\n'
+        l_2_area_ready = missing
+        yield 'make query_separator -> .query_sep;\n.query_sep out;\n'
+    l_1_features = missing
+
+blocks = {}
+debug_info = '1=14&2=16&3=19&4=22&5=24&6=28&9=31'
\ No newline at end of file
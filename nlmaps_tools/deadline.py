@@ -0,0 +1,99 @@
+"""End-to-end deadlines for answering a question.
+
+A Deadline is either passed explicitly, e.g. to
+make_overpass_queries_from_features or query_overpass, or made current for a
+block of code with deadline_scope, so that every Nominatim and Overpass
+request inside the block respects it:
+
+    with deadline_scope(Deadline(10)):
+        result = tool.process_request(request)
+
+Requests get an HTTP timeout of the remaining time, Overpass queries a
+[timeout:] and [maxsize:] setting, retries that cannot finish in time are
+skipped, and DeadlineExceeded is raised as soon as the time is up.
+"""
+import contextlib
+import contextvars
+import math
+import time
+
+# Overpass needs some time to send the result after its own timeout.
+OVERPASS_TIMEOUT_MARGIN_SECONDS = 1.0
+# Retrying makes no sense with less time left than this.
+MIN_ATTEMPT_SECONDS = 2.0
+# Memory Overpass may use for a query, instead of its default of 512 MiB.
+DEFAULT_OVERPASS_MAXSIZE = 256 * 1024 * 1024
+
+_current_deadline = contextvars.ContextVar("nlmaps_current_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds, overpass_maxsize=DEFAULT_OVERPASS_MAXSIZE):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.overpass_maxsize = overpass_maxsize
+
+    def __repr__(self):
+        return f"Deadline(remaining={self.remaining():.3f}s of {self.seconds}s)"
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def can_afford(self, seconds):
+        return self.remaining() >= seconds
+
+    def check(self, action):
+        """Raise DeadlineExceeded if there is no time left for action."""
+        if self.expired():
+            raise DeadlineExceeded(
+                f"Deadline of {self.seconds} s exceeded before {action}."
+            )
+
+    def http_timeout(self):
+        return self.remaining()
+
+    def overpass_timeout(self):
+        """The [timeout:] for an Overpass query in whole seconds, leaving time
+        for transferring the result."""
+        seconds = math.floor(self.remaining() - OVERPASS_TIMEOUT_MARGIN_SECONDS)
+        if seconds < 1:
+            raise DeadlineExceeded(
+                f"Deadline of {self.seconds} s leaves no time for an Overpass query."
+            )
+        return seconds
+
+    def overpass_settings(self):
+        """Settings for the QL header besides the timeout."""
+        if self.overpass_maxsize is None:
+            return {}
+        return {"maxsize": self.overpass_maxsize}
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+def resolve_deadline(deadline=None):
+    """Return deadline if given, otherwise the current one, if any."""
+    return deadline if deadline is not None else _current_deadline.get()
+
+
+@contextlib.contextmanager
+def deadline_scope(deadline):
+    """Make deadline the current deadline within the block. None keeps the
+    current one."""
+    if deadline is None:
+        yield _current_deadline.get()
+        return
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
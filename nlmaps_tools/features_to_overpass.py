@@ -1,17 +1,19 @@
-from copy import deepcopy
 import logging
-from typing import Optional, Any, Iterator
-
-from OSMPythonTools.nominatim import NominatimResult
+from typing import Optional, Any, Iterator, TYPE_CHECKING
 
 from nlmaps_tools.answer_mrl import (
     add_name_tags,
     canonicalize_nwr_features,
+    replace_features,
     transform_features,
     nominatim_query,
-    ENV,
+    get_overpass_environment,
     nwr_nominatim_lookup,
 )
+from nlmaps_tools.gazetteer import get_area_id, get_gazetteer
+from nlmaps_tools.metrics import count_cache_lookup, timed
+from nlmaps_tools.tracing import traced
+from nlmaps_tools.tag_selectivity import order_nwr_features_by_selectivity
 
 Will2021RawFeatures = dict
 Will2021CanonicalFeatures = dict
@@ -19,6 +21,16 @@ Will2021FeaturesAfterAreaLookup = dict
 Will2021FeaturesAfterNwrNameLookup = dict
 OverpassQuery = str
 
+# [timeout:] in seconds for a single query, the default of OSMPythonTools.
+OVERPASS_QUERY_TIMEOUT = 25
+# Upper limit of the [timeout:] of a combined query, Overpass' default.
+MAX_COMBINED_OVERPASS_TIMEOUT = 180
+
+if TYPE_CHECKING:
+    from OSMPythonTools.nominatim import NominatimResult
+
+    from nlmaps_tools.deadline import Deadline
+
 
 class OSMArea:
     def __init__(self, dct: dict, id: int) -> None:
@@ -44,7 +56,7 @@ class OSMArea:
         return f"OSMArea(id={self.id!r}, _dct={self._dct!r})"
 
 
-def get_first_area(nominatim_result: NominatimResult) -> Optional[OSMArea]:
+def get_first_area(nominatim_result: "NominatimResult") -> Optional[OSMArea]:
     for d in nominatim_result._json:
         if "osm_type" in d and d["osm_type"] in ["relation", "way"] and "osm_id" in d:
             magic_number = 3600000000 if d["osm_type"] == "relation" else 2400000000
@@ -54,10 +66,33 @@ def get_first_area(nominatim_result: NominatimResult) -> Optional[OSMArea]:
     return None
 
 
-def nominatim_find_area(features: Will2021CanonicalFeatures) -> Optional[OSMArea]:
+def gazetteer_find_area(area_name: str) -> Optional[OSMArea]:
+    gazetteer = get_gazetteer()
+    if gazetteer is None:
+        return None
+    entry = gazetteer.lookup(area_name)
+    count_cache_lookup("gazetteer", entry is not None)
+    if entry is None:
+        return None
+    return OSMArea(dct=entry, id=get_area_id(entry))
+
+
+@timed("area_lookup")
+@traced("nominatim_find_area")
+def nominatim_find_area(
+    features: Will2021CanonicalFeatures, deadline: Optional["Deadline"] = None
+) -> Optional[OSMArea]:
     area_name = features.get("area")
     if area_name:
-        n_result = nominatim_query(area_name)
+        area = gazetteer_find_area(area_name)
+        if area:
+            logging.info(
+                "Gazetteer lookup for area {!r} yielded area ID {}.".format(
+                    area_name, area.id
+                )
+            )
+            return area
+        n_result = nominatim_query(area_name, deadline=deadline)
         area = get_first_area(n_result)
         if area:
             logging.info(
@@ -72,23 +107,80 @@ def nominatim_find_area(features: Will2021CanonicalFeatures) -> Optional[OSMArea
     return None
 
 
+@timed("canonicalize")
+@traced("canonicalize_features")
 def canonicalize_features(features: Will2021RawFeatures) -> Will2021CanonicalFeatures:
     features = transform_features(features, add_name_tags)
     features = transform_features(features, canonicalize_nwr_features)
     return features
 
 
+@timed("plan")
+@traced("plan_nwr_chains")
+def plan_nwr_chains(
+    features: Will2021FeaturesAfterNwrNameLookup,
+) -> Will2021FeaturesAfterNwrNameLookup:
+    # Evaluate the rarest tag of each nwr chain first to keep the intermediate
+    # sets small.
+    return transform_features(features, order_nwr_features_by_selectivity)
+
+
+@timed("render")
+@traced("render_simple_overpass_query")
 def render_simple_overpass_query(
     features: Will2021FeaturesAfterNwrNameLookup,
 ) -> OverpassQuery:
     template_name = features["query_type"] + ".jinja2"
-    template = ENV.get_template(template_name)
+    template = get_overpass_environment().get_template(template_name)
     ql = template.render(features=features)
     return ql
 
 
+def get_simple_features(
+    features: Will2021FeaturesAfterNwrNameLookup,
+) -> list[Will2021FeaturesAfterNwrNameLookup]:
+    """Return the in_query and around_query features a query consists of."""
+    if features["query_type"] == "dist":
+        return list(features["sub"])
+    return [features]
+
+
+@timed("render")
+@traced("render_combined_overpass_query")
+def render_combined_overpass_query(
+    features_list: list[Will2021FeaturesAfterNwrNameLookup],
+) -> OverpassQuery:
+    """Render several queries into a single Overpass QL script.
+
+    The output of each simple query, i.e. of each sub query for dist, is
+    followed by a query_separator element, which
+    answer_overpass.split_combined_overpass_result uses to split the response.
+    Consecutive queries in the same area share one area statement, so sort
+    features_list by area to make the most of it.
+    """
+    queries = [
+        simple_features
+        for features in features_list
+        for simple_features in get_simple_features(features)
+    ]
+    template = get_overpass_environment().get_template("combined_query.jinja2")
+    return template.render(queries=queries)
+
+
+def combined_overpass_timeout(number_of_queries: int) -> int:
+    """The [timeout:] for a combined query of number_of_queries simple
+    queries, which Overpass runs one after the other."""
+    return min(
+        OVERPASS_QUERY_TIMEOUT * number_of_queries, MAX_COMBINED_OVERPASS_TIMEOUT
+    )
+
+
+@timed("name_lookup")
+@traced("nominatim_replace_names_in_nwrs")
 def nominatim_replace_names_in_nwrs(
-    features: Will2021FeaturesAfterAreaLookup, area: Optional[OSMArea]
+    features: Will2021FeaturesAfterAreaLookup,
+    area: Optional[OSMArea],
+    deadline: Optional["Deadline"] = None,
 ) -> Will2021FeaturesAfterNwrNameLookup:
     if area:
         bbox = area["boundingbox"]
@@ -98,18 +190,20 @@ def nominatim_replace_names_in_nwrs(
     else:
         bbox = None
 
-    features = deepcopy(features)
-
     center_nwr = features.get("center_nwr")
     target_nwr = features.get("target_nwr")
     if center_nwr:
-        new_center_nwr, _ = nwr_nominatim_lookup(center_nwr, bbox=bbox)
+        new_center_nwr, _ = nwr_nominatim_lookup(
+            center_nwr, bbox=bbox, deadline=deadline
+        )
         if new_center_nwr:
-            features["center_nwr"] = new_center_nwr
+            return replace_features(features, {"center_nwr": new_center_nwr})
     elif target_nwr:
-        new_target_nwr, _ = nwr_nominatim_lookup(target_nwr, bbox=bbox)
+        new_target_nwr, _ = nwr_nominatim_lookup(
+            target_nwr, bbox=bbox, deadline=deadline
+        )
         if new_target_nwr:
-            features["target_nwr"] = new_target_nwr
+            return replace_features(features, {"target_nwr": new_target_nwr})
 
     return features
 
@@ -118,55 +212,87 @@ def add_area_id(
     features: Will2021CanonicalFeatures, area: Optional[OSMArea]
 ) -> Will2021FeaturesAfterAreaLookup:
     if area:
-        features["area_id"] = area.id
+        return replace_features(features, {"area_id": area.id})
     return features
 
 
-def make_overpass_query_from_simple_features(
-    features: Will2021RawFeatures,
-) -> tuple[Will2021FeaturesAfterNwrNameLookup, Optional[OSMArea], OverpassQuery]:
+def lookup_simple_features(
+    features: Will2021RawFeatures, deadline: Optional["Deadline"] = None
+) -> tuple[Will2021FeaturesAfterNwrNameLookup, Optional[OSMArea]]:
     features = canonicalize_features(features)
     logging.info(f"Canonicalized features to {features}.")
 
-    area = nominatim_find_area(features)
+    area = nominatim_find_area(features, deadline=deadline)
     features = add_area_id(features, area)
     logging.info(f"Retrieved area {area}.")
 
-    features = nominatim_replace_names_in_nwrs(features, area)
+    features = nominatim_replace_names_in_nwrs(features, area, deadline=deadline)
 
     logging.info(f"Replaced names in nwr operators, resulting in {features}.")
+    features = plan_nwr_chains(features)
+
+    return features, area
+
+
+def make_overpass_query_from_simple_features(
+    features: Will2021RawFeatures, deadline: Optional["Deadline"] = None
+) -> tuple[Will2021FeaturesAfterNwrNameLookup, Optional[OSMArea], OverpassQuery]:
+    features, area = lookup_simple_features(features, deadline=deadline)
     overpass_query = render_simple_overpass_query(features)
 
     return features, area, overpass_query
 
 
+def lookup_features(
+    features: Will2021RawFeatures, deadline: Optional["Deadline"] = None
+) -> tuple[Will2021FeaturesAfterNwrNameLookup, list[Optional[OSMArea]]]:
+    """Like make_overpass_queries_from_features, without rendering the
+    queries."""
+    if features["query_type"] in ["around_query", "in_query"]:
+        features, area = lookup_simple_features(features, deadline=deadline)
+        return features, [area]
+
+    if features["query_type"] == "dist" and len(features["sub"]) in [1, 2]:
+        sub_features_list = []
+        areas = []
+        for sub_features in features["sub"]:
+            sub_features, area = lookup_simple_features(sub_features, deadline=deadline)
+            sub_features_list.append(sub_features)
+            areas.append(area)
+        features = replace_features(features, {"sub": sub_features_list})
+        return features, areas
+
+    raise ValueError(f'Unsupported query_type {features["query_type"]}')
+
+
 def make_overpass_queries_from_features(
-    features: Will2021RawFeatures,
+    features: Will2021RawFeatures, deadline: Optional["Deadline"] = None
 ) -> tuple[
     Will2021FeaturesAfterNwrNameLookup, list[Optional[OSMArea]], list[OverpassQuery]
 ]:
-    if features["query_type"] in ["around_query", "in_query"]:
-        features, area, overpass_query = make_overpass_query_from_simple_features(
-            features
-        )
-        return features, [area], [overpass_query]
+    features, areas = lookup_features(features, deadline=deadline)
+    overpass_queries = [
+        render_simple_overpass_query(simple_features)
+        for simple_features in get_simple_features(features)
+    ]
+    return features, areas, overpass_queries
 
-    if features["query_type"] == "dist" and len(features["sub"]) == 1:
-        sub_features, area, overpass_query = make_overpass_query_from_simple_features(
-            features["sub"][0]
-        )
-        features["sub"][0] = sub_features
-        return features, [area], [overpass_query]
 
-    if features["query_type"] == "dist" and len(features["sub"]) == 2:
-        sub_features_0, area_0, overpass_query_0 = make_overpass_query_from_simple_features(
-            features["sub"][0]
-        )
-        sub_features_1, area_1, overpass_query_1 = make_overpass_query_from_simple_features(
-            features["sub"][1]
-        )
-        features["sub"][0] = sub_features_0
-        features["sub"][1] = sub_features_1
-        return features, [area_0, area_1], [overpass_query_0, overpass_query_1]
-
-    raise ValueError(f'Unsupported query_type {features["query_type"]}')
+def make_combined_overpass_query(
+    features_list: list[Will2021RawFeatures], deadline: Optional["Deadline"] = None
+) -> tuple[
+    list[Will2021FeaturesAfterNwrNameLookup],
+    list[list[Optional[OSMArea]]],
+    OverpassQuery,
+]:
+    """Like make_overpass_queries_from_features for several queries, but with
+    a single Overpass query for all of them. Use combined_overpass_timeout
+    for its [timeout:]."""
+    new_features_list = []
+    areas_list = []
+    for features in features_list:
+        features, areas = lookup_features(features, deadline=deadline)
+        new_features_list.append(features)
+        areas_list.append(areas)
+    overpass_query = render_combined_overpass_query(new_features_list)
+    return new_features_list, areas_list, overpass_query
@@ -0,0 +1,326 @@
+"""An offline gazetteer of area names, consulted before Nominatim.
+
+The gazetteer is a single file with an open addressing hash table from
+normalised area names to the area's OSM type and ID, bounding box and
+importance. It is memory-mapped, so worker processes share the pages, and a
+lookup only touches one or two slots of the table. Names looked up before
+are answered from a small per-process memo.
+
+Build it from areas harvested from Overpass or from cached Nominatim answers
+to the area names in a file, one per line:
+
+    python -m nlmaps_tools.gazetteer areas.gaz --harvest \
+        --nominatim-cache cache/ --area-names names.txt
+
+and set NLMAPS_GAZETTEER=areas.gaz to use it.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+from pathlib import Path
+import struct
+import unicodedata
+import urllib.parse
+import zlib
+
+from nlmaps_tools.answer_mrl import lazy_singleton
+
+MAGIC = b"NLMGAZ01"
+# magic, number of slots, number of entries
+HEADER = struct.Struct("<8sII")
+# hash of the normalised name, offset of the entry + 1 or 0 for empty slots
+SLOT = struct.Struct("<QI")
+# osm_id, importance, osm_type, length of name, length of bounding box
+ENTRY = struct.Struct("<qdBHH")
+
+OSM_TYPES = ("relation", "way")
+MEMO_SIZE = 4096
+AREA_ID_OFFSETS = {"relation": 3600000000, "way": 2400000000}
+
+
+def normalize_name(name):
+    """Normalise an area name for lookups.
+
+    >>> normalize_name("  Frankfurt   am MAIN ")
+    'frankfurt am main'
+    """
+    if not name.isascii():
+        name = unicodedata.normalize("NFKC", name)
+    return " ".join(name.casefold().split())
+
+
+def name_hash(name_bytes):
+    """A 64 bit hash of the UTF-8 encoded normalised name that is stable
+    across processes."""
+    # Two CRC32s with different seeds are much faster than a cryptographic hash
+    # and good enough for a hash table.
+    h = zlib.crc32(name_bytes) | zlib.crc32(name_bytes, 0x9E3779B9) << 32
+    # 0 marks empty slots.
+    return h or 1
+
+
+class Gazetteer:
+    """Read-only view of a gazetteer file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._slot_count, self._entry_count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a gazetteer file")
+        self._mask = self._slot_count - 1
+        # Most traffic asks for a few areas, which skip the table with this.
+        self._memo = {}
+
+    def __len__(self):
+        return self._entry_count
+
+    def close(self):
+        self._mmap.close()
+
+    def lookup(self, name):
+        """Return a dict like a Nominatim result entry for the area name, or
+        None if the name is not in the gazetteer."""
+        try:
+            entry = self._memo[name]
+        except KeyError:
+            entry = self._lookup(name)
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            self._memo[name] = entry
+        if entry is None:
+            return None
+        return {**entry, "boundingbox": list(entry["boundingbox"])}
+
+    def _lookup(self, name):
+        name_bytes = normalize_name(name).encode("utf-8")
+        h = name_hash(name_bytes)
+        slot = h & self._mask
+        while True:
+            slot_hash, offset = SLOT.unpack_from(
+                self._mmap, HEADER.size + slot * SLOT.size
+            )
+            if not offset:
+                return None
+            if slot_hash == h:
+                entry = self._read_entry(offset - 1, name_bytes)
+                if entry is not None:
+                    return entry
+            slot = (slot + 1) & self._mask
+
+    def _read_entry(self, offset, name_bytes):
+        osm_id, importance, osm_type, name_len, bbox_len = ENTRY.unpack_from(
+            self._mmap, offset
+        )
+        start = offset + ENTRY.size
+        if self._mmap[start : start + name_len] != name_bytes:
+            return None
+        bbox = self._mmap[start + name_len : start + name_len + bbox_len]
+        return {
+            "osm_type": OSM_TYPES[osm_type],
+            "osm_id": osm_id,
+            "boundingbox": tuple(bbox.decode("ascii").split(",")),
+            "importance": importance,
+        }
+
+
+def get_area_id(entry):
+    return AREA_ID_OFFSETS[entry["osm_type"]] + int(entry["osm_id"])
+
+
+def write_gazetteer(path, entries):
+    """Write a gazetteer file.
+
+    :param entries: Dicts with the keys name, osm_type, osm_id, boundingbox
+        and importance. If several entries have the same normalised name, the
+        most important one is kept.
+    """
+    best = {}
+    for entry in entries:
+        normalized_name = normalize_name(entry["name"])
+        if not normalized_name or entry["osm_type"] not in OSM_TYPES:
+            continue
+        current = best.get(normalized_name)
+        if current is None or entry["importance"] > current["importance"]:
+            best[normalized_name] = entry
+
+    slot_count = 1
+    while slot_count < 2 * len(best):
+        slot_count *= 2
+    slots = [(0, 0)] * slot_count
+    entries_blob = bytearray()
+    entries_start = HEADER.size + slot_count * SLOT.size
+    for normalized_name, entry in sorted(best.items()):
+        name_bytes = normalized_name.encode("utf-8")
+        bbox_bytes = ",".join(str(coord) for coord in entry["boundingbox"]).encode(
+            "ascii"
+        )
+        offset = entries_start + len(entries_blob)
+        entries_blob += ENTRY.pack(
+            int(entry["osm_id"]),
+            float(entry["importance"]),
+            OSM_TYPES.index(entry["osm_type"]),
+            len(name_bytes),
+            len(bbox_bytes),
+        )
+        entries_blob += name_bytes + bbox_bytes
+
+        h = name_hash(name_bytes)
+        slot = h & (slot_count - 1)
+        while slots[slot][1]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = (h, offset + 1)
+
+    tmp_path = Path(str(path) + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, slot_count, len(best)))
+        for slot in slots:
+            f.write(SLOT.pack(*slot))
+        f.write(entries_blob)
+    # Replace atomically, so processes that have the old file mapped keep
+    # reading consistent data.
+    os.replace(tmp_path, path)
+    return len(best)
+
+
+def nominatim_cache_file(cache_dir, query):
+    """The file in which OSMPythonTools caches the answer to the Nominatim
+    search for query, as sent by answer_mrl.nominatim_query."""
+    # Named like in OSMPythonTools.internal.cacheObject.
+    key = "search????" + urllib.parse.urlencode([("q", query)])
+    return (
+        Path(cache_dir) / f"nominatim-{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+    )
+
+
+def entries_from_nominatim_cache(cache_dir, names):
+    """Yield gazetteer entries for the area names from the JSON cache of
+    OSMPythonTools.
+
+    Every name is indexed with the first area of the cached answer to the
+    search for it, which is the area nominatim_find_area picks, and with
+    Nominatim's importance of that area. Names without a cached answer are
+    skipped.
+    """
+    for name in names:
+        cache_file = nominatim_cache_file(cache_dir, name)
+        if not cache_file.is_file():
+            continue
+        with open(cache_file) as f:
+            response = json.load(f).get("response") or []
+        for d in response:
+            if d.get("osm_type") in OSM_TYPES and "osm_id" in d:
+                yield {
+                    "name": name,
+                    "osm_type": d["osm_type"],
+                    "osm_id": d["osm_id"],
+                    "boundingbox": d["boundingbox"],
+                    "importance": float(d.get("importance", 0.0)),
+                }
+                break
+
+
+def entries_from_overpass_elements(elements):
+    """Yield gazetteer entries from relations harvested with
+    retrieve_locations.AREA_TEMPLATE."""
+    for element in elements:
+        bounds = element.get("bounds")
+        if element["type"] != "relation" or not bounds:
+            continue
+        try:
+            admin_level = int(element["tags"].get("admin_level", 12))
+        except ValueError:
+            admin_level = 12
+        yield {
+            "name": element["tags"]["name"],
+            "osm_type": "relation",
+            "osm_id": element["id"],
+            "boundingbox": [
+                bounds["minlat"],
+                bounds["maxlat"],
+                bounds["minlon"],
+                bounds["maxlon"],
+            ],
+            # Without an importance, prefer the higher administrative level.
+            # Only compared with other harvested areas, see prefer_nominatim.
+            "importance": 1.0 / (1 + admin_level),
+        }
+
+
+def prefer_nominatim(harvested_entries, nominatim_entries):
+    """Combine the entries, dropping harvested areas with the name of an area
+    Nominatim answered, so that the gazetteer answers like Nominatim."""
+    answered = {normalize_name(entry["name"]) for entry in nominatim_entries}
+    return [
+        entry
+        for entry in harvested_entries
+        if normalize_name(entry["name"]) not in answered
+    ] + list(nominatim_entries)
+
+
+def load_default_gazetteer():
+    path = os.environ.get("NLMAPS_GAZETTEER")
+    if not path:
+        return None
+    try:
+        return Gazetteer(path)
+    except (OSError, ValueError):
+        logging.exception(f"Could not load the gazetteer {path}.")
+        return None
+
+
+get_gazetteer = lazy_singleton(load_default_gazetteer)
+
+
+def main(output_file, harvest=False, nominatim_cache=None, area_names=None):
+    harvested_entries = []
+    if harvest:
+        from nlmaps_tools.retrieve_locations import AREA_TEMPLATE, get_elements
+
+        harvested_entries = list(
+            entries_from_overpass_elements(get_elements(AREA_TEMPLATE))
+        )
+    nominatim_entries = []
+    if nominatim_cache:
+        names = [entry["name"] for entry in harvested_entries]
+        if area_names:
+            with open(area_names) as f:
+                names.extend(line.strip() for line in f if line.strip())
+        nominatim_entries = list(
+            entries_from_nominatim_cache(nominatim_cache, dict.fromkeys(names))
+        )
+    entries = prefer_nominatim(harvested_entries, nominatim_entries)
+    count = write_gazetteer(output_file, entries)
+    print(f"Wrote {count} areas to {output_file}.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build an area gazetteer file")
+    parser.add_argument("output_file", help="Gazetteer file to write")
+    parser.add_argument(
+        "--harvest",
+        action="store_true",
+        default=False,
+        help="Harvest areas from Overpass in the default bounding boxes",
+    )
+    parser.add_argument(
+        "--nominatim-cache",
+        help=(
+            "Directory with cached Nominatim answers of OSMPythonTools to look up"
+            " the harvested areas and --area-names in"
+        ),
+    )
+    parser.add_argument(
+        "--area-names",
+        help="File with area names to look up in --nominatim-cache, one per line",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -1,7 +1,6 @@
 import os
 
-import jinja2
-
+from nlmaps_tools.answer_mrl import lazy_singleton
 from nlmaps_tools.parse_mrl import Symbol
 
 
@@ -50,16 +49,25 @@ def open_paren_after_functor(nested_tuple, escape=True):
     return ",".join(parts)
 
 
-ENV = jinja2.Environment(
-    loader=jinja2.PackageLoader("nlmaps_tools", "mrl_templates"),
-    trim_blocks=True,
-    lstrip_blocks=True,
-    autoescape=False,
-)
+def make_mrl_environment(precompiled=True):
+    from nlmaps_tools.templates import make_environment
+
+    env = make_environment("mrl_templates", precompiled=precompiled)
+    env.globals["render_nwr"] = render_nwr
+    env.globals["open_paren_after_functor"] = open_paren_after_functor
+    env.globals["quote"] = quote
+    return env
+
+
+get_mrl_environment = lazy_singleton(make_mrl_environment)
+
 
-ENV.globals["render_nwr"] = render_nwr
-ENV.globals["open_paren_after_functor"] = open_paren_after_functor
-ENV.globals["quote"] = quote
+def __getattr__(name):
+    # The environment used to be created at import time and is still
+    # available under its old name.
+    if name == "ENV":
+        return get_mrl_environment()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def generate_from_features(features, escape=True):
@@ -75,7 +83,7 @@ def generate_from_features(features, escape=True):
     "query(area(keyval('name','Heidelberg')),nwr(keyval('amenity','restaurant')),qtype(latlong,nodup(findkey('cuisine'))))"
 
     """
-    template = ENV.get_template(features["query_type"] + ".jinja2")
+    template = get_mrl_environment().get_template(features["query_type"] + ".jinja2")
     return template.render(features=features, escape=escape)
 
 
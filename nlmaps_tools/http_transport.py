@@ -0,0 +1,162 @@
+"""Pooled keep-alive HTTP transport for the Nominatim and Overpass clients.
+
+OSMPythonTools opens a new connection for every request. HttpTransport keeps
+up to pool_size connections per host open for reuse, asks for gzip encoded
+responses and decompresses them while reading. It counts requests, opened
+connections and bytes per host, so that connection reuse and the saving of
+compression can be checked with stats(). The pool size defaults to
+NLMAPS_HTTP_POOL_SIZE, if set, or 4.
+
+    transport = HttpTransport(pool_size=4)
+    text = transport.request("POST", url, data={"data": ql}, timeout=30)
+    transport.stats()
+    # {"overpass-api.de": {"requests": 12, "connections": 1, "reused": 11,
+    #                      "received_bytes": 81234, "decoded_bytes": 612345}}
+"""
+import os
+import threading
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from nlmaps_tools.metrics import REGISTRY
+
+# Connections kept open per host, e.g. for concurrent queries.
+DEFAULT_POOL_SIZE = int(os.environ.get("NLMAPS_HTTP_POOL_SIZE", 4))
+# Hosts for which connections are kept open.
+MAX_HOSTS = 16
+CHUNK_SIZE = 64 * 1024
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "nlmaps_http_requests_total", "HTTP requests per host.", ["host"]
+)
+HTTP_CONNECTIONS = REGISTRY.counter(
+    "nlmaps_http_connections_total", "HTTP connections opened per host.", ["host"]
+)
+HTTP_RECEIVED_BYTES = REGISTRY.counter(
+    "nlmaps_http_received_bytes_total",
+    "Response bytes received per host before decompression.",
+    ["host"],
+)
+
+
+class HttpStatusError(Exception):
+    def __init__(self, msg, code):
+        super().__init__(msg, code)
+        self.code = code
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter calling on_new_connection(host) for every opened connection."""
+
+    def __init__(self, on_new_connection, **kwargs):
+        self._on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_connection = self._on_new_connection
+
+        def counting(pool_class):
+            class CountingConnectionPool(pool_class):
+                def _new_conn(self):
+                    on_new_connection(self.host)
+                    return super()._new_conn()
+
+            return CountingConnectionPool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: counting(pool_class)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+
+class HttpTransport:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        self.pool_size = pool_size
+        self._session = requests.Session()
+        self._adapter = _CountingAdapter(
+            self._count_connection, pool_connections=MAX_HOSTS, pool_maxsize=pool_size
+        )
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+        self._session.headers["Accept-Encoding"] = "gzip"
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def request(
+        self, method, url, data=None, headers=None, timeout=None, on_chunk=None
+    ):
+        """Send a request and return the decoded response body as text.
+
+        :param on_chunk: Called without arguments after every chunk read,
+            e.g. to abort a long download by raising.
+        :raises HttpStatusError: For responses with an error status.
+        :raises requests.RequestException: For connection problems and timeouts.
+        """
+        host = urllib.parse.urlsplit(url).hostname
+        response = self._session.request(
+            method, url, data=data, headers=headers, timeout=timeout, stream=True
+        )
+        try:
+            if response.status_code >= 400:
+                raise HttpStatusError(
+                    f"HTTP Error {response.status_code}: {response.reason}",
+                    response.status_code,
+                )
+            chunks = []
+            for chunk in response.iter_content(CHUNK_SIZE):
+                chunks.append(chunk)
+                if on_chunk is not None:
+                    on_chunk()
+            body = b"".join(chunks)
+            encoding = response.encoding or "utf-8"
+        finally:
+            received_bytes = response.raw.tell()
+            response.close()
+
+        with self._lock:
+            host_stats = self._host_stats(host)
+            host_stats["requests"] += 1
+            host_stats["received_bytes"] += received_bytes
+            host_stats["decoded_bytes"] += len(body)
+        HTTP_REQUESTS.labels(host).inc()
+        HTTP_RECEIVED_BYTES.labels(host).inc(received_bytes)
+        return body.decode(encoding)
+
+    def _count_connection(self, host):
+        with self._lock:
+            self._host_stats(host)["connections"] += 1
+        HTTP_CONNECTIONS.labels(host).inc()
+
+    def _host_stats(self, host):
+        try:
+            return self._stats[host]
+        except KeyError:
+            return self._stats.setdefault(
+                host,
+                {
+                    "requests": 0,
+                    "connections": 0,
+                    "received_bytes": 0,
+                    "decoded_bytes": 0,
+                },
+            )
+
+    def stats(self):
+        """Requests, opened and reused connections and bytes per host."""
+        with self._lock:
+            return {
+                host: {
+                    "requests": host_stats["requests"],
+                    "connections": host_stats["connections"],
+                    "reused": host_stats["requests"] - host_stats["connections"],
+                    "received_bytes": host_stats["received_bytes"],
+                    "decoded_bytes": host_stats["decoded_bytes"],
+                }
+                for host, host_stats in self._stats.items()
+            }
+
+    def close(self):
+        self._session.close()
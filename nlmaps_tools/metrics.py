@@ -0,0 +1,304 @@
+"""Latency histograms, counters and gauges in Prometheus text format.
+
+The answering pipeline records the time spent per stage, the requests to
+Nominatim and Overpass, their errors by HTTP status code, hits of the local
+lookups and the state of every Overpass endpoint. render_prometheus returns
+everything in the Prometheus text exposition format, and serve_metrics
+exposes it on /metrics from a background thread:
+
+    from nlmaps_tools.metrics import serve_metrics
+    serve_metrics(9464)
+"""
+import bisect
+import contextlib
+import functools
+import math
+import threading
+import time
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (
+            name,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        try:
+            return self._children[values]
+        except KeyError:
+            with self._lock:
+                return self._children.setdefault(values, self._make_child())
+
+    def clear(self):
+        with self._lock:
+            self._children.clear()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child):
+        labels = _format_labels(self.labelnames, values)
+        return [f"{self.name}{labels} {_format_value(child.value)}"]
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _make_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _make_child(self):
+        return _Value()
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+
+    @contextlib.contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _make_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(
+                self.labelnames, values, [("le", _format_value(bound))]
+            )
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "nlmaps_stage_seconds", "Time spent per answering stage.", ["stage"]
+)
+REQUESTS = REGISTRY.counter(
+    "nlmaps_requests_total", "Requests to external services.", ["service"]
+)
+ERRORS = REGISTRY.counter(
+    "nlmaps_errors_total",
+    "Failed requests to external services by HTTP status code.",
+    ["service", "code"],
+)
+CACHE_HITS = REGISTRY.counter(
+    "nlmaps_cache_hits_total", "Lookups answered by a local cache or index.", ["cache"]
+)
+CACHE_MISSES = REGISTRY.counter(
+    "nlmaps_cache_misses_total",
+    "Lookups not answered by a local cache or index.",
+    ["cache"],
+)
+ENDPOINT_IN_FLIGHT = REGISTRY.gauge(
+    "nlmaps_overpass_in_flight",
+    "Running queries per Overpass endpoint.",
+    ["endpoint"],
+)
+ENDPOINT_LAST_SECONDS = REGISTRY.gauge(
+    "nlmaps_overpass_last_query_seconds",
+    "Duration of the last query per Overpass endpoint.",
+    ["endpoint"],
+)
+ENDPOINT_UP = REGISTRY.gauge(
+    "nlmaps_overpass_up",
+    "Whether the last query to an Overpass endpoint succeeded.",
+    ["endpoint"],
+)
+
+
+def timed(stage):
+    """Decorator recording the duration of every call in STAGE_SECONDS."""
+    histogram = STAGE_SECONDS.labels(stage)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def count_cache_lookup(cache, hit):
+    (CACHE_HITS if hit else CACHE_MISSES).labels(cache).inc()
+
+
+def error_code(exc):
+    """The HTTP status code of an exception, or its class name."""
+    code = getattr(exc, "code", None)
+    return str(code) if isinstance(code, int) else type(exc).__name__
+
+
+def render_prometheus(registry=REGISTRY):
+    return registry.render()
+
+
+def serve_metrics(port, host="", registry=REGISTRY):
+    """Serve the metrics on http://host:port/metrics from a daemon thread.
+
+    :return: The server. Call its shutdown method to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus(registry).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,142 @@
+"""Nominatim and Overpass clients of OSMPythonTools on a pooled HTTP transport.
+
+OSMPythonTools downloads with a new connection per request and without a
+timeout. These subclasses replace its download step with one that goes
+through an HttpTransport, which keeps connections open and receives gzip
+compressed responses, and that times out when the current deadline expires.
+Otherwise they behave exactly the same, including the caching.
+"""
+import datetime as dt
+import time
+import urllib.request
+
+import OSMPythonTools
+from OSMPythonTools.internal.cacheObject import CacheObject
+from OSMPythonTools.nominatim import Nominatim
+from OSMPythonTools.overpass import Overpass
+import requests
+import ujson
+
+from nlmaps_tools.deadline import DeadlineExceeded, current_deadline
+from nlmaps_tools.http_transport import HttpStatusError, HttpTransport
+
+
+if not hasattr(CacheObject, "_CacheObject__query"):
+    raise ImportError(
+        f"OSMPythonTools {OSMPythonTools.pkgVersion} is not supported,"
+        " its CacheObject has no __query method."
+    )
+
+
+class TransportMixin:
+    def __init__(self, *args, transport=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._transport = transport or HttpTransport()
+
+    def _download(self, url, data=None, action=None):
+        deadline = current_deadline()
+        action = action or f"downloading from {self._endpoint}"
+        if deadline is not None:
+            deadline.check(action)
+            timeout = deadline.http_timeout()
+            on_chunk = lambda: deadline.check(action)
+        else:
+            timeout = on_chunk = None
+
+        headers = {"User-Agent": self._userAgent()}
+        if data is not None:
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            return self._transport.request(
+                "POST" if data is not None else "GET",
+                url,
+                data=data,
+                headers=headers,
+                timeout=timeout,
+                on_chunk=on_chunk,
+            )
+        except requests.RequestException as err:
+            if deadline is not None and (
+                isinstance(err, requests.Timeout) or deadline.expired()
+            ):
+                raise DeadlineExceeded(
+                    f"Deadline of {deadline.seconds} s exceeded while {action}."
+                ) from err
+            raise
+
+    # CacheObject.query calls its private __query method, which Python
+    # mangles to this name.
+    def _CacheObject__query(self, requestString, params):
+        request = self._queryRequest(self._endpoint, requestString, params=params)
+        if not isinstance(request, urllib.request.Request):
+            request = urllib.request.Request(request)
+
+        try:
+            resp = self._download(request.full_url, data=request.data)
+        except HttpStatusError as err:
+            msg = "The requested data could not be downloaded. " + str(err.args[0])
+            OSMPythonTools.logger.exception(msg)
+            raise HttpStatusError(msg, err.code) from err
+        except requests.RequestException as err:
+            msg = "The requested data could not be downloaded.  Please check whether your internet connection is working."
+            OSMPythonTools.logger.exception(msg)
+            raise Exception(msg, err)
+        return {
+            "version": "1.0",
+            "response": ujson.loads(resp) if self._CacheObject__jsonResult else resp,
+            "timestamp": dt.datetime.now().isoformat(),
+        }
+
+
+class PooledNominatim(TransportMixin, Nominatim):
+    pass
+
+
+class PooledOverpass(TransportMixin, Overpass):
+    def _waitForReady(self):
+        """Wait until the endpoint has a free slot, as Overpass does, but ask
+        for the status on a pooled connection."""
+        action = f"waiting for a slot at {self._endpoint}"
+        have_waited = False
+        while True:
+            try:
+                status_lines = self._download(
+                    self._endpoint + "status", action=action
+                ).split("\n")
+            except DeadlineExceeded:
+                raise
+            except Exception:
+                raise Exception(
+                    f"[{self._prefix}] could not fetch or interpret status of the endpoint"
+                )
+            current_time = None
+            wait_to = None
+            for line in status_lines:
+                if line == "Rate limit: 0" or line.endswith("slots available now."):
+                    return True
+                if line.startswith("Current time:"):
+                    current_time = dt.datetime.strptime(
+                        line.split(" ")[-1], "%Y-%m-%dT%H:%M:%SZ"
+                    )
+                if line.startswith("Slot available after:"):
+                    wait_to = dt.datetime.strptime(
+                        line.split(": ")[-1].split(",")[0], "%Y-%m-%dT%H:%M:%SZ"
+                    )
+                if current_time is not None and wait_to is not None:
+                    break
+            if current_time is None or wait_to is None:
+                # Like Overpass, ask again if the status names no slot.
+                continue
+            seconds = min((wait_to - current_time).total_seconds(), 10.0)
+            if seconds > 0:
+                deadline = current_deadline()
+                if deadline is not None and not deadline.can_afford(seconds):
+                    raise DeadlineExceeded(
+                        f"Deadline of {deadline.seconds} s exceeded while {action}."
+                    )
+                OSMPythonTools.logger.info(
+                    f"[{self._prefix}] waiting for {seconds} seconds"
+                    + (" more" if have_waited else "")
+                )
+                time.sleep(seconds)
+                have_waited = True
@@ -1,8 +1,25 @@
 import random
 import logging
+import threading
+import time
 import traceback
 
-from OSMPythonTools.overpass import Overpass
+from nlmaps_tools.deadline import (
+    MIN_ATTEMPT_SECONDS,
+    DeadlineExceeded,
+    deadline_scope,
+    resolve_deadline,
+)
+from nlmaps_tools.metrics import (
+    ENDPOINT_IN_FLIGHT,
+    ENDPOINT_LAST_SECONDS,
+    ENDPOINT_UP,
+    ERRORS,
+    REQUESTS,
+    STAGE_SECONDS,
+    error_code,
+)
+from nlmaps_tools.tracing import span
 
 DEFAULT_ENDPOINTS = (
     "https://lz4.overpass-api.de/api/",
@@ -14,33 +31,88 @@ DEFAULT_ENDPOINTS = (
 
 
 class OverpassRoundRobin:
-    def __init__(self, endpoints=DEFAULT_ENDPOINTS, **kwargs):
+    # Queries may run concurrently, e.g. from aprocess_request. The critical
+    # section is tiny, so all instances share one lock.
+    _instance_lock = threading.Lock()
+
+    def __init__(self, endpoints=DEFAULT_ENDPOINTS, pool_size=None, **kwargs):
+        """
+        :param pool_size: Connections kept open per endpoint. Default:
+            http_transport.DEFAULT_POOL_SIZE
+        """
+        from nlmaps_tools.http_transport import DEFAULT_POOL_SIZE, HttpTransport
+        from nlmaps_tools.osm_clients import PooledOverpass
+
+        self.transport = HttpTransport(pool_size=pool_size or DEFAULT_POOL_SIZE)
         self.overpass_instances = [
-            Overpass(endpoint=endpoint, **kwargs) for endpoint in endpoints
+            PooledOverpass(endpoint=endpoint, transport=self.transport, **kwargs)
+            for endpoint in endpoints
         ]
         self.current_instance_idx = random.randint(0, len(self.overpass_instances) - 1)
 
     def _get_instance(self):
-        instance = self.overpass_instances[self.current_instance_idx]
-        if self.current_instance_idx < len(self.overpass_instances) - 1:
-            self.current_instance_idx += 1
-        else:
-            self.current_instance_idx = 0
+        with self._instance_lock:
+            instance = self.overpass_instances[self.current_instance_idx]
+            if self.current_instance_idx < len(self.overpass_instances) - 1:
+                self.current_instance_idx += 1
+            else:
+                self.current_instance_idx = 0
         return instance
 
-    def query(self, *args, **kwargs):
+    def query(self, *args, deadline=None, **kwargs):
+        """Query the next endpoint and retry with the following one on errors.
+
+        With a deadline, given or current, the query gets a [timeout:] and
+        [maxsize:] fitting the remaining time, or the timeout given if that is
+        shorter, and a retry is only made if it can still finish in time.
+        """
+        deadline = resolve_deadline(deadline)
         tries = kwargs.pop("tries", 2)
+        timeout = kwargs.get("timeout")
+        attempt = 0
         while tries > 0:
             tries -= 1
+            attempt += 1
+            if deadline is not None:
+                if attempt > 1 and not deadline.can_afford(MIN_ATTEMPT_SECONDS):
+                    raise DeadlineExceeded(
+                        f"Deadline of {deadline.seconds} s leaves no time to retry"
+                        " the Overpass query."
+                    )
+                kwargs["timeout"] = deadline.overpass_timeout()
+                if timeout is not None:
+                    kwargs["timeout"] = min(kwargs["timeout"], timeout)
+                kwargs["settings"] = {
+                    **kwargs.get("settings", {}),
+                    **deadline.overpass_settings(),
+                }
             overpass = self._get_instance()
-            logging.info("Using Overpass at {}".format(overpass._endpoint))
+            endpoint = overpass._endpoint
+            logging.info("Using Overpass at {}".format(endpoint))
+            REQUESTS.labels("overpass").inc()
+            ENDPOINT_IN_FLIGHT.labels(endpoint).inc()
+            start = time.perf_counter()
             try:
-                result = overpass.query(*args, **kwargs)
+                with span(
+                    "overpass_attempt", endpoint=endpoint, attempt=attempt
+                ), deadline_scope(deadline):
+                    result = overpass.query(*args, **kwargs)
+                ENDPOINT_UP.labels(endpoint).set(1)
                 return result
+            except DeadlineExceeded:
+                ERRORS.labels("overpass", "DeadlineExceeded").inc()
+                raise
             except Exception as e:
-                logging.error("Error when querying {}:".format(overpass._endpoint))
+                ENDPOINT_UP.labels(endpoint).set(0)
+                ERRORS.labels("overpass", error_code(e)).inc()
+                logging.error("Error when querying {}:".format(endpoint))
                 logging.error(traceback.format_exc())
                 if tries > 0:
                     logging.info("Trying again.")
                 else:
                     raise e
+            finally:
+                seconds = time.perf_counter() - start
+                ENDPOINT_IN_FLIGHT.labels(endpoint).dec()
+                ENDPOINT_LAST_SECONDS.labels(endpoint).set(seconds)
+                STAGE_SECONDS.labels("overpass").observe(seconds)
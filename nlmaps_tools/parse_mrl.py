@@ -1,17 +1,185 @@
+from collections.abc import Mapping
+import hashlib
 import re
+import weakref
 
-import pyparsing as pp
+from nlmaps_tools.metrics import timed
+from nlmaps_tools.tracing import traced
+
+# pyparsing is imported where it is needed, so that importing this module for
+# Symbol or the helper functions stays cheap.
 
 
 class Symbol(str):
     """This is used for handling unquoted MRL literals like latlong or
-    count, and it is also used for numbers like 5000."""
+    count, and it is also used for numbers like 5000.
+
+    Symbols are interned, so there is only one Symbol per value as long as
+    it is in use. A Symbol never equals a plain str, but hashes like one.
+    """
+
+    __slots__ = ("__weakref__",)
+    # Weak, so that the numbers and names of all MRLs ever parsed are not
+    # kept alive.
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, value):
+        value = str(value)
+        try:
+            return cls._interned[value]
+        except KeyError:
+            return cls._interned.setdefault(value, super().__new__(cls, value))
 
     def __repr__(self):
         return f"Symbol({super().__repr__()})"
 
     def __eq__(self, other):
-        return isinstance(other, Symbol) and str(self) == str(other)
+        return self is other or (isinstance(other, Symbol) and str.__eq__(self, other))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = str.__hash__
+
+    def __reduce__(self):
+        return (Symbol, (str(self),))
+
+
+def freeze(value):
+    """Turn a feature value into an immutable, hashable equivalent.
+
+    Lists become tuples, sets become frozensets and dicts become
+    FrozenFeatures, recursively.
+    """
+    if isinstance(value, (str, int, float, type(None), FrozenFeatures)):
+        return value
+    if isinstance(value, Mapping):
+        return FrozenFeatures(value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(elm) for elm in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(elm) for elm in value)
+    raise ValueError("Unexpected type: {}".format(type(value)))
+
+
+def canonical_repr(value):
+    """Render a feature value as a string that does not depend on dict or set
+    ordering, list vs. tuple, or the interpreter’s hash seed."""
+    if isinstance(value, Symbol):
+        return "S" + repr(str(value))
+    if isinstance(value, (str, int, float, bool, type(None))):
+        return repr(value)
+    if isinstance(value, Mapping):
+        items = sorted((str(key), canonical_repr(val)) for key, val in value.items())
+        return "{" + ",".join(f"{key!r}:{val}" for key, val in items) + "}"
+    if isinstance(value, (set, frozenset)):
+        return "{" + ",".join(sorted(canonical_repr(elm) for elm in value)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "(" + ",".join(canonical_repr(elm) for elm in value) + ")"
+    raise ValueError("Unexpected type: {}".format(type(value)))
+
+
+def canonical_hash(value):
+    """A hash of a feature value that is stable across processes."""
+    return hashlib.sha256(canonical_repr(value).encode("utf-8")).hexdigest()
+
+
+class FrozenFeatures(Mapping):
+    """An immutable, hashable version of the features dict of a parse result.
+
+    It can be used wherever the features dict is read, e.g. as a cache key.
+    Lists and sets in the features are turned into tuples and frozensets, and
+    sub-features into FrozenFeatures.
+    """
+
+    KEYS = (
+        "query_type",
+        "area",
+        "area_id",
+        "cardinal_direction",
+        "center_nwr",
+        "target_nwr",
+        "maxdist",
+        "around_topx",
+        "qtype",
+        "deprecations",
+        "sub",
+        "for",
+        "unit",
+    )
+    _SLOTS = {key: "_" + key.replace("for", "for_") for key in KEYS}
+    __slots__ = (*_SLOTS.values(), "_extra", "_hash")
+
+    def __init__(self, features):
+        extra = []
+        for key, value in features.items():
+            if key in self._SLOTS:
+                object.__setattr__(self, self._SLOTS[key], freeze(value))
+            else:
+                extra.append((key, freeze(value)))
+        object.__setattr__(self, "_extra", tuple(extra))
+        object.__setattr__(self, "_hash", None)
+
+    def __getitem__(self, key):
+        slot = self._SLOTS.get(key)
+        if slot:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key) from None
+        for extra_key, value in self._extra:
+            if extra_key == key:
+                return value
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        slot = self._SLOTS.get(key)
+        if slot:
+            return hasattr(self, slot)
+        return any(extra_key == key for extra_key, _ in self._extra)
+
+    def __iter__(self):
+        for key, slot in self._SLOTS.items():
+            if hasattr(self, slot):
+                yield key
+        for key, _ in self._extra:
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash(frozenset(self.items())))
+        return self._hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return (FrozenFeatures, (dict(self),))
+
+    def __repr__(self):
+        return f"FrozenFeatures({dict(self)!r})"
+
+    def replace(self, changes):
+        """Return a copy with the entries in changes replaced."""
+        return FrozenFeatures({**self, **changes})
+
+    def canonical_hash(self):
+        return canonical_hash(self)
+
+    def to_dict(self):
+        """Convert back into a mutable features dict like parseMrl returns."""
+        features = dict(self)
+        if "sub" in features:
+            features["sub"] = [sub.to_dict() for sub in features["sub"]]
+        if "deprecations" in features:
+            features["deprecations"] = set(features["deprecations"])
+        return features
 
 
 def escape_backslashes_and_single_quotes(mrl, _ignore_matches=tuple()):
@@ -76,6 +244,8 @@ def get_tags(*nwr_args):
 
 
 def with_parens(*expressions):
+    import pyparsing as pp
+
     res = pp.Suppress("(")
     for i, expression in enumerate(expressions):
         res += expression
@@ -86,6 +256,8 @@ def with_parens(*expressions):
 
 
 def func_call(func_name, *args, make_group=True):
+    import pyparsing as pp
+
     if isinstance(func_name, str):
         func_name = pp.Literal(func_name)
 
@@ -101,6 +273,8 @@ class MrlGrammar:
         self.build_grammar()
 
     def build_grammar(self):
+        import pyparsing as pp
+
         free_string = pp.QuotedString(quoteChar="'", escChar="\\")
         key_string = free_string
         val_string = free_string ^ func_call("and", pp.delimitedList(free_string))
@@ -316,7 +490,9 @@ class MrlGrammar:
     def useMainFeatures(self, *args, **kwargs):
         self.features = self.parseResult["features"]
 
-    def parseMrl(self, mrl, is_escaped=True):
+    @timed("parse")
+    @traced("parse_mrl")
+    def parseMrl(self, mrl, is_escaped=True, frozen=False):
         """Parse an MRL into its tokens and feature representation.
 
         :param mrl: The MRL string
@@ -328,6 +504,9 @@ class MrlGrammar:
             If your MRL comes from an NLMaps dataset, your should probably set
             is_escaped=False.
 
+        :param frozen: Whether to return the features as FrozenFeatures
+            instead of a dict.
+
         :return: The parse result dict containing the keys 'keys' and
             'features'.
         """
@@ -338,12 +517,16 @@ class MrlGrammar:
         self.parseResult["features"] = self.features = {}
         tokens = self.top.parseString(mrl)
         self.parseResult["tokens"] = tokens
+        if frozen:
+            self.parseResult["features"] = FrozenFeatures(self.parseResult["features"])
         return self.parseResult
 
 
 def filetest():
     import sys
 
+    import pyparsing as pp
+
     grammar = MrlGrammar()
     testfile = "/media/data/Dauerhaft/Studium/Computerlinguistik/Master-Arbeit/data/nlmaps_v2.1/split_1_train_dev_test/nlmaps.v2.train.mrl"
     # testfile = '/media/data/Dauerhaft/Studium/Computerlinguistik/Master-Arbeit/data/nlmaps_v3delta/v3delta.normal/nlmaps.v3delta.train.mrl'
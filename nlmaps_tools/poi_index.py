@@ -0,0 +1,199 @@
+"""A local index of POI names, consulted before bounded Nominatim searches.
+
+The index holds POIs harvested with retrieve_locations.POI_TEMPLATE. Names are
+normalised like in the gazetteer and split into trigrams, and the positions
+are put into a grid of GRID_DEGREES sized cells, so that a search for a name
+inside a viewbox only has to look at the POIs that share trigrams with the
+name or that lie in the cells the viewbox covers, whichever are fewer.
+
+Build it with
+
+    python -m nlmaps_tools.poi_index pois.json.gz
+
+and set NLMAPS_POI_INDEX=pois.json.gz to use it.
+"""
+import argparse
+from collections import Counter, defaultdict
+import gzip
+import json
+import logging
+import math
+import os
+
+from nlmaps_tools.answer_mrl import lazy_singleton
+from nlmaps_tools.gazetteer import normalize_name
+
+GRID_DEGREES = 0.05
+# Minimum Jaccard similarity of the trigram sets of a name and a POI name.
+MIN_SIMILARITY = 0.8
+# In the order Nominatim usually ranks equally named results.
+OSM_TYPE_ORDER = {"relation": 0, "way": 1, "node": 2}
+
+
+def trigrams(normalized_name):
+    """
+    >>> sorted(trigrams("zoo"))
+    ['  z', ' zo', 'oo ', 'zoo']
+    """
+    padded = f"  {normalized_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def grid_cell(lat, lon):
+    return (math.floor(lat / GRID_DEGREES), math.floor(lon / GRID_DEGREES))
+
+
+class PoiIndex:
+    """Search POIs by name inside a bounding box.
+
+    :param pois: Tuples of name, osm_type, osm_id, lat and lon.
+    """
+
+    def __init__(self, pois):
+        self.pois = []
+        self.trigram_counts = []
+        self.by_name = defaultdict(list)
+        self.by_trigram = defaultdict(list)
+        self.by_cell = defaultdict(list)
+        for name, osm_type, osm_id, lat, lon in pois:
+            normalized_name = normalize_name(name)
+            if not normalized_name:
+                continue
+            idx = len(self.pois)
+            self.pois.append((normalized_name, osm_type, int(osm_id), lat, lon))
+            self.by_name[normalized_name].append(idx)
+            name_trigrams = trigrams(normalized_name)
+            self.trigram_counts.append(len(name_trigrams))
+            for trigram in name_trigrams:
+                self.by_trigram[trigram].append(idx)
+            self.by_cell[grid_cell(lat, lon)].append(idx)
+
+    def __len__(self):
+        return len(self.pois)
+
+    @classmethod
+    def load(cls, path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return cls(json.load(f)["pois"])
+
+    def save(self, path):
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({"pois": self.pois}, f)
+
+    def lookup(self, name, bbox, min_similarity=MIN_SIMILARITY):
+        """Find the POI best matching name inside bbox.
+
+        :param bbox: A 4-tuple of minlon, minlat, maxlon, maxlat like the
+            viewbox of Nominatim, as numbers or strings.
+        :return: A tuple of osm_type and osm_id, or None.
+        """
+        min_lon, min_lat, max_lon, max_lat = (float(coord) for coord in bbox)
+        normalized_name = normalize_name(name)
+
+        def inside(idx):
+            _, _, _, lat, lon = self.pois[idx]
+            return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+
+        exact = [idx for idx in self.by_name.get(normalized_name, ()) if inside(idx)]
+        if exact:
+            return self._best(exact)
+
+        name_trigrams = trigrams(normalized_name)
+        postings = [self.by_trigram.get(trigram, ()) for trigram in name_trigrams]
+        cells = self._cells(min_lat, min_lon, max_lat, max_lon)
+        if cells is not None and sum(
+            len(self.by_cell.get(cell, ())) for cell in cells
+        ) < sum(len(posting) for posting in postings):
+            candidates = (
+                idx
+                for cell in cells
+                for idx in self.by_cell.get(cell, ())
+                if inside(idx)
+            )
+            scores = {
+                idx: len(name_trigrams & trigrams(self.pois[idx][0]))
+                for idx in candidates
+            }
+        else:
+            scores = Counter(idx for posting in postings for idx in posting)
+
+        matches = []
+        for idx, shared in scores.items():
+            union = len(name_trigrams) + self.trigram_counts[idx] - shared
+            similarity = shared / union
+            if similarity >= min_similarity and inside(idx):
+                matches.append((-similarity, idx))
+        if not matches:
+            return None
+        best_similarity = min(matches)[0]
+        return self._best([idx for sim, idx in matches if sim == best_similarity])
+
+    def _cells(self, min_lat, min_lon, max_lat, max_lon, max_cells=10_000):
+        min_cell = grid_cell(min_lat, min_lon)
+        max_cell = grid_cell(max_lat, max_lon)
+        count = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+        if count > max_cells:
+            return None
+        return [
+            (lat_cell, lon_cell)
+            for lat_cell in range(min_cell[0], max_cell[0] + 1)
+            for lon_cell in range(min_cell[1], max_cell[1] + 1)
+        ]
+
+    def _best(self, indices):
+        _, osm_type, osm_id, _, _ = min(
+            (self.pois[idx] for idx in indices),
+            key=lambda poi: (OSM_TYPE_ORDER.get(poi[1], 3), poi[2]),
+        )
+        return osm_type, osm_id
+
+
+def pois_from_overpass_elements(elements):
+    """Yield POI tuples from elements harvested with
+    retrieve_locations.POI_TEMPLATE."""
+    for element in elements:
+        position = element.get("center", element)
+        if "lat" not in position or "name" not in element.get("tags", {}):
+            continue
+        yield (
+            element["tags"]["name"],
+            element["type"],
+            element["id"],
+            position["lat"],
+            position["lon"],
+        )
+
+
+def load_default_poi_index():
+    path = os.environ.get("NLMAPS_POI_INDEX")
+    if not path:
+        return None
+    try:
+        return PoiIndex.load(path)
+    except (OSError, ValueError, KeyError):
+        logging.exception(f"Could not load the POI index {path}.")
+        return None
+
+
+get_poi_index = lazy_singleton(load_default_poi_index)
+
+
+def main(output_file):
+    from nlmaps_tools.retrieve_locations import POI_TEMPLATE, get_elements
+
+    index = PoiIndex(pois_from_overpass_elements(get_elements(POI_TEMPLATE)))
+    index.save(output_file)
+    print(f"Wrote {len(index)} POIs to {output_file}.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build a POI name index from POIs harvested from Overpass"
+    )
+    parser.add_argument("output_file", help="Index file to write, e.g. pois.json.gz")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
@@ -1,21 +1,146 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import queue
 import sys
+import threading
+from typing import Optional, TextIO
 
-from nlmaps_tools.process import ProcessingTool, ProcessingRequest
+from nlmaps_tools.deadline import Deadline, deadline_scope
+from nlmaps_tools.process import ProcessingTool, ProcessingRequest, ProcessingResult
 from nlmaps_tools.process.processors import PROCESSORS
+from nlmaps_tools.process.serialization import write_result
+from nlmaps_tools.tracing import run_in_context
 
 
-def main(given: list[tuple[str, str]], wanted: list[str], verbose=False):
+def process_line(
+    processing_tool: ProcessingTool, line: str, deadline_seconds: Optional[float]
+) -> ProcessingResult:
+    """Process the JSON ProcessingRequest in line. Errors are reported in the
+    result instead of raised, so that one bad line does not end the stream."""
+    try:
+        request = ProcessingRequest.parse_raw(line)
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        with deadline_scope(deadline):
+            return processing_tool.process_request(request)
+    except Exception as e:
+        logging.exception(f"Could not process {line!r}")
+        return ProcessingResult(
+            results={}, wallclock_seconds=0.0, error=f"{type(e).__name__}: {e}"
+        )
+
+
+def stream(
+    processing_tool: ProcessingTool,
+    input_file: TextIO,
+    output_file: TextIO,
+    workers: int = 1,
+    deadline_seconds: Optional[float] = None,
+) -> None:
+    """Process ProcessingRequest JSON lines from input_file and write one
+    ProcessingResult JSON line per request to output_file, in the same
+    order. Up to workers requests are processed at the same time."""
+
+    def write(result):
+        write_result(result, output_file)
+        output_file.write("\n")
+        output_file.flush()
+
+    lines = (line for line in input_file if line.strip())
+    if workers <= 1:
+        for line in lines:
+            write(process_line(processing_tool, line, deadline_seconds))
+        return
+
+    # Results are written by their own thread as soon as they and the ones
+    # before them are done, without waiting for the next input line, so that
+    # clients can send a line and wait for its result. The queue bounds how
+    # far the reading gets ahead of the writing.
+    pending = queue.Queue(maxsize=2 * workers)
+    errors = []
+
+    def write_pending():
+        while (future := pending.get()) is not None:
+            if errors:
+                # Keep taking futures so that the reading does not block.
+                continue
+            try:
+                write(future.result())
+            except Exception as e:
+                # Also raised for futures cancelled after an interrupt.
+                errors.append(e)
+
+    writer = threading.Thread(target=write_pending, name="stream-writer")
+    writer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for line in lines:
+                    if errors:
+                        break
+                    pending.put(
+                        executor.submit(
+                            run_in_context(process_line),
+                            processing_tool,
+                            line,
+                            deadline_seconds,
+                        )
+                    )
+            except BaseException:
+                # Do not process the lines read ahead, e.g. after Ctrl-C.
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        pending.put(None)
+        writer.join()
+    if errors:
+        raise errors[0]
+
+
+def main(
+    given: Optional[list[tuple[str, str]]],
+    wanted: Optional[list[str]],
+    verbose=False,
+    deadline_seconds: Optional[float] = None,
+    stream_mode: bool = False,
+    workers: int = 1,
+    profile: bool = False,
+    profile_dir: Optional[str] = None,
+    cpu_processes: int = 0,
+):
     logging.basicConfig(
         level=logging.INFO if verbose else logging.ERROR,
-        stream=sys.stdout,
+        # Keep stdout free for the results in stream mode.
+        stream=sys.stderr if stream_mode else sys.stdout,
+    )
+    processing_tool = ProcessingTool(
+        PROCESSORS,
+        profile=profile,
+        profile_dir=profile_dir,
+        cpu_processes=cpu_processes,
     )
-    processing_tool = ProcessingTool(PROCESSORS)
-    request = ProcessingRequest(given=dict(given), wanted=set(wanted), processors=set())
-    result = processing_tool.process_request(request)
-    output = "\n\n".join(f"{form}: {value}" for form, value in result.results.items())
-    print(output)
+    try:
+        if stream_mode:
+            stream(processing_tool, sys.stdin, sys.stdout, workers, deadline_seconds)
+        else:
+            if not given or not wanted:
+                sys.exit("--given and --wanted are required unless --stream is given.")
+            request = ProcessingRequest(
+                given=dict(given), wanted=set(wanted), processors=set()
+            )
+            deadline = Deadline(deadline_seconds) if deadline_seconds else None
+            with deadline_scope(deadline):
+                result = processing_tool.process_request(request)
+            output = "\n\n".join(
+                f"{form}: {value}" for form, value in result.results.items()
+            )
+            print(output)
+    finally:
+        # Stops the processor threads and worker processes also on errors
+        # and Ctrl-C.
+        processing_tool.close()
+    if processing_tool.profiler is not None:
+        print(processing_tool.profiler.format_report(), file=sys.stderr)
 
 
 def parse_given(given: str) -> tuple[str, str]:
@@ -46,6 +171,50 @@ def parse_args():
         help="Given sources for processing as name-value pairs with equal sign (=) as name-value separator",
     )
     parser.add_argument("--wanted", action="append", help="Given targets")
+    parser.add_argument(
+        "--deadline-seconds",
+        type=float,
+        default=None,
+        help="Fail if the answer takes longer than this. Default: no deadline",
+    )
+    parser.add_argument(
+        "--stream",
+        dest="stream_mode",
+        action="store_true",
+        help=(
+            "Read ProcessingRequest JSON objects, one per line, from stdin and write"
+            " ProcessingResult JSON objects, one per line and in the same order, to"
+            " stdout. Failed requests get a result with an error."
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Requests processed at the same time in stream mode. Default: 1",
+    )
+    parser.add_argument(
+        "--cpu-processes",
+        type=int,
+        default=0,
+        help=(
+            "Worker processes for CPU-bound processors such as parsing, e.g. with"
+            " --stream and --workers. Default: 0, run them in threads"
+        ),
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=(
+            "Measure CPU time and peak allocations per processor and print them"
+            " to stderr at the end"
+        ),
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Write a cProfile file per processor call to this directory. Implies --profile",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log more")
     args = parser.parse_args()
     return args
 
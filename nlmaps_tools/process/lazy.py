@@ -0,0 +1,153 @@
+"""Demand-driven evaluation of processor chains.
+
+ProcessingTool.process_request_lazy plans a request like process_request,
+but returns a LazyProcessingResult instead of applying the chain. Reading a
+target from it applies the processors that target transitively depends on,
+in dependency order, and nothing else. A caller reading only the Overpass
+queries of a request that also wants the answer never runs the Overpass
+queries.
+
+Processors get a SourcesView of their sources instead of a dict copied from
+the values produced so far.
+"""
+from collections.abc import Iterator, Mapping
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+from .models import Processor, ProcessingResult, SingleProcessorResult
+
+if TYPE_CHECKING:
+    from .processing_tool import ProcessingTool
+
+
+class SourcesView(Mapping):
+    """A read-only view of the values of a processor's sources.
+
+    It looks up the values in the dict of all values of a chain, which other
+    processors add their targets to meanwhile, but only shows the sources.
+    """
+
+    __slots__ = ("_values", "_keys")
+
+    def __init__(self, values: dict[str, Any], proc: Processor) -> None:
+        self._values = values
+        sources = proc.sources
+        self._keys = (
+            sources
+            if sources <= values.keys()
+            else frozenset(key for key in sources if key in values)
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._keys:
+            raise KeyError(key)
+        return self._values[key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._keys
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __repr__(self) -> str:
+        return f"SourcesView({dict(self)!r})"
+
+
+class LazyProcessingResult(Mapping):
+    """The results of a processor chain, computed when read.
+
+    It maps the targets of the chain to SingleProcessorResults, like
+    ProcessingResult.results. Reading a target applies the processors it
+    depends on that have not run yet. Exceptions of processors are raised
+    to the reader, and reading the target again retries it. Iterating over
+    the items or values computes all targets, checking for a target with in
+    or iterating over the keys computes none.
+    """
+
+    def __init__(
+        self,
+        processing_tool: "ProcessingTool",
+        given: dict[str, Any],
+        processor_chain: list[Processor],
+        planning_seconds: float = 0.0,
+    ) -> None:
+        self.processing_tool = processing_tool
+        self.planning_seconds = planning_seconds
+        self._given = given
+        self._producers = {proc.target: proc for proc in processor_chain}
+        self._results = {}
+        self._lock = threading.RLock()
+        self._start = time.perf_counter()
+        # Time spent applying processors, excluding the time between reads.
+        self._seconds = 0.0
+
+    def __getitem__(self, target: str) -> SingleProcessorResult:
+        if target not in self._producers:
+            raise KeyError(target)
+        with self._lock:
+            if target not in self._results:
+                self._resolve(target)
+            return self._results[target]
+
+    def __contains__(self, target: object) -> bool:
+        return target in self._producers
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._producers)
+
+    def __len__(self) -> int:
+        return len(self._producers)
+
+    def value(self, target: str) -> Any:
+        """The value of target, computing it if necessary."""
+        return self[target].result
+
+    @property
+    def computed(self) -> set[str]:
+        """The targets computed so far."""
+        with self._lock:
+            return set(self._results)
+
+    def _needed(self, target: str) -> list[Processor]:
+        """The processors to apply for target, in dependency order."""
+        needed = []
+        visited = set()
+
+        def visit(target):
+            proc = self._producers.get(target)
+            if proc is None or target in self._results or target in visited:
+                return
+            visited.add(target)
+            for source in proc.sources:
+                visit(source)
+            needed.append(proc)
+
+        visit(target)
+        return needed
+
+    def _resolve(self, target: str) -> None:
+        start = time.perf_counter()
+        try:
+            for proc in self._needed(target):
+                self._results[proc.target] = self.processing_tool._apply_processor(
+                    proc, self._given, self._start
+                )
+        finally:
+            self._seconds += time.perf_counter() - start
+
+    def to_processing_result(self) -> ProcessingResult:
+        """The targets computed so far as a ProcessingResult, in chain order."""
+        with self._lock:
+            return ProcessingResult.construct(
+                results={
+                    target: self._results[target]
+                    for target in self._producers
+                    if target in self._results
+                },
+                wallclock_seconds=self.planning_seconds + self._seconds,
+                planning_seconds=self.planning_seconds,
+            )
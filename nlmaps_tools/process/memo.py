@@ -0,0 +1,103 @@
+"""Memoisation of the results of pure processors.
+
+A processor declares itself pure with a true pure attribute: its result
+depends on nothing but its sources, and it has no side effects. The results
+are kept in a bounded LRU cache keyed by a SHA-256 hash of the processor
+name and the canonical representation of the source values, so that equal
+sources hit the cache regardless of dict ordering or the hash seed.
+"""
+from collections import OrderedDict
+import copy
+import hashlib
+import sys
+import threading
+from typing import Any, Optional
+
+from nlmaps_tools.metrics import REGISTRY, count_cache_lookup
+from nlmaps_tools.parse_mrl import canonical_repr
+
+from .models import Processor
+
+DEFAULT_MEMO_SIZE = 4096
+
+MEMO_ENTRIES = REGISTRY.gauge(
+    "nlmaps_processor_memo_entries", "Results kept in the processor memo."
+)
+MEMO_BYTES = REGISTRY.gauge(
+    "nlmaps_processor_memo_bytes", "Approximate memory used by the processor memo."
+)
+
+MISSING = object()
+
+
+def approximate_size(value: Any) -> int:
+    """Bytes used by value and the containers and strings in it."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(elm) for elm in value)
+    return size
+
+
+class ResultMemo:
+    def __init__(self, max_entries: int = DEFAULT_MEMO_SIZE) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> (result, approximate size)
+        self._entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(proc: Processor, sources: dict[str, Any]) -> Optional[str]:
+        """The memo key for applying proc to sources, or None if proc is not
+        pure or the sources have no canonical representation."""
+        if not getattr(proc, "pure", False):
+            return None
+        try:
+            source_repr = canonical_repr(sources)
+        except ValueError:
+            return None
+        return hashlib.sha256(f"{proc.name}\0{source_repr}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """The result for key, or MISSING. Results are deep copies, so that
+        callers may modify them."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+        count_cache_lookup("processor_memo", entry is not None)
+        return MISSING if entry is None else copy.deepcopy(entry[0])
+
+    def put(self, key: str, result: Any) -> None:
+        result = copy.deepcopy(result)
+        size = approximate_size(result)
+        with self._lock:
+            entries_before, bytes_before = len(self._entries), self.bytes
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (result, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+            # Several tools may have a memo, so the gauges add up all of them.
+            MEMO_ENTRIES.labels().inc(len(self._entries) - entries_before)
+            MEMO_BYTES.labels().inc(self.bytes - bytes_before)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            MEMO_ENTRIES.labels().dec(len(self._entries))
+            MEMO_BYTES.labels().dec(self.bytes)
+            self._entries.clear()
+            self.bytes = 0
@@ -1,5 +1,6 @@
-from typing import Any, Protocol
-from pydantic import BaseModel, validator
+from collections.abc import Mapping
+from typing import Any, Optional, Protocol
+from pydantic import BaseModel, Field, validator
 
 
 class ProcessingError(Exception):
@@ -7,11 +8,22 @@ class ProcessingError(Exception):
 
 
 class Processor(Protocol):
+    """A processor turning sources into a target.
+
+    __call__ may be a coroutine function. Processors may also have both a
+    blocking __call__ and an async acall method. ProcessingTool.
+    aprocess_request awaits acall or an async __call__, and
+    ProcessingTool.process_request runs them to completion.
+
+    The sources are passed as a read-only mapping, which must not be kept
+    after the call.
+    """
+
     sources: frozenset[str]
     target: str
     name: str
 
-    def __call__(self, given: dict[str, Any]) -> str:
+    def __call__(self, given: Mapping[str, Any]) -> str:
         ...
 
     def __eq__(self, other: Any) -> str:
@@ -21,10 +33,15 @@ class Processor(Protocol):
         ...
 
 
+# Requests come from outside and are validated. The results are built by
+# ProcessingTool from values it has produced itself, so it creates them with
+# construct(), which skips validation.
+
+
 class ProcessingRequest(BaseModel):
     given: dict[str, Any]
     wanted: set[str]
-    processors: set[str]
+    processors: set[str] = Field(default_factory=set)
 
     @validator("wanted", "processors", pre=True)
     def convert_list_to_set(cls, v) -> set:
@@ -41,8 +58,22 @@ class SingleProcessorResult(BaseModel):
     result: Any
     processor_name: str
     wallclock_seconds: float
+    # Start and end of the processor in seconds since the chain started.
+    start_seconds: float = 0.0
+    end_seconds: float = 0.0
+    # Whether the result was taken from the memo of pure processors.
+    cache_hit: bool = False
+    # CPU seconds of the thread running the processor and peak bytes
+    # allocated meanwhile, if the ProcessingTool profiles.
+    cpu_seconds: Optional[float] = None
+    peak_alloc_bytes: Optional[int] = None
 
 
 class ProcessingResult(BaseModel):
     results: dict[str, SingleProcessorResult]
     wallclock_seconds: float
+    # Time spent finding the processor chain, included in wallclock_seconds.
+    planning_seconds: float = 0.0
+    # Why processing stopped, if it failed. Only set by process_requests,
+    # results then contains the targets produced before the failure.
+    error: Optional[str] = None
@@ -0,0 +1,124 @@
+"""Running CPU-bound processors in worker processes.
+
+Processors that hold the GIL, such as the pyparsing grammar of the
+Will2021FeatureExtractor or the regular expressions of the Linearizer, do
+not get faster with more threads. A ProcessingTool with cpu_processes runs
+processors with a true cpu_bound attribute in a pool of worker processes
+instead.
+
+Every worker unpickles the CPU-bound processors once when it starts and
+calls their warm_up method, e.g. to build the grammar. A call then only
+sends the processor name and the source values, and gets the result back,
+both pickled with the highest protocol. Workers are spawned rather than
+forked, so that they do not inherit locks held by the threads of the
+parent.
+"""
+import asyncio
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+import math
+import multiprocessing
+import pickle
+import time
+from typing import Any, Iterable
+
+from .models import Processor
+
+PROCESS_START_METHOD = "spawn"
+
+# The processors of a worker process by name.
+_worker_processors = {}
+
+
+def _dumps(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _init_worker(payload: bytes) -> None:
+    processors = pickle.loads(payload)
+    for proc in processors:
+        warm_up = getattr(proc, "warm_up", None)
+        if warm_up is not None:
+            warm_up()
+    _worker_processors.update((proc.name, proc) for proc in processors)
+
+
+def _call_in_worker(name: str, payload: bytes) -> bytes:
+    from .processing_tool import _call_blocking
+
+    start = time.thread_time()
+    result = _call_blocking(_worker_processors[name], pickle.loads(payload))
+    return _dumps((result, time.thread_time() - start))
+
+
+def _batch_call_in_worker(name: str, payload: bytes) -> bytes:
+    from .processing_tool import _call_batch
+
+    start = time.thread_time()
+    outputs = _call_batch(_worker_processors[name], pickle.loads(payload))
+    return _dumps((outputs, time.thread_time() - start))
+
+
+class ProcessorPool:
+    def __init__(self, processors: Iterable[Processor], processes: int) -> None:
+        """
+        :param processors: The processors to run in the workers. They must
+            be picklable.
+        :param processes: Worker processes. They are started when needed.
+        """
+        processors = list(processors)
+        self.names = frozenset(proc.name for proc in processors)
+        self.processes = processes
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context(PROCESS_START_METHOD),
+            initializer=_init_worker,
+            initargs=(_dumps(processors),),
+        )
+
+    def call(self, proc: Processor, sources: Mapping[str, Any]) -> tuple[Any, float]:
+        """Call proc with sources in a worker.
+
+        :return: The result and the CPU seconds spent in the worker.
+        """
+        future = self._executor.submit(
+            _call_in_worker, proc.name, _dumps(dict(sources))
+        )
+        return pickle.loads(future.result())
+
+    async def acall(
+        self, proc: Processor, sources: Mapping[str, Any]
+    ) -> tuple[Any, float]:
+        future = self._executor.submit(
+            _call_in_worker, proc.name, _dumps(dict(sources))
+        )
+        return pickle.loads(await asyncio.wrap_future(future))
+
+    def call_batch(
+        self, proc: Processor, sources_list: list[Mapping[str, Any]]
+    ) -> tuple[list[Any], float]:
+        """Split sources_list into a chunk per worker and process the chunks
+        like ProcessingTool does without workers.
+
+        :return: A result or exception per item and the CPU seconds spent in
+            the workers.
+        """
+        chunk_size = math.ceil(len(sources_list) / self.processes)
+        futures = [
+            self._executor.submit(
+                _batch_call_in_worker,
+                proc.name,
+                _dumps([dict(sources) for sources in sources_list[i : i + chunk_size]]),
+            )
+            for i in range(0, len(sources_list), chunk_size)
+        ]
+        outputs = []
+        cpu_seconds = 0.0
+        for future in futures:
+            chunk_outputs, chunk_cpu_seconds = pickle.loads(future.result())
+            outputs.extend(chunk_outputs)
+            cpu_seconds += chunk_cpu_seconds
+        return outputs, cpu_seconds
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
@@ -1,8 +1,22 @@
-from collections import defaultdict
+import asyncio
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import heapq
+import inspect
+import itertools
 import logging
+import threading
 import time
-from typing import Iterable, Union, Any
+from typing import Callable, Iterable, Literal, Optional, Union, Any
 
+from nlmaps_tools.metrics import REGISTRY, count_cache_lookup
+from nlmaps_tools.tracing import run_in_context, span
+
+from .lazy import LazyProcessingResult, SourcesView
+from .memo import DEFAULT_MEMO_SIZE, MISSING, ResultMemo
+from .process_pool import ProcessorPool
+from .profiling import ProcessorProfiler
 from .models import (
     Processor,
     ProcessingRequest,
@@ -11,6 +25,25 @@ from .models import (
 )
 
 
+PROCESSOR_SECONDS = REGISTRY.histogram(
+    "nlmaps_processor_seconds", "Time spent per processor.", ["processor"]
+)
+# Distinct (given, wanted) signatures whose processor chains are kept.
+PLAN_CACHE_SIZE = 256
+# Expected seconds for processors that neither declare a cost nor have run.
+DEFAULT_PROCESSOR_COST = 0.01
+# Weight of the latest run in the moving average of a processor's cost.
+COST_SMOOTHING = 0.2
+# Planned chains are dropped once a cost of at least REPLAN_MIN_SECONDS
+# changed by REPLAN_COST_RATIO since planning.
+REPLAN_COST_RATIO = 2.0
+REPLAN_MIN_SECONDS = 0.001
+# Threads running independent processors of a chain in parallel.
+DEFAULT_MAX_WORKERS = 4
+# Threads running processors that mostly wait for Nominatim or Overpass.
+DEFAULT_IO_WORKERS = 16
+
+
 class SolutionFindingError(Exception):
     pass
 
@@ -71,6 +104,101 @@ def _find_solutions(
     return solutions
 
 
+def _find_cheapest_solution(
+    wanted: Union[set[str], frozenset[str]],
+    having: set[str],
+    source_to_processors: dict[str, set[Processor]],
+    cost: Callable[[Processor], float],
+) -> set[Processor]:
+    """Best-first search for processors producing wanted from having.
+
+    Like Dijkstra's algorithm on the hypergraph of targets, where a
+    processor becomes usable once all its sources are reached. A target's
+    cost is the cost of its cheapest processor plus that of its sources, so
+    processors shared by several sources are counted more than once, which
+    is an upper bound of the cost of the resulting chain. This takes
+    O(P log T) for P processors and T targets.
+    """
+    best_cost = {target: 0.0 for target in having}
+    best_processor = {}
+    missing_sources = {}
+    reached = set()
+    tie_breaker = itertools.count()
+    heap = [(0.0, next(tie_breaker), target) for target in having]
+    while heap and not wanted <= reached:
+        target_cost, _, target = heapq.heappop(heap)
+        if target in reached:
+            continue
+        reached.add(target)
+        for proc in source_to_processors.get(target, ()):
+            missing = missing_sources.get(proc, len(proc.sources)) - 1
+            missing_sources[proc] = missing
+            if missing or proc.target in reached:
+                continue
+            proc_cost = cost(proc) + sum(best_cost[s] for s in proc.sources)
+            if proc_cost < best_cost.get(proc.target, float("inf")):
+                best_cost[proc.target] = proc_cost
+                best_processor[proc.target] = proc
+                heapq.heappush(heap, (proc_cost, next(tie_breaker), proc.target))
+
+    if not wanted <= reached:
+        raise SolutionFindingError(
+            f"Could not find processors for {set(wanted) - reached!r} given {having!r}."
+        )
+    solution = set()
+    targets = [target for target in wanted if target not in having]
+    while targets:
+        proc = best_processor[targets.pop()]
+        if proc not in solution:
+            solution.add(proc)
+            targets.extend(s for s in proc.sources if s not in having)
+    return solution
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def _call_blocking(proc: Processor, sources: Mapping[str, Any]) -> Any:
+    """Call proc and run the result to completion if it is awaitable."""
+    result = proc(sources)
+    if inspect.isawaitable(result):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(_await(result))
+        # The caller is blocking a running event loop, e.g. async code calling
+        # process_request, where asyncio.run fails. Run the awaitable in a
+        # thread with its own loop instead.
+        with ThreadPoolExecutor(max_workers=1) as helper:
+            return helper.submit(run_in_context(asyncio.run), _await(result)).result()
+    return result
+
+
+def _call_batch(proc: Processor, sources_list: list[Mapping[str, Any]]) -> list[Any]:
+    """Call proc for every item of sources_list, with its batch_call method if
+    it has one. Exceptions are returned in place of the result of an item."""
+    batch_call = getattr(proc, "batch_call", None)
+    if batch_call is not None:
+        try:
+            outputs = batch_call(sources_list)
+            if len(outputs) == len(sources_list):
+                return outputs
+            logging.error(
+                f"{proc} returned {len(outputs)} results for {len(sources_list)}"
+                " items from batch_call. Calling it per item."
+            )
+        except Exception:
+            logging.exception(f"batch_call of {proc} failed. Calling it per item.")
+    outputs = []
+    for sources in sources_list:
+        try:
+            outputs.append(proc(sources))
+        except Exception as e:
+            outputs.append(e)
+    return outputs
+
+
 def _build_target_to_processors(
     processors: Iterable[Processor],
 ) -> dict[str, set[Processor]]:
@@ -80,20 +208,234 @@ def _build_target_to_processors(
     return target_to_processors
 
 
+def _build_source_to_processors(
+    processors: Iterable[Processor],
+) -> dict[str, set[Processor]]:
+    source_to_processors = defaultdict(set)
+    for p in processors:
+        for source in p.sources:
+            source_to_processors[source].add(p)
+    return source_to_processors
+
+
 class ProcessingTool:
-    def __init__(self, processors: set[Processor]) -> None:
+    def __init__(
+        self,
+        processors: set[Processor],
+        planner: Literal["best_first", "exhaustive"] = "best_first",
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        memo_size: int = DEFAULT_MEMO_SIZE,
+        io_workers: int = DEFAULT_IO_WORKERS,
+        profile: bool = False,
+        profile_dir: Optional[str] = None,
+        cpu_processes: int = 0,
+    ) -> None:
+        """
+        :param planner: "best_first" finds the chain with the least expected
+            cost quickly. "exhaustive" enumerates all chains and picks the
+            cheapest one, which takes exponential time.
+        :param max_workers: Processors of a chain that run at the same time
+            at most. 1 runs them one after the other.
+        :param memo_size: Results of pure processors to keep for reuse. 0
+            disables the memo.
+        :param io_workers: Threads for processors with a true io_bound
+            attribute, which mostly wait for external services. They have
+            their own threads, so that they do not hold up CPU-bound
+            processors such as parsing.
+        :param profile: Measure the CPU time and peak allocations of every
+            processor call, see profiling.ProcessorProfiler. The totals per
+            processor are reported by self.profiler.
+        :param profile_dir: Also write a cProfile file per processor call
+            to this directory. Implies profile.
+        :param cpu_processes: Worker processes for processors with a true
+            cpu_bound attribute, see process_pool. 0 runs them in threads.
+        """
+        self.planner = planner
+        self.memo = ResultMemo(memo_size) if memo_size > 0 else None
+        self.max_workers = max_workers
+        self.io_workers = io_workers
+        self.profiler = (
+            ProcessorProfiler(profile_dir) if profile or profile_dir else None
+        )
+        self.cpu_processes = cpu_processes
+        # io_bound -> executor
+        self._executors = {}
+        self._process_pool = None
+        self._executor_lock = threading.Lock()
+        self._plan_cache_lock = threading.Lock()
+        # Moving averages of the processors' wallclock seconds by name, and
+        # the ones planned with.
+        self.learned_costs = {}
+        self._planned_costs = {}
         self.processors = processors
-        self.target_to_processors = _build_target_to_processors(self.processors)
+
+    @property
+    def processors(self) -> set[Processor]:
+        return self._processors
+
+    @processors.setter
+    def processors(self, processors: set[Processor]) -> None:
+        self._processors = processors
+        self._update_processors()
+
+    def _update_processors(self) -> None:
+        with self._plan_cache_lock:
+            self._frozen_processors = frozenset(self._processors)
+            self.target_to_processors = _build_target_to_processors(
+                self._frozen_processors
+            )
+            self.source_to_processors = _build_source_to_processors(
+                self._frozen_processors
+            )
+            self._plan_cache = OrderedDict()
+        # The workers only know the processors they were started with.
+        self._shutdown_process_pool()
+
+    def processor_cost(self, proc: Processor) -> float:
+        """Expected seconds for proc: learned from its runs, else declared by
+        its cost attribute, else DEFAULT_PROCESSOR_COST."""
+        learned = self.learned_costs.get(proc.name)
+        if learned is not None:
+            return learned
+        declared = getattr(proc, "cost", None)
+        return DEFAULT_PROCESSOR_COST if declared is None else declared
+
+    def _learn_cost(self, proc: Processor, seconds: float) -> None:
+        planned = self._planned_costs.get(proc.name)
+        if planned is None:
+            planned = self._planned_costs[proc.name] = self.processor_cost(proc)
+        previous = self.learned_costs.get(proc.name)
+        learned = (
+            seconds
+            if previous is None
+            else (1 - COST_SMOOTHING) * previous + COST_SMOOTHING * seconds
+        )
+        self.learned_costs[proc.name] = learned
+        if max(learned, planned) >= REPLAN_MIN_SECONDS and (
+            learned > planned * REPLAN_COST_RATIO
+            or learned * REPLAN_COST_RATIO < planned
+        ):
+            self._planned_costs[proc.name] = learned
+            with self._plan_cache_lock:
+                self._plan_cache.clear()
 
     def find_processor_chain(self, request: ProcessingRequest) -> list[Processor]:
-        solutions = self._find_solutions(request)
-        solution = self._choose_solution(solutions)
+        """Find the processors to apply in order for request.
+
+        Chains are cached per given and wanted targets. The cache is
+        emptied when the processors change, also if the processors set is
+        modified in place.
+        """
+        processors = frozenset(self._processors)
+        if processors != self._frozen_processors:
+            self._update_processors()
+        key = (frozenset(request.given), frozenset(request.wanted), processors)
+        with self._plan_cache_lock:
+            processor_chain = self._plan_cache.get(key)
+            if processor_chain is not None:
+                self._plan_cache.move_to_end(key)
+        count_cache_lookup("processor_chain", processor_chain is not None)
+        if processor_chain is None:
+            processor_chain = tuple(self._plan_processor_chain(request))
+            with self._plan_cache_lock:
+                self._plan_cache[key] = processor_chain
+                if len(self._plan_cache) > PLAN_CACHE_SIZE:
+                    self._plan_cache.popitem(last=False)
+        return list(processor_chain)
+
+    def _plan_processor_chain(self, request: ProcessingRequest) -> list[Processor]:
+        if self.planner == "exhaustive":
+            solutions = self._find_solutions(request)
+            solution = self._choose_solution(solutions)
+        else:
+            solution = _find_cheapest_solution(
+                wanted=request.wanted,
+                having=set(request.given),
+                source_to_processors=self.source_to_processors,
+                cost=self.processor_cost,
+            )
         processor_chain = self._order_solution(set(request.given), solution)
         return processor_chain
 
     def process_request(self, request: ProcessingRequest) -> ProcessingResult:
-        processor_chain = self.find_processor_chain(request)
-        result = self._apply_processor_chain(request.given, processor_chain)
+        with span("process_request", wanted=sorted(request.wanted)):
+            start = time.perf_counter()
+            processor_chain = self.find_processor_chain(request)
+            planning_seconds = time.perf_counter() - start
+            result = self._apply_processor_chain(request.given, processor_chain)
+        result.planning_seconds = planning_seconds
+        result.wallclock_seconds += planning_seconds
+        return result
+
+    def process_request_lazy(self, request: ProcessingRequest) -> LazyProcessingResult:
+        """Plan request, but only apply processors when their targets are read.
+
+        Reading a target of the result applies the processors it transitively
+        depends on, so processors producing targets that are not read never
+        run.
+        """
+        with span("process_request_lazy", wanted=sorted(request.wanted)):
+            start = time.perf_counter()
+            processor_chain = self.find_processor_chain(request)
+            planning_seconds = time.perf_counter() - start
+        return LazyProcessingResult(
+            self, request.given, processor_chain, planning_seconds
+        )
+
+    def process_requests(
+        self, requests: list[ProcessingRequest]
+    ) -> list[ProcessingResult]:
+        """Process many requests, planning once per given and wanted targets.
+
+        Requests with the same signature are processed together, one
+        processor at a time. Processors with a batch_call method get the
+        sources of all requests at once. It returns a list with a result or
+        an exception per item, and any other processor is called per item.
+
+        A failing item does not affect the others. Its ProcessingResult has
+        error set and contains the results produced before the failure. The
+        results are in the order of requests.
+        """
+        groups = defaultdict(list)
+        for idx, request in enumerate(requests):
+            groups[(frozenset(request.given), frozenset(request.wanted))].append(idx)
+
+        results: list[Optional[ProcessingResult]] = [None] * len(requests)
+        with span("process_requests", requests=len(requests), signatures=len(groups)):
+            for indices in groups.values():
+                group = [requests[idx] for idx in indices]
+                start = time.perf_counter()
+                try:
+                    processor_chain = self.find_processor_chain(group[0])
+                except SolutionFindingError as e:
+                    group_results = [
+                        ProcessingResult.construct(
+                            results={}, wallclock_seconds=0.0, error=str(e)
+                        )
+                        for _ in group
+                    ]
+                else:
+                    planning_seconds = time.perf_counter() - start
+                    group_results = self._apply_processor_chain_batch(
+                        [request.given for request in group], processor_chain
+                    )
+                    for result in group_results:
+                        result.planning_seconds = planning_seconds
+                        result.wallclock_seconds += planning_seconds
+                for idx, result in zip(indices, group_results):
+                    results[idx] = result
+        return results
+
+    async def aprocess_request(self, request: ProcessingRequest) -> ProcessingResult:
+        """Like process_request, but awaits async processors and runs blocking
+        ones on the thread pool, so that requests can overlap."""
+        with span("process_request", wanted=sorted(request.wanted)):
+            start = time.perf_counter()
+            processor_chain = self.find_processor_chain(request)
+            planning_seconds = time.perf_counter() - start
+            result = await self._aapply_processor_chain(request.given, processor_chain)
+        result.planning_seconds = planning_seconds
+        result.wallclock_seconds += planning_seconds
         return result
 
     @staticmethod
@@ -103,8 +445,11 @@ class ProcessingTool:
         wanted_results = {
             key: val for key, val in result.results.items() if key in request.wanted
         }
-        return ProcessingResult(
-            results=wanted_results, wallclock_seconds=result.wallclock_seconds
+        return ProcessingResult.construct(
+            results=wanted_results,
+            wallclock_seconds=result.wallclock_seconds,
+            planning_seconds=result.planning_seconds,
+            error=result.error,
         )
 
     def _find_solutions(self, request: ProcessingRequest) -> list[set[Processor]]:
@@ -115,13 +460,12 @@ class ProcessingTool:
         )
         return solutions
 
-    @staticmethod
-    def _choose_solution(solutions: list[set[Processor]]) -> set[Processor]:
-        # This choice is pretty random and should be improved.
-        # Ideas:
-        #  - Choose solutions with fewer processors.
-        #  - Attach penalties to processors and choose based on least penalty
-        return solutions[0]
+    def _choose_solution(self, solutions: list[set[Processor]]) -> set[Processor]:
+        if not solutions:
+            raise SolutionFindingError("Found no processors for the request.")
+        return min(
+            solutions, key=lambda solution: sum(map(self.processor_cost, solution))
+        )
 
     @staticmethod
     def _order_solution(given: set[str], processors: set[Processor]) -> list[Processor]:
@@ -141,26 +485,403 @@ class ProcessingTool:
                 )
         return chain
 
-    @staticmethod
+    def _get_executor(self, io_bound: bool = False) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            executor = self._executors.get(io_bound)
+            if executor is None:
+                executor = self._executors[io_bound] = ThreadPoolExecutor(
+                    max_workers=self.io_workers if io_bound else self.max_workers,
+                    thread_name_prefix="io-processor" if io_bound else "processor",
+                )
+            return executor
+
+    def _get_process_pool(self, proc: Processor) -> Optional[ProcessorPool]:
+        """The pool of worker processes to run proc in, or None if it runs in
+        the current process."""
+        if self.cpu_processes <= 0 or not getattr(proc, "cpu_bound", False):
+            return None
+        with self._executor_lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessorPool(
+                    [
+                        p
+                        for p in self._frozen_processors
+                        if getattr(p, "cpu_bound", False)
+                    ],
+                    self.cpu_processes,
+                )
+            pool = self._process_pool
+        return pool if proc.name in pool.names else None
+
+    def _shutdown_process_pool(self) -> None:
+        with self._executor_lock:
+            pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def close(self) -> None:
+        """Stop the threads and processes running processors, and tracing
+        allocations if profiling."""
+        with self._executor_lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown()
+        self._shutdown_process_pool()
+        if self.profiler is not None:
+            self.profiler.close()
+
+    def _call_processor(
+        self, proc: Processor, sources: Mapping[str, Any]
+    ) -> tuple[Any, Optional[float], Optional[int], float]:
+        """Call proc in the current thread.
+
+        :return: The result, the CPU seconds and peak allocated bytes of the
+            call if profiling, else None, and the seconds the profiler made
+            the call wait before it started.
+        """
+        pool = self._get_process_pool(proc)
+        if pool is not None:
+            # Allocations in the workers are not traced.
+            result, cpu_seconds = pool.call(proc, sources)
+            return result, cpu_seconds if self.profiler else None, None, 0.0
+        if self.profiler is None:
+            return _call_blocking(proc, sources), None, None, 0.0
+        return self.profiler.call(
+            proc.name,
+            _call_blocking,
+            proc,
+            sources,
+            # Tracing would serialise processors waiting for services.
+            trace_allocations=not getattr(proc, "io_bound", False),
+        )
+
+    def _apply_processor(
+        self, proc: Processor, given: dict[str, Any], total_start: float
+    ) -> SingleProcessorResult:
+        logging.info(f"Applying processor {proc}.")
+        sources = SourcesView(given, proc)
+        start = time.perf_counter()
+        memo_key, result = self._lookup_memo(proc, sources)
+        if result is not MISSING:
+            end = time.perf_counter()
+            return self._record_processor_result(
+                proc, given, result, start, end, total_start, cache_hit=True
+            )
+        with span(proc.name, target=proc.target):
+            (
+                result,
+                cpu_seconds,
+                peak_alloc_bytes,
+                waited_seconds,
+            ) = self._call_processor(proc, sources)
+        end = time.perf_counter()
+        start += waited_seconds
+        self._store_memo(memo_key, result)
+        return self._record_processor_result(
+            proc,
+            given,
+            result,
+            start,
+            end,
+            total_start,
+            cpu_seconds=cpu_seconds,
+            peak_alloc_bytes=peak_alloc_bytes,
+        )
+
+    async def _aapply_processor(
+        self, proc: Processor, given: dict[str, Any], total_start: float
+    ) -> SingleProcessorResult:
+        logging.info(f"Applying processor {proc}.")
+        sources = SourcesView(given, proc)
+        start = time.perf_counter()
+        memo_key, result = self._lookup_memo(proc, sources)
+        if result is not MISSING:
+            end = time.perf_counter()
+            return self._record_processor_result(
+                proc, given, result, start, end, total_start, cache_hit=True
+            )
+        with span(proc.name, target=proc.target):
+            # Awaited processors share the thread with other tasks, so their
+            # CPU time cannot be measured.
+            cpu_seconds = peak_alloc_bytes = None
+            waited_seconds = 0.0
+            acall = getattr(proc, "acall", None)
+            pool = self._get_process_pool(proc)
+            if acall is not None:
+                result = await acall(sources)
+            elif inspect.iscoroutinefunction(proc.__call__):
+                result = await proc(sources)
+            elif pool is not None:
+                result, cpu_seconds = await pool.acall(proc, sources)
+                if self.profiler is None:
+                    cpu_seconds = None
+            else:
+                (
+                    result,
+                    cpu_seconds,
+                    peak_alloc_bytes,
+                    waited_seconds,
+                ) = await asyncio.get_running_loop().run_in_executor(
+                    self._get_executor(getattr(proc, "io_bound", False)),
+                    run_in_context(self._call_processor),
+                    proc,
+                    sources,
+                )
+        end = time.perf_counter()
+        start += waited_seconds
+        self._store_memo(memo_key, result)
+        return self._record_processor_result(
+            proc,
+            given,
+            result,
+            start,
+            end,
+            total_start,
+            cpu_seconds=cpu_seconds,
+            peak_alloc_bytes=peak_alloc_bytes,
+        )
+
+    def _lookup_memo(
+        self, proc: Processor, sources: dict[str, Any]
+    ) -> tuple[Optional[str], Any]:
+        """The memo key for proc and sources, if memoisable, and the memoised
+        result or MISSING."""
+        if self.memo is None:
+            return None, MISSING
+        memo_key = self.memo.key(proc, sources)
+        if memo_key is None:
+            return None, MISSING
+        return memo_key, self.memo.get(memo_key)
+
+    def _store_memo(self, memo_key: Optional[str], result: Any) -> None:
+        if memo_key is not None:
+            self.memo.put(memo_key, result)
+
+    def _record_processor_result(
+        self,
+        proc: Processor,
+        given: dict[str, Any],
+        result: Any,
+        start: float,
+        end: float,
+        total_start: float,
+        cache_hit: bool = False,
+        cpu_seconds: Optional[float] = None,
+        peak_alloc_bytes: Optional[int] = None,
+    ) -> SingleProcessorResult:
+        given[proc.target] = result
+        wallclock_seconds = end - start
+        if not cache_hit:
+            # The costs are those of computing the results.
+            PROCESSOR_SECONDS.labels(proc.name).observe(wallclock_seconds)
+            if self.profiler is None:
+                self._learn_cost(proc, wallclock_seconds)
+            else:
+                # Profiling skews the timings, so plans do not learn from them.
+                self.profiler.record(
+                    proc.name, wallclock_seconds, cpu_seconds, peak_alloc_bytes
+                )
+        return SingleProcessorResult.construct(
+            result=result,
+            processor_name=proc.name,
+            wallclock_seconds=wallclock_seconds,
+            start_seconds=start - total_start,
+            end_seconds=end - total_start,
+            cache_hit=cache_hit,
+            cpu_seconds=cpu_seconds,
+            peak_alloc_bytes=peak_alloc_bytes,
+        )
+
+    def _apply_processor_chain_batch(
+        self, given_list: list[dict[str, Any]], processor_chain: list[Processor]
+    ) -> list[ProcessingResult]:
+        total_start = time.perf_counter()
+        results = [{} for _ in given_list]
+        errors = [None] * len(given_list)
+        for proc in processor_chain:
+            alive = [idx for idx, error in enumerate(errors) if error is None]
+            if not alive:
+                break
+            start = time.perf_counter()
+            sources_list = {idx: SourcesView(given_list[idx], proc) for idx in alive}
+            outputs = {}
+            memo_keys = {}
+            for idx, sources in sources_list.items():
+                memo_keys[idx], output = self._lookup_memo(proc, sources)
+                if output is not MISSING:
+                    outputs[idx] = output
+            cache_hits = set(outputs)
+            computed = [idx for idx in alive if idx not in cache_hits]
+            cpu_seconds = cpu_seconds_per_item = peak_alloc_bytes = None
+            waited_seconds = 0.0
+            if computed:
+                computed_sources = [sources_list[idx] for idx in computed]
+                pool = self._get_process_pool(proc)
+                with span(proc.name, target=proc.target, items=len(computed)):
+                    if pool is not None:
+                        computed_outputs, cpu_seconds = pool.call_batch(
+                            proc, computed_sources
+                        )
+                    elif self.profiler is None:
+                        computed_outputs = _call_batch(proc, computed_sources)
+                    else:
+                        (
+                            computed_outputs,
+                            cpu_seconds,
+                            peak_alloc_bytes,
+                            waited_seconds,
+                        ) = self.profiler.call(
+                            proc.name,
+                            _call_batch,
+                            proc,
+                            computed_sources,
+                            trace_allocations=not getattr(proc, "io_bound", False),
+                        )
+                if self.profiler is None:
+                    cpu_seconds = None
+                else:
+                    cpu_seconds_per_item = cpu_seconds / len(computed)
+                for idx, output in zip(computed, computed_outputs):
+                    outputs[idx] = output
+                    if not isinstance(output, Exception):
+                        self._store_memo(memo_keys[idx], output)
+            end = time.perf_counter()
+            start += waited_seconds
+            seconds_per_item = (end - start) / len(alive)
+            if computed:
+                seconds_per_computed_item = (end - start) / len(computed)
+                PROCESSOR_SECONDS.labels(proc.name).observe(seconds_per_computed_item)
+                if self.profiler is None:
+                    self._learn_cost(proc, seconds_per_computed_item)
+                else:
+                    self.profiler.record(
+                        proc.name,
+                        end - start,
+                        cpu_seconds,
+                        peak_alloc_bytes,
+                        calls=len(computed),
+                    )
+            for idx in alive:
+                output = outputs[idx]
+                if isinstance(output, Exception):
+                    errors[idx] = f"{proc.name}: {type(output).__name__}: {output}"
+                    continue
+                given_list[idx][proc.target] = output
+                results[idx][proc.target] = SingleProcessorResult.construct(
+                    result=output,
+                    processor_name=proc.name,
+                    wallclock_seconds=seconds_per_item,
+                    start_seconds=start - total_start,
+                    end_seconds=end - total_start,
+                    cache_hit=idx in cache_hits,
+                    # The peak is that of the whole batch.
+                    cpu_seconds=None if idx in cache_hits else cpu_seconds_per_item,
+                    peak_alloc_bytes=None if idx in cache_hits else peak_alloc_bytes,
+                )
+        wallclock_seconds = time.perf_counter() - total_start
+        return [
+            ProcessingResult.construct(
+                results=item_results, wallclock_seconds=wallclock_seconds, error=error
+            )
+            for item_results, error in zip(results, errors)
+        ]
+
     def _apply_processor_chain(
-        given: dict[str, Any], processor_chain: list[Processor]
+        self, given: dict[str, Any], processor_chain: list[Processor]
     ) -> ProcessingResult:
+        """Apply the processors, each as soon as its sources are available.
+
+        Processors that become ready together run on the thread pool, except
+        for one which runs in the calling thread, so that a chain without
+        independent processors runs without any thread switches.
+        """
         total_start = time.perf_counter()
         logging.info(
             f"Applying processor chain {' -> '.join(str(p) for p in processor_chain)}."
         )
+        producers = {proc.target: proc for proc in processor_chain}
+        waiting_for = {
+            proc: {producers[s] for s in proc.sources if s in producers}
+            for proc in processor_chain
+        }
+        dependents = defaultdict(list)
+        for proc, dependencies in waiting_for.items():
+            for dependency in dependencies:
+                dependents[dependency].append(proc)
+        ready = [proc for proc in processor_chain if not waiting_for[proc]]
         results = {}
+        running = {}
+
+        def finish(proc, result):
+            results[proc] = result
+            for dependent in dependents[proc]:
+                waiting_for[dependent].discard(proc)
+                if not waiting_for[dependent]:
+                    ready.append(dependent)
+
+        try:
+            while ready or running:
+                if self.max_workers > 1:
+                    while len(ready) > 1:
+                        proc = ready.pop()
+                        future = self._get_executor(
+                            getattr(proc, "io_bound", False)
+                        ).submit(
+                            run_in_context(self._apply_processor),
+                            proc,
+                            given,
+                            total_start,
+                        )
+                        running[future] = proc
+                if ready:
+                    proc = ready.pop()
+                    finish(proc, self._apply_processor(proc, given, total_start))
+                    done = [future for future in running if future.done()]
+                else:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), future.result())
+        finally:
+            for future in running:
+                future.cancel()
+            wait(running)
+
+        return ProcessingResult.construct(
+            results={proc.target: results[proc] for proc in processor_chain},
+            wallclock_seconds=time.perf_counter() - total_start,
+        )
+
+    async def _aapply_processor_chain(
+        self, given: dict[str, Any], processor_chain: list[Processor]
+    ) -> ProcessingResult:
+        """Apply the processors as tasks, each awaiting the tasks producing its
+        sources."""
+        total_start = time.perf_counter()
+        logging.info(
+            f"Applying processor chain {' -> '.join(str(p) for p in processor_chain)}."
+        )
+        tasks = {}
+        producing_tasks = {}
+
+        async def apply(proc, dependencies):
+            await asyncio.gather(*dependencies)
+            return await self._aapply_processor(proc, given, total_start)
+
+        # The chain is ordered, so the producers of a processor's sources
+        # already have their tasks.
         for proc in processor_chain:
-            logging.info(f"Applying processor {proc}.")
-            start = time.perf_counter()
-            given[proc.target] = proc(
-                {key: val for key, val in given.items() if key in proc.sources}
-            )
-            results[proc.target] = SingleProcessorResult(
-                result=given[proc.target],
-                processor_name=proc.name,
-                wallclock_seconds=time.perf_counter() - start,
-            )
-        return ProcessingResult(
-            results=results, wallclock_seconds=time.perf_counter() - total_start
+            dependencies = [
+                producing_tasks[s] for s in proc.sources if s in producing_tasks
+            ]
+            tasks[proc] = asyncio.ensure_future(apply(proc, dependencies))
+            producing_tasks[proc.target] = tasks[proc]
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+        return ProcessingResult.construct(
+            results={proc.target: tasks[proc].result() for proc in processor_chain},
+            wallclock_seconds=time.perf_counter() - total_start,
         )
@@ -1,26 +1,94 @@
 from abc import ABC
-from typing import Any, Optional, Iterable
-
-from OSMPythonTools.overpass import OverpassResult
-
-from nlmaps_tools.answer_mrl import OVERPASS
-from nlmaps_tools.answer_overpass import (
-    MultiAnswer,
-    extract_answer_from_overpass_results,
-)
-from nlmaps_tools.features_to_overpass import (
-    make_overpass_queries_from_features,
-    OSMArea,
-    OverpassQuery,
-    Will2021FeaturesAfterNwrNameLookup,
-)
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import threading
+from typing import Any, Callable, Hashable, Optional, Iterable, TYPE_CHECKING
+
 from nlmaps_tools.mrl import NLmaps
 from nlmaps_tools.parse_mrl import MrlGrammar
+from nlmaps_tools.tracing import run_in_context
 
 from .models import ProcessingError
 
+# The answering modules pull in OSMPythonTools, geopy and the HTTP clients.
+# They are only imported when a processor needing them is called, so that
+# e.g. linearizing does not pay for them.
+if TYPE_CHECKING:
+    from OSMPythonTools.overpass import OverpassResult
+
+    from nlmaps_tools.answer_overpass import MultiAnswer
+    from nlmaps_tools.features_to_overpass import (
+        OSMArea,
+        OverpassQuery,
+        Will2021FeaturesAfterNwrNameLookup,
+    )
+
+
+def map_unique(
+    func: Callable[[Hashable], Any],
+    values: Iterable[Hashable],
+    copy_repeated: bool = False,
+) -> list[Any]:
+    """Apply func once per distinct value in values.
+
+    Exceptions raised by func are returned in place of its result, so that
+    one bad value does not fail the others.
+
+    :param copy_repeated: Whether to return deep copies of the result for
+        repeated values instead of sharing it.
+    """
+    cache = {}
+    results = []
+    for value in values:
+        if value in cache:
+            result = cache[value]
+            if copy_repeated and not isinstance(result, Exception):
+                result = copy.deepcopy(result)
+        else:
+            try:
+                result = func(value)
+            except Exception as e:
+                result = e
+            cache[value] = result
+        results.append(result)
+    return results
+
+
+# Threads for running the Overpass queries of one request concurrently. They
+# are shared by all requests, so that concurrent requests cannot start an
+# unbounded number of them.
+OVERPASS_QUERY_WORKERS = 8
+_overpass_query_executor = None
+_overpass_query_executor_lock = threading.Lock()
+
+
+def get_overpass_query_executor() -> ThreadPoolExecutor:
+    global _overpass_query_executor
+    with _overpass_query_executor_lock:
+        if _overpass_query_executor is None:
+            _overpass_query_executor = ThreadPoolExecutor(
+                max_workers=OVERPASS_QUERY_WORKERS, thread_name_prefix="overpass-query"
+            )
+        return _overpass_query_executor
+
 
 class BuiltinProcessor(ABC):
+    # Expected seconds per call for planning, until the ProcessingTool has
+    # measured it. None means cheap.
+    cost: Optional[float] = None
+    # Whether the result depends on the sources only, so that the
+    # ProcessingTool may reuse it for equal sources. Memoising costs hashing
+    # the sources and copying the result, so it only pays off for processors
+    # doing more than that, such as parsing.
+    pure: bool = False
+    # Whether the processor mostly waits for external services, so that the
+    # ProcessingTool runs it in its I/O threads.
+    io_bound: bool = False
+    # Whether the processor holds the GIL while it runs, so that the
+    # ProcessingTool may run it in a worker process. It must be picklable.
+    cpu_bound: bool = False
+
     def __init__(
         self, sources: Iterable[str], target: str, name: Optional[str] = None
     ) -> None:
@@ -33,6 +101,10 @@ class BuiltinProcessor(ABC):
             sources_str = "/".join(self.sources)
             self.name = f"{self.__class__.__name__}-{sources_str}-{target}"
 
+    def warm_up(self) -> None:
+        """Build expensive state ahead of the first call, e.g. when a worker
+        process starts."""
+
     def __eq__(self, other: Any) -> str:
         return (
             type(self) == type(other)
@@ -58,58 +130,122 @@ class BuiltinProcessor(ABC):
 
 
 class Functionalizer(BuiltinProcessor):
+    pure = True
+    cpu_bound = True
+
     def __init__(self, source: str, target: str) -> None:
         self.mrl_world = NLmaps()
         self.source = source
         super().__init__(sources=[source], target=target)
 
-    def __call__(self, given: dict[str, Any]) -> str:
+    def __call__(self, given: Mapping[str, Any]) -> str:
         linear_mrl = given[self.source]
         try:
             return self.mrl_world.functionalise(linear_mrl)
         except Exception as e:
             raise ProcessingError(f"Could not linearize {linear_mrl!r}") from e
 
+    def batch_call(self, given_list: list[Mapping[str, Any]]) -> list[Any]:
+        return map_unique(
+            lambda linear_mrl: self({self.source: linear_mrl}),
+            (given[self.source] for given in given_list),
+        )
+
 
 class Linearizer(BuiltinProcessor):
+    pure = True
+    cpu_bound = True
+
     def __init__(self, source: str, target: str) -> None:
         self.mrl_world = NLmaps()
         self.source = source
         super().__init__(sources=[source], target=target)
 
-    def __call__(self, given: dict[str, Any]) -> str:
+    def __call__(self, given: Mapping[str, Any]) -> str:
         functional_mrl = given[self.source]
         try:
             return self.mrl_world.preprocess_mrl(functional_mrl)
         except Exception as e:
             raise ProcessingError(f"Could not functionalize {functional_mrl!r}") from e
 
+    def batch_call(self, given_list: list[Mapping[str, Any]]) -> list[Any]:
+        return map_unique(
+            lambda functional_mrl: self({self.source: functional_mrl}),
+            (given[self.source] for given in given_list),
+        )
+
 
 class Will2021FeatureExtractor(BuiltinProcessor):
+    pure = True
+    cpu_bound = True
+
     def __init__(self):
         self.source = "Will2021MRL"
-        self.grammar = MrlGrammar()
+        self._grammar = None
+        # MrlGrammar keeps the features of the current parse in an attribute,
+        # so parses must not overlap.
+        self._lock = threading.RLock()
         target = "Will2021Features"
         super().__init__(sources=[self.source], target=target)
 
-    def __call__(self, given: dict[str, Any]) -> dict:
-        will2021 = given[self.source]
-        parse_result = self.grammar.parseMrl(will2021, is_escaped=False)
-        features = parse_result["features"]
-        return features
+    @property
+    def grammar(self) -> MrlGrammar:
+        # Building the grammar takes a while, so it is only done on first use.
+        with self._lock:
+            if self._grammar is None:
+                self._grammar = MrlGrammar()
+            return self._grammar
+
+    def warm_up(self) -> None:
+        self.grammar
+
+    def __getstate__(self) -> dict:
+        # Worker processes build their own grammar.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["_grammar"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def _parse(self, will2021: str) -> dict:
+        with self._lock:
+            return self.grammar.parseMrl(will2021, is_escaped=False)["features"]
+
+    def __call__(self, given: Mapping[str, Any]) -> dict:
+        return self._parse(given[self.source])
+
+    def batch_call(self, given_list: list[Mapping[str, Any]]) -> list[Any]:
+        return map_unique(
+            self._parse,
+            (given[self.source] for given in given_list),
+            copy_repeated=True,
+        )
 
 
 class OverpassQueryConstructor(BuiltinProcessor):
+    # Looks up areas and names with Nominatim.
+    cost = 1.0
+    io_bound = True
+
     def __init__(self):
         self.source = "Will2021Features"
         target = "_Will2021FeaturesAfterNwrNameLookup_OSMAreaList_OverpassQueryList"
         super().__init__(sources=[self.source], target=target)
 
     def __call__(
-        self, given: dict[str, Any]
+        self, given: Mapping[str, Any]
     ) -> tuple[
-        Will2021FeaturesAfterNwrNameLookup, list[Optional[OSMArea]], list[OverpassQuery]
+        "Will2021FeaturesAfterNwrNameLookup",
+        list[Optional["OSMArea"]],
+        list["OverpassQuery"],
     ]:
+        from nlmaps_tools.features_to_overpass import (
+            make_overpass_queries_from_features,
+        )
+
         features = given[self.source]
         return make_overpass_queries_from_features(features)
 
@@ -122,7 +258,9 @@ class Will2021PostFeaturesExtractor(BuiltinProcessor):
         target = "Will2021FeaturesAfterNwrNameLookup"
         super().__init__(sources=[self.source], target=target)
 
-    def __call__(self, given: dict[str, Any]) -> Will2021FeaturesAfterNwrNameLookup:
+    def __call__(
+        self, given: Mapping[str, Any]
+    ) -> "Will2021FeaturesAfterNwrNameLookup":
         triple = given[self.source]
         return triple[0]
 
@@ -135,7 +273,7 @@ class OSMAreasExtractor(BuiltinProcessor):
         target = "OSMAreaList"
         super().__init__(sources=[self.source], target=target)
 
-    def __call__(self, given: dict[str, Any]) -> list[Optional[OSMArea]]:
+    def __call__(self, given: Mapping[str, Any]) -> list[Optional["OSMArea"]]:
         triple = given[self.source]
         return triple[1]
 
@@ -148,21 +286,34 @@ class OverpassQueriesExtractor(BuiltinProcessor):
         target = "OverpassQueryList"
         super().__init__(sources=[self.source], target=target)
 
-    def __call__(self, given: dict[str, Any]) -> list[OverpassQuery]:
+    def __call__(self, given: Mapping[str, Any]) -> list["OverpassQuery"]:
         triple = given[self.source]
         return triple[2]
 
 
 class OverpassQueriesExecutor(BuiltinProcessor):
+    cost = 5.0
+    # ProcessingTool runs it in its io_workers threads, also when awaited.
+    io_bound = True
+
     def __init__(self):
         self.source = "OverpassQueryList"
         target = "OverpassResultList"
         super().__init__(sources=[self.source], target=target)
 
-    def __call__(self, given: dict[str, Any]) -> list[OverpassResult]:
+    def __call__(self, given: Mapping[str, Any]) -> list["OverpassResult"]:
+        from nlmaps_tools.answer_mrl import get_overpass
+
         queries = given[self.source]
-        results = [OVERPASS.query(query) for query in queries]
-        return results
+        overpass = get_overpass()
+        if len(queries) < 2:
+            return [overpass.query(query) for query in queries]
+        # The round robin sends concurrent queries to different endpoints.
+        futures = [
+            get_overpass_query_executor().submit(run_in_context(overpass.query), query)
+            for query in queries
+        ]
+        return [future.result() for future in futures]
 
 
 class OverpassAnswerExtractor(BuiltinProcessor):
@@ -175,7 +326,9 @@ class OverpassAnswerExtractor(BuiltinProcessor):
         target = "Will2021MultiAnswer"
         super().__init__(sources=sources, target=target)
 
-    def __call__(self, given: dict[str, Any]) -> MultiAnswer:
+    def __call__(self, given: Mapping[str, Any]) -> "MultiAnswer":
+        from nlmaps_tools.answer_overpass import extract_answer_from_overpass_results
+
         features = given["Will2021FeaturesAfterNwrNameLookup"]
         areas = given["OSMAreaList"]
         results = given["OverpassResultList"]
@@ -0,0 +1,202 @@
+"""Opt-in CPU and allocation profiling of processors.
+
+A ProcessingTool created with profile=True measures every processor call:
+the CPU time of the thread running it, which tells CPU-bound processors
+such as parsing apart from ones waiting for Overpass, and the peak of the
+memory allocated meanwhile, traced with tracemalloc. With profile_dir, it
+also dumps a cProfile file per call there. The measurements are kept in the
+SingleProcessorResults and summed up per processor across requests:
+
+    tool = ProcessingTool(PROCESSORS, profile=True)
+    ...
+    print(tool.profiler.format_report())
+
+tracemalloc and its allocation peak are process wide: a processor resetting
+the peak while another one runs would drop the other one's peak, and the
+peaks would mix the allocations of both. So profiled processor calls tracing
+allocations hold a lock and run one at a time, even with max_workers > 1.
+The time waiting for the lock is not counted as the processor's. io_bound
+processors, which mostly wait for Nominatim or Overpass, are not traced and
+not serialised, and neither are processors awaited on the event loop or run
+in worker processes. Their peaks are None. As the serialisation changes the
+timings, profiled runs do not update the costs the ProcessingTool plans
+with. Serialising and tracing allocations make processing noticeably
+slower, so profiling is meant for finding what to optimise, not for
+production.
+"""
+import cProfile
+import itertools
+import os
+import re
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Optional
+
+from nlmaps_tools.metrics import REGISTRY
+
+PROCESSOR_CPU_SECONDS = REGISTRY.histogram(
+    "nlmaps_processor_cpu_seconds",
+    "CPU time of the thread running a processor, if profiling.",
+    ["processor"],
+)
+
+
+class ProcessorProfiler:
+    def __init__(self, profile_dir: Optional[str] = None) -> None:
+        """
+        :param profile_dir: Directory to write a cProfile file per processor
+            call to. Default: none are written.
+        """
+        self.profile_dir = profile_dir
+        if profile_dir is not None:
+            os.makedirs(profile_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # Held by calls, so that only one is traced at a time.
+        self._call_lock = threading.Lock()
+        self._dump_numbers = itertools.count()
+        # processor name -> summed up measurements
+        self._totals = {}
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+
+    def call(
+        self, name: str, func: Callable, *args: Any, trace_allocations: bool = True
+    ) -> tuple[Any, float, Optional[int], float]:
+        """Call func(*args) in the current thread on behalf of the processor
+        called name. Calls tracing allocations run one at a time.
+
+        :param trace_allocations: Whether to measure the peak allocations,
+            which waits for other calls doing so. Pass False for processors
+            that mostly wait for external services.
+        :return: The result of func, the CPU seconds of the current thread
+            spent in the call, the peak bytes allocated during the call, or
+            None if not traced, and the seconds spent waiting for other
+            calls, which are not part of the call.
+        """
+        if not trace_allocations:
+            result, cpu_seconds = self._call(name, func, *args)
+            return result, cpu_seconds, None, 0.0
+        wait_start = time.perf_counter()
+        with self._call_lock:
+            waited_seconds = time.perf_counter() - wait_start
+            allocated_before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            try:
+                result, cpu_seconds = self._call(name, func, *args)
+            finally:
+                _, peak = tracemalloc.get_traced_memory()
+        return result, cpu_seconds, max(peak - allocated_before, 0), waited_seconds
+
+    def _call(self, name: str, func: Callable, *args: Any) -> tuple[Any, float]:
+        profile = None
+        if self.profile_dir is not None:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Something else is being profiled, and the interpreter
+                # supports only one profiler at a time.
+                profile = None
+        cpu_start = time.thread_time()
+        try:
+            result = func(*args)
+        finally:
+            cpu_seconds = time.thread_time() - cpu_start
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self._dump_path(name))
+        return result, cpu_seconds
+
+    def _dump_path(self, name: str) -> str:
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        return os.path.join(
+            self.profile_dir, f"{safe_name}-{next(self._dump_numbers)}.prof"
+        )
+
+    def record(
+        self,
+        name: str,
+        wallclock_seconds: float,
+        cpu_seconds: Optional[float],
+        peak_alloc_bytes: Optional[int],
+        calls: int = 1,
+    ) -> None:
+        """Add calls of the processor called name to the totals. CPU seconds
+        and peaks are None for processors awaited on the event loop, whose
+        thread also runs other tasks, and peaks are None for processors run
+        in worker processes."""
+        if cpu_seconds is not None:
+            PROCESSOR_CPU_SECONDS.labels(name).observe(cpu_seconds / calls)
+        with self._lock:
+            totals = self._totals.setdefault(
+                name,
+                {
+                    "calls": 0,
+                    "measured_calls": 0,
+                    "wallclock_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "peak_alloc_bytes": 0,
+                },
+            )
+            totals["calls"] += calls
+            totals["wallclock_seconds"] += wallclock_seconds
+            if cpu_seconds is not None:
+                totals["measured_calls"] += calls
+                totals["cpu_seconds"] += cpu_seconds
+            if peak_alloc_bytes is not None:
+                totals["peak_alloc_bytes"] = max(
+                    totals["peak_alloc_bytes"], peak_alloc_bytes
+                )
+
+    def report(self, sort_by: str = "cpu_seconds") -> list[dict[str, Any]]:
+        """The totals per processor, with the largest sort_by first.
+
+        :param sort_by: "cpu_seconds", "peak_alloc_bytes",
+            "wallclock_seconds" or "calls".
+        """
+        with self._lock:
+            rows = [
+                {"processor": name, **totals} for name, totals in self._totals.items()
+            ]
+        for row in rows:
+            row["cpu_share"] = (
+                row["cpu_seconds"] / row["wallclock_seconds"]
+                if row["wallclock_seconds"]
+                else 0.0
+            )
+        return sorted(rows, key=lambda row: row[sort_by], reverse=True)
+
+    def format_report(self, top: Optional[int] = None) -> str:
+        """The processors ranked by CPU time and by peak allocations as
+        text tables."""
+        sections = []
+        for title, sort_by in [
+            ("By CPU time", "cpu_seconds"),
+            ("By peak allocations", "peak_alloc_bytes"),
+        ]:
+            lines = [
+                f"{title}:",
+                f"{'processor':60}  {'calls':>6}  {'wall s':>9}  {'cpu s':>9}"
+                f"  {'cpu %':>5}  {'peak KiB':>9}",
+            ]
+            for row in self.report(sort_by)[:top]:
+                lines.append(
+                    f"{row['processor'][:60]:60}  {row['calls']:6d}"
+                    f"  {row['wallclock_seconds']:9.4f}  {row['cpu_seconds']:9.4f}"
+                    f"  {row['cpu_share'] * 100:5.0f}"
+                    f"  {row['peak_alloc_bytes'] / 1024:9.1f}"
+                )
+            sections.append("\n".join(lines))
+        return "\n\n".join(sections)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+    def close(self) -> None:
+        """Stop tracing allocations, if this profiler started it."""
+        if self._started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracemalloc = False
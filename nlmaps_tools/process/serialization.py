@@ -0,0 +1,90 @@
+"""JSON serialisation of processing results.
+
+The results of processors are not necessarily JSON serialisable: features
+contain sets, OverpassResults and NominatimResults are objects with a
+toJSON method, and OSMAreas are plain objects. These are converted to their
+closest JSON equivalent. Other values json cannot encode raise a TypeError.
+
+Models are serialised from their field values as they are, instead of first
+copying them into dicts with .dict(), and iter_json yields the JSON in chunks
+so that large answers can be written out without building one string for
+the whole result. The chunks are leaves, and slices of long lists, encoded
+with the C encoder of the json module.
+"""
+from collections.abc import Iterator, Mapping
+import json
+from typing import Any, TextIO
+
+from pydantic import BaseModel
+
+from nlmaps_tools.features_to_overpass import OSMArea
+
+from .models import ProcessingResult
+
+# Levels of models, mappings and lists that are written item by item.
+STREAM_DEPTH = 8
+# Items of long lists that are encoded at once.
+LIST_CHUNK_ITEMS = 1000
+
+
+def json_default(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, BaseModel):
+        # The fields of the model, without copying them.
+        return value.__dict__
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, OSMArea):
+        return {**{key: value[key] for key in value}, "area_id": value.id}
+    if hasattr(value, "toJSON"):
+        return value.toJSON()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+_encode = json.JSONEncoder(default=json_default, ensure_ascii=False).encode
+_CONTAINERS = (BaseModel, dict, list, tuple)
+
+
+def iter_json(value: Any, depth: int = STREAM_DEPTH) -> Iterator[str]:
+    """Encode value as JSON in chunks. Joined, the chunks are what
+    json.dumps(value, default=json_default, ensure_ascii=False) returns."""
+    if depth > 0 and isinstance(value, (BaseModel, dict)):
+        items = value.__dict__ if isinstance(value, BaseModel) else value
+        yield "{"
+        for i, (key, item) in enumerate(items.items()):
+            # json turns int, float, bool and None keys into their JSON.
+            key = _encode(key if isinstance(key, str) else _encode(key))
+            yield (", " if i else "") + key + ": "
+            yield from iter_json(item, depth - 1)
+        yield "}"
+    elif depth > 0 and isinstance(value, (list, tuple)):
+        if len(value) > LIST_CHUNK_ITEMS:
+            yield "["
+            for start in range(0, len(value), LIST_CHUNK_ITEMS):
+                # Encode a slice as a list and drop its brackets.
+                chunk = _encode(list(value[start : start + LIST_CHUNK_ITEMS]))
+                yield (", " if start else "") + chunk[1:-1]
+            yield "]"
+        elif any(isinstance(item, _CONTAINERS) for item in value):
+            yield "["
+            for i, item in enumerate(value):
+                if i:
+                    yield ", "
+                yield from iter_json(item, depth - 1)
+            yield "]"
+        else:
+            yield _encode(value)
+    else:
+        yield _encode(value)
+
+
+def dump_result(result: ProcessingResult) -> str:
+    """Serialise result as a single line of JSON."""
+    return _encode(result)
+
+
+def write_result(result: ProcessingResult, output_file: TextIO) -> None:
+    """Write result to output_file as a single line of JSON, chunk by chunk."""
+    for chunk in iter_json(result):
+        output_file.write(chunk)
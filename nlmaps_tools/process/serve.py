@@ -0,0 +1,458 @@
+"""HTTP service for the ProcessingTool.
+
+    python3 -m nlmaps_tools.process.serve --port 8080
+
+POST /process takes a ProcessingRequest JSON object and answers with the
+ProcessingResult JSON object, GET /metrics returns the metrics in the
+Prometheus text format. Requests wait in a bounded queue for one of
+--concurrency workers. If the queue is full, the request is shed with 503 and
+a Retry-After header, so that an overloaded service answers quickly instead
+of letting the latency of every request grow. Within a request, CPU-bound
+processors such as parsing run in the processor threads of the
+ProcessingTool, or in worker processes with --cpu-processes, and processors
+waiting for Nominatim or Overpass in its I/O threads. With
+--deadline-seconds, a request that is not answered in time, counting the
+time in the queue, gets 503 if it was still waiting and 504 otherwise.
+"""
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+from pydantic import ValidationError
+
+from nlmaps_tools.deadline import Deadline, deadline_scope
+from nlmaps_tools.metrics import REGISTRY, render_prometheus
+from nlmaps_tools.process import (
+    ProcessingError,
+    ProcessingRequest,
+    ProcessingResult,
+    ProcessingTool,
+)
+from nlmaps_tools.process.processing_tool import (
+    DEFAULT_IO_WORKERS,
+    DEFAULT_MAX_WORKERS,
+    SolutionFindingError,
+)
+from nlmaps_tools.process.processors import PROCESSORS
+from nlmaps_tools.process.serialization import dump_result
+
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_CONCURRENCY = 8
+# Seconds a shed client is asked to wait before trying again.
+RETRY_AFTER_SECONDS = 1
+MAX_BODY_BYTES = 1 << 20
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+SERVE_REQUESTS = REGISTRY.counter(
+    "nlmaps_serve_requests_total", "Processing requests by HTTP status code.", ["code"]
+)
+SERVE_SHED = REGISTRY.counter(
+    "nlmaps_serve_shed_total",
+    "Processing requests rejected because the queue was full.",
+)
+SERVE_QUEUE_DEPTH = REGISTRY.gauge(
+    "nlmaps_serve_queue_depth", "Processing requests waiting for a worker."
+)
+SERVE_IN_PROGRESS = REGISTRY.gauge(
+    "nlmaps_serve_in_progress", "Processing requests being processed."
+)
+SERVE_SECONDS = REGISTRY.histogram(
+    "nlmaps_serve_request_seconds",
+    "Time from receiving a processing request to sending its result.",
+)
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class Overloaded(Exception):
+    pass
+
+
+class QueuedRequest:
+    def __init__(
+        self, request: ProcessingRequest, deadline: Optional[Deadline]
+    ) -> None:
+        self.request = request
+        self.deadline = deadline
+        self.future = asyncio.get_running_loop().create_future()
+        # Whether a worker has taken it.
+        self.started = False
+
+
+def error_body(message: str) -> bytes:
+    result = ProcessingResult(results={}, wallclock_seconds=0.0, error=message)
+    return dump_result(result).encode("utf-8")
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[tuple[str, str, dict[str, str], bytes]]:
+    """Read the method, path, lower case headers and body of an HTTP
+    request, or return None if the client closed the connection."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {"version": version}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"Requests may have at most {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, target.split("?")[0], headers, body
+
+
+def remaining_seconds(deadline: Optional[Deadline]) -> Optional[float]:
+    return deadline.remaining() if deadline is not None else None
+
+
+def keep_alive(headers: dict[str, str]) -> bool:
+    connection = headers.get("connection", "").lower()
+    if headers.get("version") == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+class ProcessingServer:
+    def __init__(
+        self,
+        processing_tool: ProcessingTool,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        deadline_seconds: Optional[float] = None,
+    ) -> None:
+        """
+        :param queue_size: Requests waiting for a worker at most. Further
+            requests are rejected with 503.
+        :param concurrency: Requests processed at the same time.
+        :param deadline_seconds: Time allowed per request, from the moment it
+            is received. Default: no deadline.
+        """
+        self.processing_tool = processing_tool
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.deadline_seconds = deadline_seconds
+        self.address = None
+        self._queue = None
+        self._workers = []
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> tuple[str, int]:
+        """Start listening and return the host and port listened on."""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self.address = self._server.sockets[0].getsockname()[:2]
+        return self.address
+
+    async def serve_forever(self) -> None:
+        await self._server.serve_forever()
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def shutdown(self) -> None:
+        """Stop a server started with serve_in_thread."""
+        asyncio.run_coroutine_threadsafe(self.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def submit(
+        self, request: ProcessingRequest, deadline: Optional[Deadline] = None
+    ) -> ProcessingResult:
+        """Queue request and wait for its result.
+
+        :raises Overloaded: If the queue is full.
+        """
+        return await self._enqueue(request, deadline).future
+
+    def _enqueue(
+        self, request: ProcessingRequest, deadline: Optional[Deadline]
+    ) -> QueuedRequest:
+        queued = QueuedRequest(request, deadline)
+        try:
+            self._queue.put_nowait(queued)
+        except asyncio.QueueFull:
+            raise Overloaded(f"{self.queue_size} requests are waiting already")
+        SERVE_QUEUE_DEPTH.labels().inc()
+        return queued
+
+    async def _work(self) -> None:
+        while True:
+            queued = await self._queue.get()
+            SERVE_QUEUE_DEPTH.labels().dec()
+            future = queued.future
+            if future.cancelled():
+                # The client is gone or the deadline has passed.
+                continue
+            queued.started = True
+            SERVE_IN_PROGRESS.labels().inc()
+            try:
+                with deadline_scope(queued.deadline):
+                    # Give up at the deadline even if a processor ignores it.
+                    # Processors running in threads finish in the background.
+                    result = await asyncio.wait_for(
+                        self.processing_tool.aprocess_request(queued.request),
+                        remaining_seconds(queued.deadline),
+                    )
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+            finally:
+                SERVE_IN_PROGRESS.labels().dec()
+
+    async def _process(self, body: bytes) -> tuple[int, bytes, dict[str, str]]:
+        deadline = Deadline(self.deadline_seconds) if self.deadline_seconds else None
+        try:
+            request = ProcessingRequest.parse_raw(body)
+        except ValidationError as e:
+            return 400, error_body(f"Invalid request: {e}"), {}
+        retry_after = {"Retry-After": str(RETRY_AFTER_SECONDS)}
+        try:
+            queued = self._enqueue(request, deadline)
+        except Overloaded as e:
+            SERVE_SHED.labels().inc()
+            return 503, error_body(str(e)), retry_after
+        try:
+            # Cancels the queued request if the deadline passes first.
+            result = await asyncio.wait_for(queued.future, remaining_seconds(deadline))
+        except (SolutionFindingError, ProcessingError) as e:
+            return 422, error_body(str(e)), {}
+        except TimeoutError as e:
+            # Also DeadlineExceeded, raised by Nominatim and Overpass clients.
+            message = str(e) or f"Deadline of {self.deadline_seconds} s exceeded"
+            if not queued.started:
+                return 503, error_body(f"{message} in the queue"), retry_after
+            return 504, error_body(message), {}
+        except Exception as e:
+            logging.exception(f"Could not process {request!r}")
+            return 500, error_body(f"{type(e).__name__}: {e}"), {}
+        # Results such as large answers take a while to serialise.
+        return 200, (await asyncio.to_thread(dump_result, result)).encode("utf-8"), {}
+
+    async def _respond(
+        self, method: str, path: str, body: bytes
+    ) -> tuple[int, bytes, str, dict[str, str]]:
+        if path == "/process":
+            if method != "POST":
+                raise HttpError(405, "Use POST")
+            start = time.perf_counter()
+            status, body, headers = await self._process(body)
+            SERVE_SECONDS.labels().observe(time.perf_counter() - start)
+            SERVE_REQUESTS.labels(status).inc()
+            return status, body, "application/json", headers
+        if path == "/metrics":
+            if method != "GET":
+                raise HttpError(405, "Use GET")
+            return (
+                200,
+                render_prometheus().encode("utf-8"),
+                "text/plain; version=0.0.4; charset=utf-8",
+                {},
+            )
+        raise HttpError(404, f"No such path: {path}")
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    status, body, content_type, extra_headers = await self._respond(
+                        method, path, body
+                    )
+                    close = not keep_alive(headers)
+                except HttpError as e:
+                    status, body, content_type = (
+                        e.status,
+                        error_body(str(e)),
+                        "application/json",
+                    )
+                    extra_headers = {}
+                    close = True
+                head = [
+                    f"HTTP/1.1 {status} {REASONS[status]}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(body)}",
+                ]
+                head.extend(f"{name}: {value}" for name, value in extra_headers.items())
+                if close:
+                    head.append("Connection: close")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def serve_in_thread(
+    processing_tool: ProcessingTool, host: str = "127.0.0.1", port: int = 0, **kwargs
+) -> ProcessingServer:
+    """Serve from an event loop in a daemon thread.
+
+    :return: The server, listening on server.address. Call its shutdown
+        method to stop it.
+    """
+    server = ProcessingServer(processing_tool, **kwargs)
+    loop = asyncio.new_event_loop()
+    server._thread = threading.Thread(
+        target=loop.run_forever, daemon=True, name="processing-server"
+    )
+    server._thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(host, port), loop).result()
+    return server
+
+
+async def serve(
+    processing_tool: ProcessingTool, host: str, port: int, **kwargs
+) -> None:
+    server = ProcessingServer(processing_tool, **kwargs)
+    host, port = await server.start(host, port)
+    logging.warning(f"Serving on http://{host}:{port}/process")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(
+    host: str,
+    port: int,
+    queue_size: int,
+    concurrency: int,
+    cpu_workers: int,
+    io_workers: int,
+    cpu_processes: int = 0,
+    deadline_seconds: Optional[float] = None,
+    verbose: bool = False,
+):
+    logging.basicConfig(level=logging.INFO if verbose else logging.WARNING)
+    processing_tool = ProcessingTool(
+        PROCESSORS,
+        max_workers=cpu_workers,
+        io_workers=io_workers,
+        cpu_processes=cpu_processes,
+    )
+    try:
+        asyncio.run(
+            serve(
+                processing_tool,
+                host,
+                port,
+                queue_size=queue_size,
+                concurrency=concurrency,
+                deadline_seconds=deadline_seconds,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        processing_tool.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=DEFAULT_QUEUE_SIZE,
+        help=(
+            "Requests waiting for a worker at most. Further requests get 503."
+            f" Default: {DEFAULT_QUEUE_SIZE}"
+        ),
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Requests processed at the same time. Default: {DEFAULT_CONCURRENCY}",
+    )
+    parser.add_argument(
+        "--cpu-workers",
+        type=int,
+        default=DEFAULT_MAX_WORKERS,
+        help=f"Threads for CPU-bound processors. Default: {DEFAULT_MAX_WORKERS}",
+    )
+    parser.add_argument(
+        "--io-workers",
+        type=int,
+        default=DEFAULT_IO_WORKERS,
+        help=(
+            "Threads for processors waiting for Nominatim or Overpass."
+            f" Default: {DEFAULT_IO_WORKERS}"
+        ),
+    )
+    parser.add_argument(
+        "--cpu-processes",
+        type=int,
+        default=0,
+        help=(
+            "Worker processes for CPU-bound processors such as parsing, which"
+            " hold the GIL. Default: 0, run them in the --cpu-workers threads"
+        ),
+    )
+    parser.add_argument(
+        "--deadline-seconds",
+        type=float,
+        default=None,
+        help="Time allowed per request. Default: no deadline",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Log more")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
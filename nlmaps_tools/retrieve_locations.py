@@ -36,7 +36,7 @@ AREA_TEMPLATE = jinja2.Template(
   rel["type"="boundary"]["name"];
   rel["admin_level"]["name"];
 );
-out tags;
+out tags bb;
 """
 )
 
@@ -50,28 +50,34 @@ POI_TEMPLATE = jinja2.Template(
   nwr["shop"]["name"];
   nwr["tourism"]["name"];
 );
-out tags;
+out tags center;
 """
 )
 
 
-def get_names(
+def get_elements(
     template=AREA_TEMPLATE, bounding_boxes=DEFAULT_BOUNDING_BOXES, url=OVERPASS_URL
 ):
-    areas = set()
     for bbox in bounding_boxes:
         query = template.render(bbox=bbox)
         resp = requests.post(url, data=query)
         if resp.status_code == 200:
             j = resp.json()
-            areas.update({element["tags"]["name"] for element in j["elements"]})
+            yield from j["elements"]
         else:
             print(
                 "Error: {resp.status_code}\n{resp.text}".format(resp=resp),
                 file=sys.stderr,
             )
 
-    return areas
+
+def get_names(
+    template=AREA_TEMPLATE, bounding_boxes=DEFAULT_BOUNDING_BOXES, url=OVERPASS_URL
+):
+    return {
+        element["tags"]["name"]
+        for element in get_elements(template, bounding_boxes, url)
+    }
 
 
 def main(action):
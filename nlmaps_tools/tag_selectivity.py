@@ -0,0 +1,88 @@
+from collections import defaultdict
+import functools
+import json
+from pathlib import Path
+
+NAME_KEYS = ("name", "int_name", "alt_name", "name:en", "official_name", "ref")
+OSM_TYPES = ("node", "way", "relation")
+
+# Estimated number of elements for tags not found in most_common_tags.json.
+# A specific name is about as selective as it gets short of an OSM ID.
+NAME_TAG_COUNT = 100
+ID_COUNT = 1
+UNKNOWN_KEY_WILDCARD_COUNT = 10_000_000
+
+
+def get_data_file(basename):
+    return Path(__file__).parent / "data" / basename
+
+
+@functools.lru_cache(maxsize=None)
+def load_tag_counts(json_file=None):
+    """Load the taginfo counts shipped in data/most_common_tags.json.
+
+    :return: A tuple of a dict mapping (key, value) to the number of elements
+        with that tag, a dict mapping a key to the summed counts of all its
+        known values, and the smallest known count.
+    """
+    json_file = json_file or get_data_file("most_common_tags.json")
+    with open(json_file) as f:
+        content = json.load(f)
+
+    tag_counts = {}
+    key_counts = defaultdict(int)
+    for entry in content["data"]:
+        tag_counts[(entry["key"], entry["value"])] = entry["count_all"]
+        key_counts[entry["key"]] += entry["count_all"]
+    min_count = min(tag_counts.values()) if tag_counts else 1
+    return tag_counts, dict(key_counts), min_count
+
+
+def estimate_tag_count(key, value):
+    """Estimate how many OSM elements carry the tag key=value.
+
+    Tags known to taginfo use their count. The list only contains the most
+    common tags, so an unknown specific tag is assumed to be at most as common
+    as the rarest known one. A wildcard value is estimated by the summed counts
+    of the key’s known values.
+    """
+    tag_counts, key_counts, min_count = load_tag_counts()
+    if key in OSM_TYPES:
+        return ID_COUNT
+    if value == "*":
+        return key_counts.get(key, UNKNOWN_KEY_WILDCARD_COUNT)
+    if (key, value) in tag_counts:
+        return tag_counts[(key, value)]
+    if key in NAME_KEYS or key.startswith("name:"):
+        return NAME_TAG_COUNT
+    return min_count
+
+
+def estimate_nwr_feature_count(feat):
+    """Estimate the size of the set one part of a canonical nwr chain yields."""
+    if feat[0] in ["or", "and"] and isinstance(feat[1], (list, tuple)):
+        # An and inside nwr searches for the parts separately, so both kinds
+        # of groups yield the union of their parts.
+        return sum(estimate_nwr_feature_count(f) for f in feat[1:])
+    elif len(feat) == 2:
+        return estimate_tag_count(feat[0], str(feat[1]))
+    raise ValueError("Unexpected feature part: {}".format(feat))
+
+
+def order_nwr_features_by_selectivity(nwr_features):
+    """Reorder a canonical nwr chain so that the rarest part comes first.
+
+    The parts of an nwr chain are intersected, so their order does not change
+    the result, only the size of the intermediate sets Overpass materialises.
+    The sort is stable, so parts with equal estimates keep their MRL order.
+
+    >>> order_nwr_features_by_selectivity((('building', '*'), ('or', ('name', 'Foo'), ('int_name', 'Foo'))))
+    (('or', ('name', 'Foo'), ('int_name', 'Foo')), ('building', '*'))
+    """
+    if len(nwr_features) < 2:
+        return nwr_features
+    counts = [estimate_nwr_feature_count(feat) for feat in nwr_features]
+    order = sorted(range(len(nwr_features)), key=counts.__getitem__)
+    if isinstance(nwr_features, tuple) and order == list(range(len(order))):
+        return nwr_features
+    return tuple(nwr_features[i] for i in order)
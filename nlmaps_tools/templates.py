@@ -0,0 +1,124 @@
+"""Precompiled Overpass and MRL templates.
+
+The templates are compiled into Python modules in compiled_templates, which
+is part of the package, so that they do not have to be parsed at runtime.
+After changing a template, compile them again with
+``python -m nlmaps_tools.templates``. tests/test_templates.py fails while
+they do not match the sources.
+"""
+import argparse
+import hashlib
+import json
+import logging
+from pathlib import Path
+import sys
+
+import jinja2
+
+TEMPLATE_DIRS = ("overpass_templates", "mrl_templates")
+COMPILED_DIR = Path(__file__).parent / "compiled_templates"
+MANIFEST_NAME = "manifest.json"
+
+
+def get_source_hashes(template_dir):
+    source_dir = Path(__file__).parent / template_dir
+    return {
+        path.name: hashlib.sha1(path.read_bytes()).hexdigest()
+        for path in sorted(source_dir.glob("*.jinja2"))
+    }
+
+
+def read_manifest(template_dir, compiled_dir=COMPILED_DIR):
+    manifest_file = Path(compiled_dir) / template_dir / MANIFEST_NAME
+    if not manifest_file.is_file():
+        return None
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def is_compiled(template_dir, compiled_dir=COMPILED_DIR):
+    """Check whether up-to-date precompiled templates exist for template_dir."""
+    manifest = read_manifest(template_dir, compiled_dir)
+    return manifest is not None and manifest.get("sources") == get_source_hashes(
+        template_dir
+    )
+
+
+def make_environment(template_dir, precompiled=True, compiled_dir=COMPILED_DIR):
+    """Make a Jinja environment for one of the package’s template directories.
+
+    If there are precompiled templates for the installed Jinja version, the
+    environment loads the generated Python modules instead of parsing the
+    template sources. Whether they match the sources is not checked here,
+    see is_compiled. Templates are never reloaded once loaded.
+    """
+    manifest = read_manifest(template_dir, compiled_dir) if precompiled else None
+    if manifest is not None and manifest.get("jinja2") == jinja2.__version__:
+        loader = jinja2.ModuleLoader(str(Path(compiled_dir) / template_dir))
+    else:
+        loader = jinja2.PackageLoader("nlmaps_tools", template_dir)
+    return jinja2.Environment(
+        loader=loader,
+        trim_blocks=True,
+        lstrip_blocks=True,
+        autoescape=False,
+        auto_reload=False,
+    )
+
+
+def compile_environment(env, template_dir, compiled_dir=COMPILED_DIR):
+    """Compile all templates of env into Python modules in compiled_dir.
+
+    env must load its templates from source and have all filters and globals
+    the templates use registered.
+    """
+    target = Path(compiled_dir) / template_dir
+    target.mkdir(parents=True, exist_ok=True)
+    for old_module in target.glob("tmpl_*.py"):
+        old_module.unlink()
+    env.compile_templates(str(target), zip=None, ignore_errors=False)
+    manifest = {
+        "jinja2": jinja2.__version__,
+        "sources": get_source_hashes(template_dir),
+    }
+    with open(target / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    logging.info(f"Compiled {template_dir} into {target}.")
+
+
+def compile_all(compiled_dir=COMPILED_DIR):
+    # Imported here because both modules build their environments with
+    # make_environment.
+    from nlmaps_tools.answer_mrl import make_overpass_environment
+    from nlmaps_tools.generate_mrl import make_mrl_environment
+
+    compile_environment(
+        make_overpass_environment(precompiled=False), "overpass_templates", compiled_dir
+    )
+    compile_environment(
+        make_mrl_environment(precompiled=False), "mrl_templates", compiled_dir
+    )
+
+
+def main(compiled_dir):
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    compile_all(compiled_dir)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Precompile the Overpass and MRL templates into Python modules"
+    )
+    parser.add_argument(
+        "--compiled-dir",
+        type=Path,
+        default=COMPILED_DIR,
+        help=f"Directory to write the compiled templates to. Default: {COMPILED_DIR}",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    main(**vars(ARGS))
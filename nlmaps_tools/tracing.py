@@ -0,0 +1,175 @@
+"""Request-scoped tracing spans, exported to a JSON lines file.
+
+Spans nest through a context variable, so they follow the code into asyncio
+tasks. Use run_in_context to carry the current span into other threads.
+Every finished span is written as one JSON object with trace_id, span_id,
+parent_id, name, start (Unix time), seconds, attributes and, if it failed,
+error.
+
+Tracing is off until enable_tracing is called or NLMAPS_TRACE_FILE is set.
+While it is off, span and traced cost a global lookup per call.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+_current_span = contextvars.ContextVar("nlmaps_current_span", default=None)
+_exporter = None
+
+
+class JsonLinesExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span_dict):
+        line = json.dumps(span_dict, default=str) + "\n"
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Span:
+    __slots__ = (
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "start",
+        "_start_counter",
+        "seconds",
+        "error",
+    )
+
+    def __init__(self, name, parent, attributes):
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self._start_counter = time.perf_counter()
+        self.seconds = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start_counter
+
+    def to_dict(self):
+        span_dict = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "seconds": self.seconds,
+            "attributes": self.attributes,
+        }
+        if self.error is not None:
+            span_dict["error"] = self.error
+        return span_dict
+
+
+class _NoSpan:
+    """Stands in for a Span while tracing is off."""
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+_NO_SPAN_CONTEXT = contextlib.nullcontext(_NO_SPAN)
+
+
+@contextlib.contextmanager
+def _span(exporter, name, attributes):
+    span = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        span.finish()
+        _current_span.reset(token)
+        exporter.export(span.to_dict())
+
+
+def span(name, **attributes):
+    """Context manager for a span that is a child of the current span.
+
+    >>> with span("render_simple_overpass_query", template="in_query") as s:
+    ...     s.set_attribute("length", 42)
+    """
+    exporter = _exporter
+    if exporter is None:
+        return _NO_SPAN_CONTEXT
+    return _span(exporter, name, attributes)
+
+
+def traced(name):
+    """Decorator wrapping every call in a span."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            exporter = _exporter
+            if exporter is None:
+                return func(*args, **kwargs)
+            with _span(exporter, name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def current_span():
+    return _current_span.get()
+
+
+def run_in_context(func):
+    """Wrap func so that it runs with the current span as parent, e.g. when
+    submitting it to a thread pool."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def enable_tracing(path):
+    """Export spans to the JSON lines file path from now on."""
+    global _exporter
+    disable_tracing()
+    _exporter = JsonLinesExporter(path)
+
+
+def disable_tracing():
+    global _exporter
+    exporter, _exporter = _exporter, None
+    if exporter is not None:
+        exporter.close()
+
+
+if os.environ.get("NLMAPS_TRACE_FILE"):
+    enable_tracing(os.environ["NLMAPS_TRACE_FILE"])
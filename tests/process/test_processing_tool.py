@@ -1,6 +1,9 @@
+import asyncio
 from collections.abc import Collection
 from typing import Any
 import logging
+import os
+import time
 
 import pytest
 
@@ -10,7 +13,12 @@ from nlmaps_tools.process import (
     ProcessingTool,
 )
 from nlmaps_tools.process.models import SingleProcessorResult
-from nlmaps_tools.process.processors import BuiltinProcessor
+from nlmaps_tools.process.processing_tool import SolutionFindingError
+from nlmaps_tools.process.processors import (
+    BuiltinProcessor,
+    Functionalizer,
+    Will2021FeatureExtractor,
+)
 
 
 class DummyProcessor(BuiltinProcessor):
@@ -136,3 +144,450 @@ def test_select_wanted_from_result(process_tool):
     )
     selected_result = process_tool.select_wanted_from_result(given_result, request)
     assert selected_result == expected_result
+
+
+def test_processor_chain_is_cached(process_tool, monkeypatch):
+    calls = []
+    plan_processor_chain = process_tool._plan_processor_chain
+    monkeypatch.setattr(
+        process_tool,
+        "_plan_processor_chain",
+        lambda request: calls.append(request) or plan_processor_chain(request),
+    )
+    # Planned with the costs learned from the first request.
+    process_tool.process_request(
+        ProcessingRequest(given={"A": "0"}, wanted={"C"}, processors=set())
+    )
+    calls.clear()
+    first = process_tool.process_request(
+        ProcessingRequest(given={"A": "1"}, wanted={"C"}, processors=set())
+    )
+    second = process_tool.process_request(
+        ProcessingRequest(given={"A": "2"}, wanted={"C"}, processors=set())
+    )
+    assert len(calls) == 1
+    assert second.results["C"].result == "B-C(A-B(2))"
+    assert 0 < first.planning_seconds <= first.wallclock_seconds
+    assert 0 < second.planning_seconds <= second.wallclock_seconds
+
+    process_tool.process_request(
+        ProcessingRequest(given={"A": "1"}, wanted={"D"}, processors=set())
+    )
+    assert len(calls) == 2
+
+
+def test_processor_chain_cache_follows_processor_changes(processors, process_tool):
+    request = ProcessingRequest(given={"0": "1"}, wanted={"B"}, processors=set())
+    assert [p.name for p in process_tool.find_processor_chain(request)] == [
+        "0-A",
+        "A-B",
+    ]
+
+    process_tool.processors.add(DummyProcessor(["0"], "B"))
+    process_tool.find_processor_chain(request)
+    assert DummyProcessor(["0"], "B") in process_tool.target_to_processors["B"]
+    process_tool.processors = {DummyProcessor(["0"], "B")}
+    assert [p.name for p in process_tool.find_processor_chain(request)] == ["0-B"]
+
+
+def _chain_names(process_tool, request):
+    return {p.name for p in process_tool.find_processor_chain(request)}
+
+
+def test_best_first_planner_minimises_cost(processors):
+    request = ProcessingRequest(given={"A": "1"}, wanted={"E"}, processors=set())
+    assert _chain_names(ProcessingTool(processors), request) == {"A-B", "B-E"}
+
+    expensive = _get_processors_by_name(processors, {"B-E"}).pop()
+    expensive.cost = 10.0
+    expected = {"A-B", "B-C", "B-D", "B/C/D-E"}
+    assert _chain_names(ProcessingTool(processors), request) == expected
+    assert (
+        _chain_names(ProcessingTool(processors, planner="exhaustive"), request)
+        == expected
+    )
+
+    process_tool = ProcessingTool(processors)
+    process_tool.learned_costs["B-E"] = 0.001
+    assert _chain_names(process_tool, request) == {"A-B", "B-E"}
+
+
+def test_best_first_planner_reports_unreachable_targets(process_tool):
+    request = ProcessingRequest(given={"A": "1"}, wanted={"F"}, processors=set())
+    with pytest.raises(SolutionFindingError):
+        process_tool.find_processor_chain(request)
+
+
+class SleepingProcessor(DummyProcessor):
+    def __call__(self, given: dict[str, Any]) -> str:
+        time.sleep(0.1)
+        return super().__call__(given)
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_independent_processors_run_in_parallel(max_workers):
+    processors = {
+        DummyProcessor(["A"], "B"),
+        SleepingProcessor(["B"], "C"),
+        SleepingProcessor(["B"], "D"),
+        DummyProcessor(["C", "D"], "E"),
+    }
+    process_tool = ProcessingTool(processors, max_workers=max_workers)
+    request = ProcessingRequest(given={"A": "1"}, wanted={"E"}, processors=set())
+    result = process_tool.process_request(request)
+    process_tool.close()
+
+    assert result.results["E"].result in (
+        "C/D-E(B-C(A-B(1)),B-D(A-B(1)))",
+        "C/D-E(B-D(A-B(1)),B-C(A-B(1)))",
+    )
+    c, d, e = (result.results[target] for target in "CDE")
+    overlapping = c.start_seconds < d.end_seconds and d.start_seconds < c.end_seconds
+    assert overlapping == (max_workers > 1)
+    assert e.start_seconds >= max(c.end_seconds, d.end_seconds)
+    assert result.results["B"].end_seconds <= min(c.start_seconds, d.start_seconds)
+
+
+class FailingProcessor(DummyProcessor):
+    def __call__(self, given: dict[str, Any]) -> str:
+        if "bad" in given["A"]:
+            raise ValueError("bad input")
+        return super().__call__(given)
+
+
+class BatchProcessor(DummyProcessor):
+    def __init__(self, sources: Collection[str], target: str) -> None:
+        super().__init__(sources, target)
+        self.batches = []
+
+    def batch_call(self, given_list: list[dict[str, Any]]) -> list[Any]:
+        self.batches.append(len(given_list))
+        return [self(given) for given in given_list]
+
+
+def test_process_requests():
+    batch_processor = BatchProcessor(["B"], "C")
+    process_tool = ProcessingTool({FailingProcessor(["A"], "B"), batch_processor})
+    requests = [
+        ProcessingRequest(given={"A": "1"}, wanted={"C"}, processors=set()),
+        ProcessingRequest(given={"A": "bad"}, wanted={"C"}, processors=set()),
+        ProcessingRequest(given={"X": "1"}, wanted={"C"}, processors=set()),
+        ProcessingRequest(given={"A": "2"}, wanted={"C"}, processors=set()),
+        ProcessingRequest(given={"A": "3"}, wanted={"B"}, processors=set()),
+    ]
+    results = process_tool.process_requests(requests)
+
+    assert [r.results["C"].result for r in (results[0], results[3])] == [
+        "B-C(A-B(1))",
+        "B-C(A-B(2))",
+    ]
+    assert batch_processor.batches == [2]
+    assert results[1].error == "A-B: ValueError: bad input"
+    assert results[1].results == {}
+    assert results[2].error is not None
+    assert results[4].error is None
+    assert list(results[4].results) == ["B"]
+
+
+class AsyncSleepingProcessor(DummyProcessor):
+    async def __call__(self, given: dict[str, Any]) -> str:
+        await asyncio.sleep(0.1)
+        return DummyProcessor.__call__(self, given)
+
+
+def test_aprocess_request_overlaps_requests():
+    processors = {
+        DummyProcessor(["A"], "B"),
+        AsyncSleepingProcessor(["B"], "C"),
+        SleepingProcessor(["B"], "D"),
+        DummyProcessor(["C", "D"], "E"),
+    }
+    process_tool = ProcessingTool(processors)
+
+    async def process_all():
+        return await asyncio.gather(
+            *(
+                process_tool.aprocess_request(
+                    ProcessingRequest(
+                        given={"A": str(i)}, wanted={"E"}, processors=set()
+                    )
+                )
+                for i in range(3)
+            )
+        )
+
+    start = time.perf_counter()
+    results = asyncio.run(process_all())
+    # Sequentially, this would take at least 3 * 0.2 seconds.
+    assert time.perf_counter() - start < 0.35
+    process_tool.close()
+
+    for i, result in enumerate(results):
+        assert result.results["C"].result == f"B-C(A-B({i}))"
+        assert result.results["D"].result == f"B-D(A-B({i}))"
+        c, d = result.results["C"], result.results["D"]
+        assert c.start_seconds < d.end_seconds and d.start_seconds < c.end_seconds
+
+
+def test_process_request_runs_async_processors():
+    process_tool = ProcessingTool(
+        {DummyProcessor(["A"], "B"), AsyncSleepingProcessor(["B"], "C")}
+    )
+    request = ProcessingRequest(given={"A": "1"}, wanted={"C"}, processors=set())
+    assert process_tool.process_request(request).results["C"].result == "B-C(A-B(1))"
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_process_request_runs_async_processors_in_running_loop(max_workers):
+    process_tool = ProcessingTool(
+        {DummyProcessor(["A"], "B"), AsyncSleepingProcessor(["B"], "C")},
+        max_workers=max_workers,
+    )
+
+    def request():
+        return ProcessingRequest(given={"A": "1"}, wanted={"C"}, processors=set())
+
+    async def main():
+        # Blocking calls from async code, e.g. in a notebook.
+        result = process_tool.process_request(request())
+        lazy_result = process_tool.process_request_lazy(request())
+        return result.results["C"].result, lazy_result.value("C")
+
+    assert asyncio.run(main()) == ("B-C(A-B(1))", "B-C(A-B(1))")
+    process_tool.close()
+
+
+class PureProcessor(DummyProcessor):
+    pure = True
+
+    def __init__(self, sources: Collection[str], target: str) -> None:
+        super().__init__(sources, target)
+        self.calls = 0
+
+    def __call__(self, given: dict[str, Any]) -> dict:
+        self.calls += 1
+        return {"value": super().__call__(given)}
+
+
+def test_pure_processors_are_memoised():
+    pure = PureProcessor(["A"], "B")
+    process_tool = ProcessingTool({pure, DummyProcessor(["A"], "C")}, max_workers=1)
+
+    def process(value, wanted="B"):
+        request = ProcessingRequest(
+            given={"A": value}, wanted={wanted}, processors=set()
+        )
+        return process_tool.process_request(request).results
+
+    first = process("1")["B"]
+    first.result["value"] = "modified"
+    second = process("1")["B"]
+    assert pure.calls == 1
+    assert (first.cache_hit, second.cache_hit) == (False, True)
+    assert second.result == {"value": "A-B(1)"}
+
+    process("2")
+    assert pure.calls == 2
+    assert not process("1", wanted="C")["C"].cache_hit
+
+    batch_results = process_tool.process_requests(
+        [
+            ProcessingRequest(given={"A": value}, wanted={"B"}, processors=set())
+            for value in ("1", "3")
+        ]
+    )
+    assert [r.results["B"].cache_hit for r in batch_results] == [True, False]
+    assert pure.calls == 3
+    assert process_tool.memo.hits == 2
+    assert len(process_tool.memo) == 3
+    assert process_tool.memo.bytes > 0
+
+
+def test_memo_is_bounded():
+    pure = PureProcessor(["A"], "B")
+    process_tool = ProcessingTool({pure}, memo_size=2)
+    for value in ("1", "2", "3", "1"):
+        process_tool.process_request(
+            ProcessingRequest(given={"A": value}, wanted={"B"}, processors=set())
+        )
+    assert pure.calls == 4
+    assert len(process_tool.memo) == 2
+
+    process_tool = ProcessingTool({pure}, memo_size=0)
+    assert process_tool.memo is None
+
+
+class RecordingProcessor(DummyProcessor):
+    calls = []
+
+    def __call__(self, given: dict[str, Any]) -> str:
+        self.calls.append(self.name)
+        with pytest.raises(TypeError):
+            given["X"] = "read-only"
+        assert set(given) == set(self.sources)
+        return super().__call__(given)
+
+
+def test_process_request_lazy():
+    RecordingProcessor.calls = []
+    process_tool = ProcessingTool(
+        {
+            RecordingProcessor(["A"], "B"),
+            RecordingProcessor(["B"], "C"),
+            RecordingProcessor(["B"], "D"),
+            RecordingProcessor(["C", "D"], "E"),
+        }
+    )
+    request = ProcessingRequest(given={"A": "1"}, wanted={"C", "E"}, processors=set())
+    result = process_tool.process_request_lazy(request)
+    assert RecordingProcessor.calls == []
+    assert set(result) == {"B", "C", "D", "E"}
+    assert "E" in result and "A" not in result
+
+    assert result.value("C") == "B-C(A-B(1))"
+    assert RecordingProcessor.calls == ["A-B", "B-C"]
+    assert result.computed == {"B", "C"}
+    assert list(result.to_processing_result().results) == ["B", "C"]
+
+    assert result["E"].result.startswith("C/D-E(")
+    assert RecordingProcessor.calls == ["A-B", "B-C", "B-D", "C/D-E"]
+    result.value("C")
+    assert len(RecordingProcessor.calls) == 4
+
+
+class AllocatingProcessor(DummyProcessor):
+    def __call__(self, given: dict[str, Any]) -> str:
+        # Burn CPU and allocate about 8 MB that is freed again.
+        values = [float(i) for i in range(250_000)]
+        del values
+        return super().__call__(given)
+
+
+def test_profiling(tmp_path):
+    process_tool = ProcessingTool(
+        {AllocatingProcessor(["A"], "B"), SleepingProcessor(["B"], "C")},
+        profile_dir=str(tmp_path),
+    )
+    for value in ("1", "2"):
+        result = process_tool.process_request(
+            ProcessingRequest(given={"A": value}, wanted={"C"}, processors=set())
+        )
+    process_tool.process_requests(
+        [ProcessingRequest(given={"A": "3"}, wanted={"C"}, processors=set())]
+    )
+    process_tool.close()
+
+    allocating, sleeping = result.results["B"], result.results["C"]
+    assert allocating.peak_alloc_bytes > 4_000_000
+    assert sleeping.cpu_seconds < 0.05 < sleeping.wallclock_seconds
+
+    by_cpu = process_tool.profiler.report()
+    assert [row["processor"] for row in by_cpu] == ["A-B", "B-C"]
+    assert [row["calls"] for row in by_cpu] == [3, 3]
+    by_memory = process_tool.profiler.report("peak_alloc_bytes")
+    assert by_memory[0]["processor"] == "A-B"
+    assert "By peak allocations" in process_tool.profiler.format_report()
+    assert len(list(tmp_path.glob("*.prof"))) == 6
+
+
+class CountingAllocatingProcessor(AllocatingProcessor):
+    running = 0
+    max_running = 0
+
+    def __call__(self, given: dict[str, Any]) -> str:
+        cls = CountingAllocatingProcessor
+        cls.running += 1
+        cls.max_running = max(cls.max_running, cls.running)
+        try:
+            return super().__call__(given)
+        finally:
+            cls.running -= 1
+
+
+def test_profiled_processors_run_one_at_a_time():
+    processors = {CountingAllocatingProcessor(["A"], target) for target in "BCDE"}
+    process_tool = ProcessingTool(processors, max_workers=4, profile=True)
+    result = process_tool.process_request(
+        ProcessingRequest(given={"A": "1"}, wanted=set("BCDE"), processors=set())
+    )
+    process_tool.close()
+
+    assert CountingAllocatingProcessor.max_running == 1
+    # Each peak is that of its own processor, not the sum of the others.
+    assert all(
+        4_000_000 < single.peak_alloc_bytes < 12_000_000
+        for single in result.results.values()
+    )
+
+
+class IoSleepingProcessor(SleepingProcessor):
+    io_bound = True
+
+
+def test_profiled_io_bound_processors_are_not_serialised():
+    processors = {IoSleepingProcessor(["A"], target) for target in "BC"}
+    process_tool = ProcessingTool(processors, max_workers=4, profile=True)
+    result = process_tool.process_request(
+        ProcessingRequest(given={"A": "1"}, wanted=set("BC"), processors=set())
+    )
+    process_tool.close()
+
+    b, c = result.results["B"], result.results["C"]
+    assert b.start_seconds < c.end_seconds and c.start_seconds < b.end_seconds
+    assert b.peak_alloc_bytes is None and c.peak_alloc_bytes is None
+    # Profiled timings are not planned with.
+    assert process_tool.learned_costs == {}
+
+
+class PidProcessor(DummyProcessor):
+    cpu_bound = True
+
+    def __call__(self, given: dict[str, Any]) -> str:
+        return f"{super().__call__(given)} in {os.getpid()}"
+
+
+def test_cpu_bound_processors_run_in_worker_processes():
+    lin = "query@3 area@1 keyval@2 name@0 Paris@s nwr@1 keyval@2 amenity@0 library@s qtype@1 latlong@0"
+    process_tool = ProcessingTool(
+        {
+            Functionalizer("Will2021Lin", "Will2021MRL"),
+            Will2021FeatureExtractor(),
+            PidProcessor(["A"], "B"),
+            DummyProcessor(["B"], "C"),
+        },
+        cpu_processes=2,
+        memo_size=0,
+    )
+    try:
+        result = process_tool.process_request(
+            ProcessingRequest(
+                given={"Will2021Lin": lin, "A": "1"},
+                wanted={"Will2021Features", "C"},
+                processors=set(),
+            )
+        )
+        assert result.results["Will2021Features"].result["area"] == "Paris"
+        assert int(result.results["B"].result.split(" in ")[1]) != os.getpid()
+        assert result.results["C"].result.startswith("B-C(A-B(1) in ")
+
+        batch_results = process_tool.process_requests(
+            [
+                ProcessingRequest(
+                    given={"Will2021Lin": value},
+                    wanted={"Will2021Features"},
+                    processors=set(),
+                )
+                for value in (lin, "not an MRL", lin.replace("Paris", "Berlin"))
+            ]
+        )
+        assert [r.error is None for r in batch_results] == [True, False, True]
+        assert batch_results[2].results["Will2021Features"].result["area"] == "Berlin"
+
+        async_result = asyncio.run(
+            process_tool.aprocess_request(
+                ProcessingRequest(given={"A": "2"}, wanted={"B"}, processors=set())
+            )
+        )
+        assert async_result.results["B"].result.startswith("A-B(2) in ")
+    finally:
+        process_tool.close()
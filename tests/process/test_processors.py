@@ -1,12 +1,16 @@
+import asyncio
 from pathlib import Path
+import threading
+import time
 
 import pytest
 from OSMPythonTools.cachingStrategy import CachingStrategy, JSON
 
+from nlmaps_tools.answer_mrl import get_overpass
 from nlmaps_tools.answer_overpass import MultiAnswer, DistAnswer, MapAnswer, ListAnswer
 from nlmaps_tools.parse_mrl import Symbol
 from nlmaps_tools.process import ProcessingTool, ProcessingRequest
-from nlmaps_tools.process.processors import PROCESSORS
+from nlmaps_tools.process.processors import PROCESSORS, OverpassQueriesExecutor
 
 # These tests should be more fine-grained, but who has the time.
 
@@ -207,3 +211,97 @@ def test_most_common_processor_chain(
     assert result.wallclock_seconds > sum(
         single_result.wallclock_seconds for single_result in result.results.values()
     )
+
+
+def test_batched_processors():
+    processing_tool = ProcessingTool(PROCESSORS)
+    lins = [
+        "query@3 area@1 keyval@2 name@0 Heidelberg@s nwr@1 keyval@2 amenity@0 cafe@s qtype@1 count@0",
+        "query@3 area@1 keyval@2 name@0 Heidelberg@s nwr@1 keyval@2 amenity@0 cafe@s qtype@1 count@0",
+        "query@3 area@1 keyval@2 name@0 Paris@s nwr@1 keyval@2 amenity@0 bar@s qtype@1 latlong@0",
+        "not@1 an@0 mrl@0",
+    ]
+
+    def make_request(lin):
+        return ProcessingRequest(
+            given={"Will2021Lin": lin}, wanted={"Will2021Features"}, processors=set()
+        )
+
+    results = processing_tool.process_requests([make_request(lin) for lin in lins])
+    expected = [
+        processing_tool.process_request(make_request(lin))
+        .results["Will2021Features"]
+        .result
+        for lin in lins[:3]
+    ]
+    assert [r.results["Will2021Features"].result for r in results[:3]] == expected
+    assert (
+        results[0].results["Will2021Features"].result
+        is not results[1].results["Will2021Features"].result
+    )
+    assert results[3].error is not None
+
+
+class SlowOverpass:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def query(self, query):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.threads.add(threading.current_thread().name)
+        time.sleep(0.1)
+        with self.lock:
+            self.running -= 1
+        return f"result of {query}"
+
+
+def test_overpass_queries_run_concurrently():
+    executor = OverpassQueriesExecutor()
+    given = {"OverpassQueryList": ["q1", "q2", "q3"]}
+    previous = get_overpass.replace(SlowOverpass())
+    try:
+        start = time.perf_counter()
+        results = executor(given)
+        seconds = time.perf_counter() - start
+    finally:
+        get_overpass.replace(previous)
+    assert results == ["result of q1", "result of q2", "result of q3"]
+    assert seconds < 0.25
+
+
+def test_awaited_overpass_queries_are_limited_by_io_workers():
+    overpass = SlowOverpass()
+    previous = get_overpass.replace(overpass)
+    processing_tool = ProcessingTool(PROCESSORS, io_workers=1)
+
+    async def process_all():
+        return await asyncio.gather(
+            *(
+                processing_tool.aprocess_request(
+                    ProcessingRequest(
+                        given={"OverpassQueryList": [f"q{i}"]},
+                        wanted={"OverpassResultList"},
+                        processors=set(),
+                    )
+                )
+                for i in range(3)
+            )
+        )
+
+    try:
+        results = asyncio.run(process_all())
+    finally:
+        get_overpass.replace(previous)
+        processing_tool.close()
+    assert [r.results["OverpassResultList"].result for r in results] == [
+        ["result of q0"],
+        ["result of q1"],
+        ["result of q2"],
+    ]
+    assert overpass.max_running == 1
+    assert all(name.startswith("io-processor") for name in overpass.threads)
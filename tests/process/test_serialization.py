@@ -0,0 +1,74 @@
+import io
+import json
+
+import pydantic
+import pytest
+
+from nlmaps_tools.answer_overpass import ListAnswer, MultiAnswer, TextAnswer
+from nlmaps_tools.features_to_overpass import OSMArea
+from nlmaps_tools.process import ProcessingRequest
+from nlmaps_tools.process.models import ProcessingResult, SingleProcessorResult
+from nlmaps_tools.process.serialization import (
+    LIST_CHUNK_ITEMS,
+    dump_result,
+    iter_json,
+    json_default,
+    write_result,
+)
+
+
+def make_result():
+    answer = MultiAnswer.construct(
+        answers=[
+            TextAnswer.construct(text="Café"),
+            ListAnswer.construct(
+                list=[f"node {i}: Bäckerei" for i in range(3 * LIST_CHUNK_ITEMS + 7)]
+            ),
+        ],
+        targets={"type": "FeatureCollection", "features": []},
+        centers=None,
+    )
+    return ProcessingResult.construct(
+        results={
+            "Answer": SingleProcessorResult.construct(
+                result=answer, processor_name="answer", wallclock_seconds=0.5
+            ),
+            "Will2021Features": SingleProcessorResult.construct(
+                result={"qtype": {"count"}, 1: True, None: 1.5},
+                processor_name="features",
+                wallclock_seconds=0.25,
+            ),
+        },
+        wallclock_seconds=0.75,
+    )
+
+
+def test_constructed_results_serialise_like_validated_ones():
+    result = make_result()
+    expected = json.dumps(result.dict(), default=json_default, ensure_ascii=False)
+
+    assert dump_result(result) == expected
+    assert "".join(iter_json(result)) == expected
+    output = io.StringIO()
+    write_result(result, output)
+    assert output.getvalue() == expected
+    # The long list is written in several chunks.
+    assert max(len(chunk) for chunk in iter_json(result)) < len(expected) / 2
+
+
+def test_areas_are_serialised_and_unknown_types_rejected():
+    area = OSMArea({"osm_type": "relation", "osm_id": 285864}, id=3600285864)
+    assert json.loads(dump_result(area)) == {
+        "osm_type": "relation",
+        "osm_id": 285864,
+        "area_id": 3600285864,
+    }
+    with pytest.raises(TypeError):
+        dump_result({"area": object()})
+
+
+def test_requests_are_still_validated():
+    with pytest.raises(pydantic.ValidationError):
+        ProcessingRequest(given={}, wanted="Answer", processors=1)
+    with pytest.raises(pydantic.ValidationError):
+        ProcessingRequest.parse_raw('{"given": []}')
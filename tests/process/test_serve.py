@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from nlmaps_tools.process import ProcessingError, ProcessingTool
+from nlmaps_tools.process.processors import BuiltinProcessor
+from nlmaps_tools.process.serve import serve_in_thread
+
+
+class SleepingProcessor(BuiltinProcessor):
+    def __init__(self, source, target, seconds, io_bound=False):
+        self.source = source
+        super().__init__(sources=[source], target=target)
+        self.seconds = seconds
+        self.io_bound = io_bound
+
+    def __call__(self, given):
+        time.sleep(self.seconds)
+        return f"{given[self.source]} in {threading.current_thread().name}"
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(processors, **kwargs):
+        server = serve_in_thread(ProcessingTool(processors), **kwargs)
+        servers.append(server)
+        return server.address
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.processing_tool.close()
+
+
+def post(address, body):
+    connection = http.client.HTTPConnection(*address, timeout=10)
+    try:
+        connection.request("POST", "/process", body=json.dumps(body))
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_process_uses_separate_io_threads(make_server):
+    address = make_server(
+        {
+            SleepingProcessor("A", "Parsed", 0.01),
+            SleepingProcessor("A", "Fetched", 0.01, io_bound=True),
+        }
+    )
+    status, _, result = post(
+        address, {"given": {"A": "a"}, "wanted": ["Parsed", "Fetched"]}
+    )
+    assert status == 200
+    assert result["error"] is None
+    assert result["results"]["Parsed"]["result"].startswith("a in processor")
+    assert result["results"]["Fetched"]["result"].startswith("a in io-processor")
+
+
+def test_errors(make_server):
+    address = make_server({SleepingProcessor("A", "B", 0)})
+    status, _, result = post(address, {"given": {"A": "a"}})
+    assert status == 400
+    assert result["error"].startswith("Invalid request")
+    status, _, result = post(address, {"given": {"A": "a"}, "wanted": ["C"]})
+    assert status == 422
+
+    connection = http.client.HTTPConnection(*address, timeout=10)
+    connection.request("GET", "/nothing")
+    assert connection.getresponse().status == 404
+    connection.close()
+
+
+class FailingProcessor(BuiltinProcessor):
+    def __call__(self, given):
+        raise ProcessingError(f"Could not functionalize {given['A']!r}")
+
+
+def test_invalid_input_is_unprocessable(make_server):
+    address = make_server({FailingProcessor(sources=["A"], target="B")})
+    status, _, result = post(address, {"given": {"A": "query("}, "wanted": ["B"]})
+    assert status == 422
+    assert "Could not functionalize" in result["error"]
+
+
+def test_deadline_bounds_response_time(make_server):
+    # The processor ignores the deadline.
+    address = make_server(
+        {SleepingProcessor("A", "B", 1.0)}, concurrency=1, deadline_seconds=0.2
+    )
+    start = time.perf_counter()
+    status, _, result = post(address, {"given": {"A": "a"}, "wanted": ["B"]})
+    assert time.perf_counter() - start < 0.8
+    assert status == 504
+    assert result["error"]
+
+
+def test_full_queue_sheds_requests(make_server):
+    address = make_server(
+        {SleepingProcessor("A", "B", 0.5)}, queue_size=1, concurrency=1
+    )
+    request = {"given": {"A": "a"}, "wanted": ["B"]}
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(post, address, request)
+        # Let the worker take the first request.
+        time.sleep(0.1)
+        others = list(executor.map(lambda _: post(address, request), range(3)))
+    responses = [first.result()] + others
+    # One request is processed, one waits in the queue and the others are shed.
+    assert sorted(status for status, _, _ in responses) == [200, 200, 503, 503]
+    for status, headers, result in responses:
+        if status == 503:
+            assert headers["Retry-After"] == "1"
+            assert result["error"]
+
+    connection = http.client.HTTPConnection(*address, timeout=10)
+    connection.request("GET", "/metrics")
+    response = connection.getresponse()
+    metrics = response.read().decode()
+    connection.close()
+    assert response.status == 200
+    assert "nlmaps_serve_shed_total" in metrics
+    assert 'nlmaps_serve_requests_total{code="503"}' in metrics
+    assert "nlmaps_serve_queue_depth 0" in metrics
@@ -0,0 +1,103 @@
+import io
+import json
+import os
+import select
+import threading
+import time
+
+import pytest
+
+from nlmaps_tools.process import ProcessingTool
+from nlmaps_tools.process.__main__ import stream
+from nlmaps_tools.process.processors import PROCESSORS, BuiltinProcessor
+
+LINS = [
+    "query@3 area@1 keyval@2 name@0 Heidelberg@s nwr@1 keyval@2 amenity@0 cafe@s qtype@1 count@0",
+    "query@3 area@1 keyval@2 name@0 Paris@s nwr@1 keyval@2 amenity@0 bar@s qtype@1 latlong@0",
+    "query@3 area@1 keyval@2 name@0 Berlin@s nwr@1 keyval@2 shop@0 bakery@s qtype@1 count@0",
+]
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_stream(workers):
+    requests = [
+        json.dumps({"given": {"Will2021Lin": lin}, "wanted": ["Will2021Features"]})
+        for lin in LINS
+    ]
+    requests.insert(1, "not json")
+    requests.insert(2, "")
+    output = io.StringIO()
+    stream(
+        ProcessingTool(PROCESSORS),
+        io.StringIO("\n".join(requests * 3) + "\n"),
+        output,
+        workers=workers,
+    )
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+
+    assert len(results) == 12
+    for i in range(3):
+        first, bad, second, third = results[4 * i : 4 * i + 4]
+        assert bad["error"].startswith("ValidationError")
+        assert first["results"]["Will2021Features"]["result"]["area"] == "Heidelberg"
+        assert second["results"]["Will2021Features"]["result"]["area"] == "Paris"
+        assert third["results"]["Will2021Features"]["result"]["area"] == "Berlin"
+        assert third["error"] is None
+
+
+def test_stream_answers_before_input_ends():
+    read_fd, write_fd = os.pipe()
+    out_read_fd, out_write_fd = os.pipe()
+    with open(read_fd) as input_file, open(out_write_fd, "w") as output_file:
+        thread = threading.Thread(
+            target=stream,
+            args=(ProcessingTool(PROCESSORS), input_file, output_file),
+            kwargs={"workers": 3},
+        )
+        thread.start()
+        with open(write_fd, "w") as client, open(out_read_fd) as answers:
+            request = {
+                "given": {"Will2021Lin": LINS[0]},
+                "wanted": ["Will2021Features"],
+            }
+            client.write(json.dumps(request) + "\n")
+            client.flush()
+            # The input stays open while waiting for the answer.
+            ready, _, _ = select.select([answers], [], [], 10)
+            assert ready
+            result = json.loads(answers.readline())
+            assert (
+                result["results"]["Will2021Features"]["result"]["area"] == "Heidelberg"
+            )
+        thread.join(10)
+        assert not thread.is_alive()
+
+
+class CountingProcessor(BuiltinProcessor):
+    def __init__(self):
+        super().__init__(sources=["A"], target="B")
+        self.calls = 0
+
+    def __call__(self, given):
+        self.calls += 1
+        time.sleep(0.2)
+        return given["A"]
+
+
+def interrupted_input(lines):
+    yield from lines
+    raise KeyboardInterrupt
+
+
+def test_interrupted_stream_stops_without_processing_read_ahead_lines():
+    processor = CountingProcessor()
+    request = json.dumps({"given": {"A": "a"}, "wanted": ["B"]}) + "\n"
+    with pytest.raises(KeyboardInterrupt):
+        stream(
+            ProcessingTool({processor}),
+            interrupted_input([request] * 8),
+            io.StringIO(),
+            workers=2,
+        )
+    assert processor.calls < 8
+    assert "stream-writer" not in [thread.name for thread in threading.enumerate()]
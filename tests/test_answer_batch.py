@@ -0,0 +1,219 @@
+import json
+import threading
+import time
+
+from OSMPythonTools.overpass import OverpassResult
+import pytest
+
+from nlmaps_tools.answer_batch import LimitedService, answer_batch, percentile
+from nlmaps_tools.answer_mrl import get_nominatim, get_overpass
+from nlmaps_tools.gazetteer import get_gazetteer
+
+MRL = "query(area(keyval('name','Heidelberg')),nwr(keyval('amenity','library')),qtype(latlong))"
+OTHER_MRL = "query(area(keyval('name','Heidelberg')),nwr(keyval('amenity','bank')),qtype(latlong))"
+
+
+class CountingService:
+    def __init__(self, fail=False):
+        self.queries = []
+        self.fail = fail
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def query(self, query, params=None):
+        with self.lock:
+            self.queries.append(query)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.01)
+        with self.lock:
+            self.running -= 1
+        if self.fail:
+            raise RuntimeError("Service unavailable")
+        return query.upper()
+
+
+class StaticOverpass(CountingService):
+    def __init__(self, fail_on=None):
+        super().__init__()
+        self.fail_on = fail_on
+        self.timeouts = []
+
+    def query(self, query, params=None, timeout=25):
+        super().query(query, params)
+        self.timeouts.append(timeout)
+        if self.fail_on is not None and self.fail_on in query:
+            raise RuntimeError("Query timed out")
+        node = {"type": "node", "id": 1, "lat": 49.4, "lon": 8.7, "tags": {}}
+        separator = {"type": "query_separator", "id": 1, "tags": {}}
+        # One node per query of a combined query.
+        elements = [node, separator] * query.count("make query_separator")
+        return OverpassResult({"elements": elements or [node]}, query, {})
+
+
+class StaticGazetteer:
+    def lookup(self, name):
+        return {
+            "osm_type": "relation",
+            "osm_id": 285864,
+            "boundingbox": ["49.35", "49.46", "8.57", "8.79"],
+        }
+
+
+@pytest.fixture
+def failing_services():
+    previous_nominatim = get_nominatim.replace(CountingService(fail=True))
+    previous_overpass = get_overpass.replace(CountingService(fail=True))
+    yield
+    get_nominatim.replace(previous_nominatim)
+    get_overpass.replace(previous_overpass)
+
+
+def test_limited_service_shares_identical_queries():
+    service = CountingService()
+    limited = LimitedService(service, max_concurrent=2, memoize=True)
+    queries = ["Heidelberg", "Paris", "Heidelberg", "Paris", "Heidelberg", "Berlin"]
+    threads = [threading.Thread(target=limited.query, args=(q,)) for q in queries]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(service.queries) == ["Berlin", "Heidelberg", "Paris"]
+    assert service.max_running <= 2
+    assert limited.query("Paris") == "PARIS"
+    assert limited.hits == 4
+
+
+def test_answer_batch_deduplicates_and_resumes(tmp_path, failing_services):
+    input_file = tmp_path / "input.jsonl"
+    output_file = tmp_path / "output.jsonl"
+    input_file.write_text(
+        "\n".join(
+            [
+                json.dumps(MRL),
+                json.dumps({"id": "b", "mrl": OTHER_MRL}),
+                json.dumps({"id": "c", "mrl": MRL}),
+                json.dumps("not an mrl"),
+            ]
+        )
+    )
+
+    stats = answer_batch(input_file, output_file)
+    assert stats["answered_lines"] == 4
+    assert stats["unique_questions"] == 3
+    # The duplicate question does not look up its area again.
+    assert stats["nominatim_queries"] + stats["nominatim_cache_hits"] == 2
+    assert stats["latency_seconds"]["p50"] <= stats["latency_seconds"]["p100"]
+
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert sorted(record["line"] for record in records) == [0, 1, 2, 3]
+    assert {record.get("id") for record in records} == {None, "b", "c"}
+    answers = {record["line"]: record["answer"] for record in records}
+    assert answers[0] == answers[2] == answers[1]
+    assert answers[0]["error"] == "Error when contacting Nominatim."
+    assert answers[3]["error"] == "No features given"
+
+    stats = answer_batch(input_file, output_file)
+    assert stats["skipped_lines"] == 4
+    assert stats["answered_lines"] == 0
+
+    stats = answer_batch(input_file, output_file, retry_errors=True)
+    assert stats["skipped_lines"] == 1
+    assert stats["answered_lines"] == 3
+    assert len(output_file.read_text().splitlines()) == 4
+
+
+def test_answer_batch_uses_the_gazetteer_and_reports_malformed_lines(tmp_path):
+    input_file = tmp_path / "input.jsonl"
+    output_file = tmp_path / "output.jsonl"
+    input_file.write_text(
+        "\n".join([json.dumps(MRL), json.dumps({"id": "b"}), "{not json"])
+    )
+    nominatim = CountingService(fail=True)
+    previous_nominatim = get_nominatim.replace(nominatim)
+    previous_overpass = get_overpass.replace(StaticOverpass())
+    previous_gazetteer = get_gazetteer.replace(StaticGazetteer())
+    try:
+        stats = answer_batch(input_file, output_file)
+    finally:
+        get_nominatim.replace(previous_nominatim)
+        get_overpass.replace(previous_overpass)
+        get_gazetteer.replace(previous_gazetteer)
+
+    assert nominatim.queries == []
+    assert stats["answered_lines"] == 3
+    assert stats["errors"] == 2
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    answers = {record["line"]: record for record in records}
+    assert answers[0]["answer"] == {"answers": [{"type": "map"}]}
+    assert answers[1]["id"] == "b"
+    assert answers[1]["answer"]["error"] == "Neither mrl nor features given"
+    assert answers[2]["answer"]["error"].startswith("Invalid JSON")
+
+
+def test_answer_batch_combines_overpass_queries(tmp_path):
+    input_file = tmp_path / "input.jsonl"
+    output_file = tmp_path / "output.jsonl"
+    amenities = ["library", "bank", "cafe", "bar", "pub"]
+    mrls = [MRL.replace("library", amenity) for amenity in amenities]
+    mrls.append(MRL.replace("Heidelberg", "Paris"))
+    mrls.append(
+        "dist(query(area(keyval('name','Heidelberg')),nwr(keyval('amenity','bank')),"
+        "qtype(latlong)),query(area(keyval('name','Heidelberg')),"
+        "nwr(keyval('amenity','library')),qtype(latlong)))"
+    )
+    input_file.write_text("\n".join(json.dumps(mrl) for mrl in mrls))
+    overpass = StaticOverpass()
+    previous_nominatim = get_nominatim.replace(CountingService(fail=True))
+    previous_overpass = get_overpass.replace(overpass)
+    previous_gazetteer = get_gazetteer.replace(StaticGazetteer())
+    try:
+        stats = answer_batch(input_file, output_file, combine_max=3)
+    finally:
+        get_nominatim.replace(previous_nominatim)
+        get_overpass.replace(previous_overpass)
+        get_gazetteer.replace(previous_gazetteer)
+
+    # Heidelberg in two queries of up to 3, Paris, and the dist in one query.
+    assert stats["overpass_queries"] == len(overpass.queries) == 4
+    assert stats["errors"] == 0
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    answers = {record["line"]: record["answer"] for record in records}
+    assert all(answers[i] == {"answers": [{"type": "map"}]} for i in range(6))
+    assert answers[6]["answers"][0]["dist"] == 0.0
+
+
+def test_answer_batch_queries_questions_alone_when_combined_query_fails(tmp_path):
+    input_file = tmp_path / "input.jsonl"
+    output_file = tmp_path / "output.jsonl"
+    amenities = ["library", "bank", "pub"]
+    mrls = [MRL.replace("library", amenity) for amenity in amenities]
+    input_file.write_text("\n".join(json.dumps(mrl) for mrl in mrls))
+    overpass = StaticOverpass(fail_on='"pub"')
+    previous_nominatim = get_nominatim.replace(CountingService(fail=True))
+    previous_overpass = get_overpass.replace(overpass)
+    previous_gazetteer = get_gazetteer.replace(StaticGazetteer())
+    try:
+        stats = answer_batch(input_file, output_file)
+    finally:
+        get_nominatim.replace(previous_nominatim)
+        get_overpass.replace(previous_overpass)
+        get_gazetteer.replace(previous_gazetteer)
+
+    # The combined query, with a timeout per question, then one per question.
+    assert len(overpass.queries) == 4
+    assert overpass.timeouts == [75, 25, 25, 25]
+    assert stats["errors"] == 1
+    records = [json.loads(line) for line in output_file.read_text().splitlines()]
+    answers = {record["line"]: record["answer"] for record in records}
+    assert answers[0] == answers[1] == {"answers": [{"type": "map"}]}
+    assert answers[2]["type"] == "error"
+
+
+def test_percentile():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert percentile(values, 50) == 5
+    assert percentile(values, 90) == 9
+    assert percentile(values, 100) == 10
+    assert percentile([3], 1) == 3
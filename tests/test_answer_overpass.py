@@ -0,0 +1,79 @@
+from OSMPythonTools.overpass import OverpassResult
+import pytest
+
+from nlmaps_tools.answer_mrl import get_overpass
+from nlmaps_tools.answer_overpass import (
+    TextAnswer,
+    answer_features_combined,
+    split_combined_overpass_result,
+)
+from nlmaps_tools.parse_mrl import Symbol
+
+SEPARATOR = {"type": "query_separator", "id": 1, "tags": {}}
+
+
+def node(id):
+    return {
+        "type": "node",
+        "id": id,
+        "lat": 49.4,
+        "lon": 8.7,
+        "tags": {"name": str(id)},
+    }
+
+
+class CombinedOverpass:
+    def __init__(self, elements):
+        self.elements = elements
+        self.queries = []
+
+    def query(self, ql, timeout=25):
+        self.queries.append(ql)
+        return OverpassResult({"elements": self.elements}, ql, {})
+
+
+@pytest.fixture
+def combined_overpass():
+    overpass = CombinedOverpass(
+        [node(1), node(2), SEPARATOR, SEPARATOR, node(3), SEPARATOR]
+    )
+    previous = get_overpass.replace(overpass)
+    yield overpass
+    get_overpass.replace(previous)
+
+
+def test_split_combined_overpass_result():
+    result = OverpassResult({"elements": [node(1), SEPARATOR, SEPARATOR]}, "", {})
+    first, second = split_combined_overpass_result(result, 2)
+    assert [elm.id() for elm in first.elements()] == [1]
+    assert second.elements() == []
+
+    with pytest.raises(ValueError):
+        split_combined_overpass_result(result, 3)
+
+
+def test_answer_features_combined(combined_overpass):
+    features = [
+        {
+            "target_nwr": (("amenity", "bank"),),
+            "query_type": "in_query",
+            "qtype": (Symbol("count"),),
+        },
+        {
+            "target_nwr": (("amenity", "library"),),
+            "query_type": "in_query",
+            "qtype": (Symbol("count"),),
+        },
+        {
+            "target_nwr": (("amenity", "cafe"),),
+            "query_type": "in_query",
+            "qtype": (("least", ("topx", Symbol("1"))),),
+        },
+    ]
+    answers = answer_features_combined(features)
+    assert len(combined_overpass.queries) == 1
+    assert [answer.answers for answer in answers] == [
+        [TextAnswer(text="2")],
+        [TextAnswer(text="0")],
+        [TextAnswer(text="Yes")],
+    ]
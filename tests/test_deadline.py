@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+from nlmaps_tools import answer_mrl
+from nlmaps_tools.answer_mrl import get_nominatim, nominatim_query
+from nlmaps_tools.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    current_deadline,
+    deadline_scope,
+)
+from nlmaps_tools.overpass_round_robin import OverpassRoundRobin
+
+from .queries import QUERIES
+
+
+class RecordingOverpass:
+    def __init__(self, endpoint, fail=False, delay=0.0):
+        self._endpoint = endpoint
+        self.fail = fail
+        self.delay = delay
+        self.calls = []
+
+    def query(self, ql, **kwargs):
+        self.calls.append((kwargs, current_deadline()))
+        time.sleep(self.delay)
+        if self.fail:
+            raise TimeoutError("too slow")
+        return ql
+
+
+def make_round_robin(*instances):
+    round_robin = OverpassRoundRobin.__new__(OverpassRoundRobin)
+    round_robin.overpass_instances = list(instances)
+    round_robin.current_instance_idx = 0
+    return round_robin
+
+
+def test_deadline_remaining():
+    deadline = Deadline(10)
+    assert 9 < deadline.remaining() <= 10
+    assert not deadline.expired()
+    assert deadline.can_afford(5)
+    assert not deadline.can_afford(11)
+    assert deadline.overpass_timeout() in (8, 9)
+    deadline.check("testing")
+
+    expired = Deadline(0)
+    assert expired.expired()
+    with pytest.raises(DeadlineExceeded):
+        expired.check("testing")
+    with pytest.raises(DeadlineExceeded):
+        expired.overpass_timeout()
+
+
+def test_deadline_scope():
+    assert current_deadline() is None
+    deadline = Deadline(10)
+    with deadline_scope(deadline):
+        assert current_deadline() is deadline
+        with deadline_scope(None):
+            assert current_deadline() is deadline
+    assert current_deadline() is None
+
+
+def test_round_robin_without_deadline_passes_no_settings():
+    overpass = RecordingOverpass("https://a/")
+    make_round_robin(overpass).query("out;")
+    assert overpass.calls == [({}, None)]
+
+
+def test_round_robin_sets_timeout_and_maxsize():
+    overpass = RecordingOverpass("https://a/")
+    deadline = Deadline(30, overpass_maxsize=1024)
+    make_round_robin(overpass).query("out;", deadline=deadline)
+    ((kwargs, ambient),) = overpass.calls
+    assert kwargs["timeout"] in (28, 29)
+    assert kwargs["settings"] == {"maxsize": 1024}
+    assert ambient is deadline
+
+
+def test_round_robin_uses_current_deadline():
+    overpass = RecordingOverpass("https://a/")
+    with deadline_scope(Deadline(30)):
+        make_round_robin(overpass).query("out;")
+    ((kwargs, _),) = overpass.calls
+    assert kwargs["timeout"] in (28, 29)
+
+
+def test_round_robin_skips_retry_without_time_left():
+    failing = RecordingOverpass("https://a/", fail=True, delay=0.2)
+    spare = RecordingOverpass("https://b/")
+    with pytest.raises(DeadlineExceeded):
+        make_round_robin(failing, spare).query("out;", deadline=Deadline(2.1))
+    assert len(failing.calls) == 1
+    assert spare.calls == []
+
+
+def test_round_robin_retries_with_time_left():
+    failing = RecordingOverpass("https://a/", fail=True)
+    spare = RecordingOverpass("https://b/")
+    result = make_round_robin(failing, spare).query("out;", deadline=Deadline(30))
+    assert result == "out;"
+    assert len(spare.calls) == 1
+
+
+def test_round_robin_fails_fast_when_expired():
+    overpass = RecordingOverpass("https://a/")
+    start = time.perf_counter()
+    with pytest.raises(DeadlineExceeded):
+        make_round_robin(overpass).query("out;", deadline=Deadline(0))
+    assert time.perf_counter() - start < 0.1
+    assert overpass.calls == []
+
+
+def test_nominatim_query_fails_fast_when_expired():
+    class UnreachableNominatim:
+        def query(self, *args, **kwargs):
+            raise AssertionError("Nominatim must not be queried")
+
+    previous = get_nominatim.replace(UnreachableNominatim())
+    try:
+        with pytest.raises(DeadlineExceeded):
+            nominatim_query("Heidelberg", deadline=Deadline(0))
+        with deadline_scope(Deadline(0)):
+            ans = answer_mrl.answer(QUERIES[0]["features"])
+        assert ans["type"] == "error"
+    finally:
+        get_nominatim.replace(previous)
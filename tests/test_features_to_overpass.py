@@ -0,0 +1,109 @@
+from copy import deepcopy
+
+from nlmaps_tools.answer_mrl import canonicalize_nwr_features, transform_features
+from nlmaps_tools.features_to_overpass import (
+    OSMArea,
+    add_area_id,
+    canonicalize_features,
+    make_overpass_queries_from_features,
+    plan_nwr_chains,
+    render_combined_overpass_query,
+    render_simple_overpass_query,
+)
+from nlmaps_tools.parse_mrl import FrozenFeatures, MrlGrammar, Symbol
+
+from .queries import QUERIES
+
+
+def test_canonicalize_features_does_not_modify_its_input():
+    for query in QUERIES:
+        features = query["features"]
+        original = deepcopy(features)
+        canonicalize_features(features)
+        assert features == original
+
+
+def test_transformations_share_unchanged_parts():
+    features = {
+        "area": "Heidelberg",
+        "center_nwr": (("name", "Yorckstraße"),),
+        "target_nwr": (("amenity", "bank"),),
+        "maxdist": Symbol("DIST_INTOWN"),
+        "query_type": "around_query",
+        "qtype": (Symbol("latlong"),),
+    }
+    canonical = canonicalize_features(features)
+    assert canonical is not features
+    assert canonical["target_nwr"] is features["target_nwr"]
+    assert canonical["qtype"] is features["qtype"]
+    assert canonical["center_nwr"] == (
+        (
+            "or",
+            ("name", "Yorckstraße"),
+            ("int_name", "Yorckstraße"),
+            ("alt_name", "Yorckstraße"),
+            ("name:en", "Yorckstraße"),
+        ),
+    )
+
+    # Nothing left to change.
+    assert transform_features(canonical, canonicalize_nwr_features) is canonical
+    assert plan_nwr_chains(canonical) is canonical
+
+    with_area_id = add_area_id(
+        canonical, OSMArea(dct={"osm_type": "relation"}, id=3600285864)
+    )
+    assert with_area_id["area_id"] == 3600285864
+    assert "area_id" not in canonical
+    assert with_area_id["center_nwr"] is canonical["center_nwr"]
+
+
+def test_dist_features_are_not_modified():
+    mrl = "dist(query(nwr(keyval('amenity','library')),qtype(latlong)),query(nwr(keyval('amenity','cafe')),qtype(latlong)))"
+    features = MrlGrammar().parseMrl(mrl)["features"]
+    original = deepcopy(features)
+    new_features, areas, queries = make_overpass_queries_from_features(features)
+    assert features == original
+    assert new_features["sub"][0]["target_nwr"] == (("amenity", "library"),)
+    assert areas == [None, None]
+    assert len(queries) == 2
+
+
+def test_frozen_features_render_the_same_query():
+    grammar = MrlGrammar()
+    for query in QUERIES:
+        if query["features"]["query_type"] == "dist" or "'and'" in repr(
+            query["features"]
+        ):
+            continue
+        frozen = grammar.parseMrl(query["mrl"], frozen=True)["features"]
+        assert isinstance(canonicalize_features(frozen), FrozenFeatures)
+        assert plan_nwr_chains(canonicalize_features(frozen)) == FrozenFeatures(
+            plan_nwr_chains(canonicalize_features(query["features"]))
+        )
+
+
+def test_combined_query_shares_the_area():
+    in_query = {
+        "area": "Heidelberg",
+        "area_id": 3600285864,
+        "target_nwr": (("amenity", "bank"),),
+        "query_type": "in_query",
+        "qtype": (Symbol("count"),),
+    }
+    around_query = {
+        "area": "Heidelberg",
+        "area_id": 3600285864,
+        "center_nwr": (("name", "Yorckstraße"),),
+        "target_nwr": (("amenity", "bank"),),
+        "maxdist": Symbol("DIST_INTOWN"),
+        "query_type": "around_query",
+        "qtype": (Symbol("latlong"),),
+    }
+    dist_query = {"query_type": "dist", "sub": [in_query, around_query]}
+    ql = render_combined_overpass_query([in_query, around_query, dist_query])
+    assert ql.count("area(3600285864) -> .a;") == 1
+    assert ql.count("make query_separator") == 4
+    for features in [in_query, around_query]:
+        single_ql = render_simple_overpass_query(features)
+        assert single_ql.replace("area(3600285864) -> .a;", "").strip() in ql
@@ -0,0 +1,107 @@
+from pathlib import Path
+
+from OSMPythonTools.cachingStrategy import JSON, CachingStrategy
+import pytest
+
+from nlmaps_tools.answer_mrl import get_nominatim, nominatim_query
+from nlmaps_tools.features_to_overpass import get_first_area, nominatim_find_area
+from nlmaps_tools.gazetteer import (
+    Gazetteer,
+    entries_from_nominatim_cache,
+    entries_from_overpass_elements,
+    get_gazetteer,
+    prefer_nominatim,
+    write_gazetteer,
+)
+
+CACHE_DIR = Path(__file__).parent / "process" / "cache"
+
+
+class UnreachableNominatim:
+    def query(self, *args, **kwargs):
+        raise AssertionError("Nominatim should not be queried")
+
+
+# Names with a cached Nominatim answer, and one without.
+NOMINATIM_NAMES = ["Heidelberg", "New York City", "Berlin"]
+
+
+def relation(osm_id, name, admin_level):
+    return {
+        "type": "relation",
+        "id": osm_id,
+        "bounds": {"minlat": 1, "minlon": 1, "maxlat": 2, "maxlon": 2},
+        "tags": {"name": name, "admin_level": admin_level},
+    }
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    path = tmp_path / "areas.gaz"
+    nominatim_entries = list(entries_from_nominatim_cache(CACHE_DIR, NOMINATIM_NAMES))
+    harvested_entries = list(
+        entries_from_overpass_elements(
+            [
+                {
+                    "type": "relation",
+                    "id": 62422,
+                    "bounds": {
+                        "minlat": 52.33,
+                        "minlon": 13.08,
+                        "maxlat": 52.67,
+                        "maxlon": 13.76,
+                    },
+                    "tags": {"name": "Berlin", "admin_level": "4"},
+                },
+                relation(1, "Berlin", "10"),
+                # Other areas with names Nominatim has answered.
+                relation(2, "Heidelberg", "2"),
+                relation(3, "New York City", "2"),
+            ]
+        )
+    )
+    write_gazetteer(path, prefer_nominatim(harvested_entries, nominatim_entries))
+    gazetteer = Gazetteer(path)
+    yield gazetteer
+    gazetteer.close()
+
+
+def test_lookup(gazetteer):
+    heidelberg = gazetteer.lookup("Heidelberg")
+    assert heidelberg == {
+        "osm_type": "relation",
+        "osm_id": 285864,
+        "boundingbox": ["49.3520029", "49.4596927", "8.5731788", "8.7940496"],
+        "importance": pytest.approx(0.7630143067958192),
+    }
+    assert gazetteer.lookup(" HEIDELBERG ") == heidelberg
+    assert gazetteer.lookup("Berlin")["osm_id"] == 62422
+    assert gazetteer.lookup("Atlantis") is None
+    # Entries that are looked up twice can be modified independently.
+    gazetteer.lookup("Heidelberg")["boundingbox"][0] = "0"
+    assert gazetteer.lookup("Heidelberg") == heidelberg
+
+
+def test_nominatim_find_area_uses_the_gazetteer(gazetteer):
+    previous_gazetteer = get_gazetteer.replace(gazetteer)
+    previous_nominatim = get_nominatim.replace(UnreachableNominatim())
+    try:
+        area = nominatim_find_area({"area": "Heidelberg"})
+    finally:
+        get_gazetteer.replace(previous_gazetteer)
+        get_nominatim.replace(previous_nominatim)
+    assert area.id == 3600285864
+    assert area["boundingbox"] == ["49.3520029", "49.4596927", "8.5731788", "8.7940496"]
+
+
+def test_gazetteer_agrees_with_nominatim_on_ambiguous_names(gazetteer, monkeypatch):
+    monkeypatch.setattr(
+        CachingStrategy, "_CachingStrategy__strategy", JSON(cacheDir=CACHE_DIR)
+    )
+    for name in NOMINATIM_NAMES[:2]:
+        nominatim_area = get_first_area(nominatim_query(name))
+        entry = gazetteer.lookup(name)
+        assert (entry["osm_type"], entry["osm_id"]) == (
+            nominatim_area["osm_type"],
+            nominatim_area["osm_id"],
+        )
@@ -0,0 +1,139 @@
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+from OSMPythonTools.cachingStrategy import CachingStrategy, JSON
+import pytest
+
+from nlmaps_tools.answer_mrl import OVERPASS_TOO_MANY_REQUESTS, overpass_error_message
+from nlmaps_tools.deadline import Deadline, DeadlineExceeded, deadline_scope
+from nlmaps_tools.http_transport import HttpStatusError, HttpTransport
+from nlmaps_tools.overpass_round_robin import OverpassRoundRobin
+
+ELEMENTS = [
+    {"type": "node", "id": i, "lat": 49.4, "lon": 8.7, "tags": {"amenity": "cafe"}}
+    for i in range(200)
+]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path.endswith("/status"):
+            self.respond(b"Connected as: 1\nRate limit: 0\n", "text/plain")
+        elif self.path == "/busy":
+            self.respond(b"Too many requests", "text/plain", status=429)
+        else:
+            self.respond(
+                json.dumps({"elements": ELEMENTS}).encode(), "application/json"
+            )
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        self.rfile.read(length)
+        if self.path.startswith("/slow/"):
+            time.sleep(3)
+        elif self.path.startswith("/busy/"):
+            self.respond(b"Too many requests", "text/plain", status=429)
+            return
+        self.respond(json.dumps({"elements": ELEMENTS}).encode(), "application/json")
+
+    def respond(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_connections_are_reused_and_gzipped(stub_url):
+    transport = HttpTransport(pool_size=2)
+    for _ in range(5):
+        assert (
+            json.loads(transport.request("GET", stub_url + "/"))["elements"] == ELEMENTS
+        )
+    (stats,) = transport.stats().values()
+    assert stats["requests"] == 5
+    assert stats["connections"] == 1
+    assert stats["reused"] == 4
+    assert stats["received_bytes"] * 5 < stats["decoded_bytes"]
+
+
+def test_concurrent_requests_share_the_pool(stub_url):
+    transport = HttpTransport(pool_size=2)
+
+    def fetch(_):
+        return transport.request("GET", stub_url + "/")
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    (stats,) = transport.stats().values()
+    assert stats["requests"] == 8
+    assert stats["connections"] <= 8
+
+
+def test_error_status(stub_url):
+    transport = HttpTransport()
+    with pytest.raises(HttpStatusError) as exc_info:
+        transport.request("GET", stub_url + "/busy")
+    assert exc_info.value.code == 429
+
+
+def test_rate_limited_overpass_query_gets_the_rate_limit_message(
+    stub_url, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(
+        CachingStrategy, "_CachingStrategy__strategy", JSON(cacheDir=tmp_path)
+    )
+    round_robin = OverpassRoundRobin(endpoints=[stub_url + "/busy/"])
+    with pytest.raises(Exception) as exc_info:
+        round_robin.query("node(1); out;")
+    assert overpass_error_message(exc_info.value) == OVERPASS_TOO_MANY_REQUESTS
+
+
+def test_overpass_queries_reuse_one_connection(stub_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        CachingStrategy, "_CachingStrategy__strategy", JSON(cacheDir=tmp_path)
+    )
+    round_robin = OverpassRoundRobin(endpoints=[stub_url + "/api/"], pool_size=2)
+    for i in range(3):
+        result = round_robin.query(f"node({i}); out;")
+        assert len(result.elements()) == len(ELEMENTS)
+    (stats,) = round_robin.transport.stats().values()
+    # A status and an interpreter request per query.
+    assert stats["requests"] == 6
+    assert stats["connections"] == 1
+
+
+def test_deadline_aborts_slow_download(stub_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        CachingStrategy, "_CachingStrategy__strategy", JSON(cacheDir=tmp_path)
+    )
+    round_robin = OverpassRoundRobin(endpoints=[stub_url + "/slow/"])
+    start = time.perf_counter()
+    with deadline_scope(Deadline(2.2)):
+        with pytest.raises(DeadlineExceeded):
+            round_robin.query("node(1); out;")
+    assert time.perf_counter() - start < 2.8
@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ("OSMPythonTools", "geopy", "jinja2", "pyparsing")
+
+
+def _imported_heavy_modules(statement: str) -> list[str]:
+    code = (
+        f"import sys; {statement}; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return output.split()
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import nlmaps_tools.parse_mrl",
+        "import nlmaps_tools.process.processors",
+        "import nlmaps_tools.features_to_overpass",
+        "import nlmaps_tools.generate_mrl",
+    ],
+)
+def test_import_does_not_load_heavy_modules(statement):
+    assert _imported_heavy_modules(statement) == []
+
+
+def test_clients_are_created_on_first_use():
+    statement = (
+        "import nlmaps_tools.answer_mrl as a; "
+        "assert a.get_overpass() is a.OVERPASS; "
+        "assert a.get_nominatim() is a.NOMINATIM"
+    )
+    assert "OSMPythonTools" in _imported_heavy_modules(statement)
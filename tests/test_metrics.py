@@ -0,0 +1,80 @@
+from urllib.request import urlopen
+
+from nlmaps_tools.metrics import (
+    REGISTRY,
+    Registry,
+    error_code,
+    render_prometheus,
+    serve_metrics,
+    timed,
+)
+from nlmaps_tools.parse_mrl import MrlGrammar
+
+from .queries import QUERIES
+
+
+def test_render_prometheus():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ["service"])
+    in_flight = registry.gauge("in_flight", "Running requests.")
+    seconds = registry.histogram("seconds", "Durations.", ["stage"], buckets=[0.1, 1])
+    requests.labels("overpass").inc()
+    requests.labels("overpass").inc()
+    requests.labels('say "hi"').inc(0.5)
+    in_flight.labels().set(3)
+    seconds.labels("parse").observe(0.05)
+    seconds.labels("parse").observe(0.5)
+    seconds.labels("parse").observe(5)
+
+    assert render_prometheus(registry) == "\n".join(
+        [
+            "# HELP requests_total Requests.",
+            "# TYPE requests_total counter",
+            'requests_total{service="overpass"} 2',
+            'requests_total{service="say \\"hi\\""} 0.5',
+            "# HELP in_flight Running requests.",
+            "# TYPE in_flight gauge",
+            "in_flight 3",
+            "# HELP seconds Durations.",
+            "# TYPE seconds histogram",
+            'seconds_bucket{stage="parse",le="0.1"} 1',
+            'seconds_bucket{stage="parse",le="1"} 2',
+            'seconds_bucket{stage="parse",le="+Inf"} 3',
+            'seconds_sum{stage="parse"} 5.55',
+            'seconds_count{stage="parse"} 3',
+            "",
+        ]
+    )
+
+
+def test_timed_records_failures_too():
+    @timed("test_stage")
+    def fail():
+        raise ValueError()
+
+    try:
+        fail()
+    except ValueError:
+        pass
+    assert 'nlmaps_stage_seconds_count{stage="test_stage"} 1' in render_prometheus()
+
+
+def test_error_code():
+    class HTTPError(Exception):
+        code = 429
+
+    assert error_code(HTTPError()) == "429"
+    assert error_code(TimeoutError()) == "TimeoutError"
+
+
+def test_serve_metrics():
+    MrlGrammar().parseMrl(QUERIES[0]["mrl"])
+    server = serve_metrics(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            body = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+    assert body == REGISTRY.render()
+    assert 'nlmaps_stage_seconds_count{stage="parse"}' in body
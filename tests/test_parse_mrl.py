@@ -1,7 +1,21 @@
+import gc
+import os
+import pickle
+import subprocess
+import sys
+import weakref
+
 import pytest
 
-from nlmaps_tools.parse_mrl import (escape_backslashes_and_single_quotes,
-                                     get_tags, make_tuples, MrlGrammar)
+from nlmaps_tools.parse_mrl import (
+    canonical_hash,
+    escape_backslashes_and_single_quotes,
+    FrozenFeatures,
+    get_tags,
+    make_tuples,
+    MrlGrammar,
+    Symbol,
+)
 
 from .queries import QUERIES
 
@@ -69,3 +83,57 @@ def test_parse_into_features():
     for query in QUERIES:
         parse_result = grammar.parseMrl(query['mrl'])
         assert parse_result['features'] == query['features']
+
+
+def test_symbol_is_interned_and_hashable():
+    assert Symbol("latlong") is Symbol("latlong")
+    assert Symbol("latlong") == Symbol("latlong")
+    assert Symbol("latlong") != "latlong"
+    assert hash(Symbol("latlong")) == hash("latlong")
+    assert {Symbol("latlong"): 1}[Symbol("latlong")] == 1
+    assert pickle.loads(pickle.dumps(Symbol("count"))) is Symbol("count")
+
+
+def test_unused_symbols_are_released():
+    symbol = Symbol("5000123")
+    ref = weakref.ref(symbol)
+    del symbol
+    gc.collect()
+    assert ref() is None
+
+
+def test_frozen_features():
+    grammar = MrlGrammar()
+    for query in QUERIES:
+        parse_result = grammar.parseMrl(query["mrl"], frozen=True)
+        features = parse_result["features"]
+        assert isinstance(features, FrozenFeatures)
+        assert FrozenFeatures(features.to_dict()) == features
+        assert features == FrozenFeatures(query["features"])
+        assert hash(features) == hash(FrozenFeatures(query["features"]))
+        assert features.canonical_hash() == canonical_hash(query["features"])
+        assert pickle.loads(pickle.dumps(features)) == features
+        with pytest.raises(AttributeError):
+            features.area = "Paris"
+        with pytest.raises(TypeError):
+            features["area"] = "Paris"
+
+
+def test_canonical_hash_is_stable_across_processes():
+    code = (
+        "from nlmaps_tools.parse_mrl import MrlGrammar;"
+        "from tests.queries import QUERIES;"
+        "print(MrlGrammar().parseMrl(QUERIES[0]['mrl'], frozen=True)"
+        "['features'].canonical_hash())"
+    )
+    hashes = {
+        subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            capture_output=True,
+            text=True,
+            env={**os.environ, "PYTHONHASHSEED": seed},
+        ).stdout
+        for seed in ["1", "2"]
+    }
+    assert hashes == {canonical_hash(QUERIES[0]["features"]) + "\n"}
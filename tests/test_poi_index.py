@@ -0,0 +1,69 @@
+import pytest
+
+from nlmaps_tools.answer_mrl import get_nominatim, nwr_nominatim_lookup
+from nlmaps_tools.poi_index import PoiIndex, get_poi_index, pois_from_overpass_elements
+
+# minlon, minlat, maxlon, maxlat
+MANHATTAN = ("-74.03", "40.70", "-73.90", "40.88")
+HEIDELBERG = ("8.57", "49.35", "8.79", "49.46")
+
+ELEMENTS = [
+    {
+        "type": "way",
+        "id": 393449121,
+        "center": {"lat": 40.7735199, "lon": -73.9683338},
+        "tags": {"name": "Pilgrim Hill", "landuse": "grass"},
+    },
+    {
+        "type": "node",
+        "id": 1,
+        "lat": 49.41,
+        "lon": 8.69,
+        "tags": {"name": "Pilgrim Hill", "shop": "bakery"},
+    },
+    {
+        "type": "node",
+        "id": 2,
+        "lat": 49.41,
+        "lon": 8.69,
+        "tags": {"name": "Café Frisch", "amenity": "cafe"},
+    },
+    {"type": "node", "id": 3, "lat": 49.41, "lon": 8.69, "tags": {}},
+]
+
+
+class UnreachableNominatim:
+    def query(self, *args, **kwargs):
+        raise AssertionError("Nominatim should not be queried")
+
+
+@pytest.fixture
+def poi_index(tmp_path):
+    path = tmp_path / "pois.json.gz"
+    PoiIndex(pois_from_overpass_elements(ELEMENTS)).save(path)
+    return PoiIndex.load(path)
+
+
+def test_lookup(poi_index):
+    assert len(poi_index) == 3
+    assert poi_index.lookup("Pilgrim Hill", MANHATTAN) == ("way", 393449121)
+    assert poi_index.lookup("pilgrim  hill", HEIDELBERG) == ("node", 1)
+    assert poi_index.lookup("Cafe Frisch", HEIDELBERG) is None
+    assert poi_index.lookup("Café Frisch", HEIDELBERG) == ("node", 2)
+    assert poi_index.lookup("Pilgrim Hills", MANHATTAN) == ("way", 393449121)
+    assert poi_index.lookup("Café Frisch", MANHATTAN) is None
+
+
+def test_nwr_nominatim_lookup_uses_the_poi_index(poi_index):
+    previous_poi_index = get_poi_index.replace(poi_index)
+    previous_nominatim = get_nominatim.replace(UnreachableNominatim())
+    try:
+        new_nwr_features, n_result = nwr_nominatim_lookup(
+            (("or", ("name", "Pilgrim Hill"), ("int_name", "Pilgrim Hill")),),
+            bbox=MANHATTAN,
+        )
+    finally:
+        get_poi_index.replace(previous_poi_index)
+        get_nominatim.replace(previous_nominatim)
+    assert new_nwr_features == [("way", 393449121)]
+    assert n_result is None
@@ -0,0 +1,43 @@
+from nlmaps_tools.features_to_overpass import (
+    canonicalize_features,
+    plan_nwr_chains,
+    render_simple_overpass_query,
+)
+from nlmaps_tools.parse_mrl import MrlGrammar
+from nlmaps_tools.tag_selectivity import (
+    estimate_tag_count,
+    order_nwr_features_by_selectivity,
+)
+
+
+def test_estimate_tag_count():
+    assert estimate_tag_count("building", "*") > estimate_tag_count("building", "yes")
+    assert estimate_tag_count("amenity", "parking") > estimate_tag_count(
+        "amenity", "unknown_value_for_sure"
+    )
+    assert estimate_tag_count("name", "Foo") < estimate_tag_count("amenity", "bench")
+    assert estimate_tag_count("way", 123) == 1
+
+
+def test_order_nwr_features_by_selectivity():
+    assert order_nwr_features_by_selectivity(
+        (("amenity", "restaurant"), ("cuisine", "greek"))
+    ) == (("cuisine", "greek"), ("amenity", "restaurant"))
+
+    nwr_features = [("amenity", "restaurant")]
+    assert order_nwr_features_by_selectivity(nwr_features) is nwr_features
+
+    # Equal estimates keep their order.
+    assert order_nwr_features_by_selectivity((("foo", "bar"), ("baz", "qux"))) == (
+        ("foo", "bar"),
+        ("baz", "qux"),
+    )
+
+
+def test_planned_query_evaluates_name_first():
+    mrl = "query(area(keyval('name','Heidelberg')),nwr(keyval('building','*'),keyval('name','Foo')),qtype(latlong))"
+    features = MrlGrammar().parseMrl(mrl)["features"]
+    features = plan_nwr_chains(canonicalize_features(features))
+    ql = render_simple_overpass_query(features)
+    assert ql.index('["name"="Foo"]') < ql.index('["building"]')
+    assert 'nwr.res1["building"](area.a);' in ql
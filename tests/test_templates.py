@@ -0,0 +1,54 @@
+from nlmaps_tools.answer_mrl import make_overpass_environment
+from nlmaps_tools.features_to_overpass import canonicalize_features
+from nlmaps_tools.generate_mrl import make_mrl_environment
+from nlmaps_tools.templates import (
+    COMPILED_DIR,
+    compile_environment,
+    is_compiled,
+    make_environment,
+)
+
+from .queries import QUERIES
+
+
+def _with_compiled_loader(env, template_dir, compiled_dir):
+    compiled_env = make_environment(template_dir, compiled_dir=compiled_dir)
+    compiled_env.filters.update(env.filters)
+    compiled_env.globals.update(env.globals)
+    return compiled_env
+
+
+def test_compiled_templates_render_identically(tmp_path):
+    assert not is_compiled("overpass_templates", tmp_path)
+
+    overpass_env = make_overpass_environment(precompiled=False)
+    mrl_env = make_mrl_environment(precompiled=False)
+    compile_environment(overpass_env, "overpass_templates", tmp_path)
+    compile_environment(mrl_env, "mrl_templates", tmp_path)
+    assert is_compiled("overpass_templates", tmp_path)
+    assert is_compiled("mrl_templates", tmp_path)
+
+    compiled_overpass_env = _with_compiled_loader(
+        overpass_env, "overpass_templates", tmp_path
+    )
+    compiled_mrl_env = _with_compiled_loader(mrl_env, "mrl_templates", tmp_path)
+
+    for query in QUERIES:
+        features = query["features"]
+        template_name = features["query_type"] + ".jinja2"
+        assert compiled_mrl_env.get_template(template_name).render(
+            features=features, escape=True
+        ) == mrl_env.get_template(template_name).render(features=features, escape=True)
+
+        # The Overpass templates support neither dist nor and inside nwr.
+        if features["query_type"] != "dist" and "'and'" not in repr(features):
+            features = canonicalize_features(features)
+            assert compiled_overpass_env.get_template(template_name).render(
+                features=features
+            ) == overpass_env.get_template(template_name).render(features=features)
+
+
+def test_packaged_templates_are_up_to_date():
+    # Run python -m nlmaps_tools.templates after changing a template.
+    assert is_compiled("overpass_templates", COMPILED_DIR)
+    assert is_compiled("mrl_templates", COMPILED_DIR)
@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import pytest
+
+from nlmaps_tools import tracing
+from nlmaps_tools.features_to_overpass import canonicalize_features
+from nlmaps_tools.overpass_round_robin import OverpassRoundRobin
+from nlmaps_tools.tracing import run_in_context, span, traced
+
+from .queries import QUERIES
+
+
+class FlakyOverpass:
+    def __init__(self, endpoint, fail):
+        self._endpoint = endpoint
+        self.fail = fail
+
+    def query(self, ql):
+        if self.fail:
+            raise TimeoutError("too slow")
+        return ql
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracing.enable_tracing(path)
+    yield path
+    tracing.disable_tracing()
+
+
+def read_spans(path):
+    return {
+        span["name"]: span for span in map(json.loads, path.read_text().splitlines())
+    }
+
+
+def test_nested_spans(trace_file):
+    round_robin = OverpassRoundRobin.__new__(OverpassRoundRobin)
+    round_robin.overpass_instances = [
+        FlakyOverpass("https://a/", fail=True),
+        FlakyOverpass("https://b/", fail=False),
+    ]
+    round_robin.current_instance_idx = 0
+
+    with span("question", number=1):
+        canonicalize_features(QUERIES[0]["features"])
+        round_robin.query("out;")
+
+    spans = read_spans(trace_file)
+    root = spans["question"]
+    assert root["parent_id"] is None
+    assert root["attributes"] == {"number": 1}
+    assert {s["trace_id"] for s in spans.values()} == {root["trace_id"]}
+    assert spans["canonicalize_features"]["parent_id"] == root["span_id"]
+
+    attempts = [
+        json.loads(line)
+        for line in trace_file.read_text().splitlines()
+        if json.loads(line)["name"] == "overpass_attempt"
+    ]
+    assert [a["attributes"] for a in attempts] == [
+        {"endpoint": "https://a/", "attempt": 1},
+        {"endpoint": "https://b/", "attempt": 2},
+    ]
+    assert attempts[0]["error"] == "TimeoutError: too slow"
+    assert "error" not in attempts[1]
+    assert all(a["parent_id"] == root["span_id"] for a in attempts)
+
+
+def test_context_propagates_to_threads_and_tasks(trace_file):
+    @traced("child")
+    def child():
+        pass
+
+    async def task():
+        child()
+
+    with span("root") as root:
+        with ThreadPoolExecutor() as executor:
+            executor.submit(run_in_context(child)).result()
+        asyncio.run(task())
+
+    children = [
+        json.loads(line)
+        for line in trace_file.read_text().splitlines()
+        if json.loads(line)["name"] == "child"
+    ]
+    assert len(children) == 2
+    assert all(c["parent_id"] == root.span_id for c in children)
+
+
+def test_nothing_is_recorded_when_disabled(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracing.enable_tracing(path)
+    tracing.disable_tracing()
+    spans_seen = []
+
+    @traced("noop")
+    def traced_noop():
+        spans_seen.append(tracing.current_span())
+
+    traced_noop()
+    with span("disabled") as s:
+        s.set_attribute("ignored", True)
+        spans_seen.append(tracing.current_span())
+        traced_noop()
+
+    # No spans are created, so there is nothing to time or export.
+    assert spans_seen == [None, None, None]
+    assert not isinstance(s, tracing.Span)
+    assert path.read_text() == ""